@@ -0,0 +1,83 @@
+"""
+Measures the time needed to analyze a long series of measurements, comparing the separate
+min_value / max_value / mean_value / trend calls on a DataFrame, the same statistics as summary()
+computed with pandas, and a single summary() over NumPy arrays.
+
+Usage:
+python -m benchmarks.bench_analysis --rows 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from prod_aplikacja.data_analyzer import Analyze_Data
+
+
+def generate(rows, seed=0):
+    """
+    Generates an hourly series with a daily cycle, noise and a few missing values.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = np.datetime64('2000-01-01T00:00:00') + np.arange(rows) * np.timedelta64(1, 'h')
+    hours = np.arange(rows, dtype=np.float64)
+    values = 40 + 15 * np.sin(hours * 2 * np.pi / 24) + rng.normal(0, 5, rows)
+    values[rng.random(rows) < 0.01] = np.nan
+    return timestamps, values
+
+
+def timed(func):
+    """
+    Returns the result of a call and its duration in seconds.
+    """
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run(rows):
+    """
+    Runs the benchmark and prints the durations.
+    """
+    timestamps, values = generate(rows)
+
+    def separate():
+        analyzer = Analyze_Data.__new__(Analyze_Data)
+        analyzer._data = pd.DataFrame({'timestamp': timestamps, 'value': values})
+        return (analyzer.min_value('value'), analyzer.max_value('value'),
+                analyzer.mean_value('value'), analyzer.trend('value'))
+
+    def pandas_equivalent():
+        series = pd.Series(values, index=pd.DatetimeIndex(timestamps)).dropna().sort_index()
+        hours = ((series.index - series.index[0]) / pd.Timedelta(hours=1)).to_numpy()
+        return (series.min(), series.max(), series.mean(), series.std(), series.count(),
+                series.quantile([0.05, 0.25, 0.5, 0.75, 0.95]), series.diff().mean(),
+                np.polyfit(hours, series.to_numpy(), 1)[0])
+
+    def summary():
+        return Analyze_Data.from_arrays(timestamps, values).summary()
+
+    legacy, legacy_time = timed(separate)
+    equivalent, equivalent_time = timed(pandas_equivalent)
+    result, summary_time = timed(summary)
+
+    print(f"{rows} rows")
+    print(f"{'separate calls (min/max/mean/trend)':<40}{legacy_time * 1000:>10.1f} ms")
+    print(f"{'pandas, same statistics as summary()':<40}{equivalent_time * 1000:>10.1f} ms")
+    print(f"{'summary() (all statistics)':<40}{summary_time * 1000:>10.1f} ms")
+    print(f"min {result['min']:.3f} max {result['max']:.3f} mean {result['mean']:.3f} "
+          f"std {result['std']:.3f} p95 {result['p95']:.3f} slope {result['slope']:.2e}")
+    assert np.isclose(result['mean'], legacy[2])
+    assert np.isclose(result['slope'], equivalent[7], atol=1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    args = parser.parse_args()
+    run(args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Runs many collector cycles back to back against the local stub API and reports the duration of the cycles
+and the memory allocated by Python after every block of cycles, which should stay flat.
+
+Usage:
+python -m benchmarks.bench_collector --cycles 200 --stations 20
+"""
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+from prod_aplikacja.collector import Collector
+from prod_aplikacja.database_manager import DatabaseManager
+from test_aplikacja.stub_server import StubApi
+
+
+def run(cycles, stations, sensors_per_station, report_every):
+    """
+    Runs the cycles and samples the traced memory.
+
+    Returns:
+    list: A list of dictionaries with the cycle number, the mean cycle duration in seconds and the traced memory in KiB.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory, \
+            StubApi(stations=stations, sensors_per_station=sensors_per_station) as stub, stub.patch_fetcher():
+        db_manager = DatabaseManager(os.path.join(directory, 'bench.db'), wal=True)
+        # Every sensor is requested in every cycle, as in production where new readings arrive each hour.
+        collector = Collector(db_manager, interval=0, metadata_interval=10, concurrency=8,
+                              now=lambda: datetime(2024, 1, 4))
+        tracemalloc.start()
+        durations = []
+        for cycle in range(1, cycles + 1):
+            durations.append(collector.run_cycle().duration)
+            if cycle % report_every == 0:
+                gc.collect()
+                results.append({'cycle': cycle, 'seconds': sum(durations) / len(durations),
+                                'memory_kib': tracemalloc.get_traced_memory()[0] / 1024})
+                durations = []
+        tracemalloc.stop()
+        db_manager.close_connection()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cycles', type=int, default=200)
+    parser.add_argument('--stations', type=int, default=20)
+    parser.add_argument('--sensors-per-station', type=int, default=6)
+    parser.add_argument('--report-every', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'cycle':>8}{'cycle [s]':>12}{'memory [KiB]':>16}")
+    for result in run(args.cycles, args.stations, args.sensors_per_station, args.report_every):
+        print(f"{result['cycle']:>8}{result['seconds']:>12.3f}{result['memory_kib']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
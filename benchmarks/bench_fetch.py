@@ -0,0 +1,65 @@
+"""
+Measures the throughput of the bulk fetcher against the local stub API at different concurrency levels.
+With --min-speedup the benchmark fails when the highest level is not at least that many times faster
+than the lowest one.
+
+Usage:
+python -m benchmarks.bench_fetch --stations 50 --latency 0.05 --concurrency 1 4 8 16 32 --min-speedup 4
+"""
+import argparse
+import sys
+import time
+
+from prod_aplikacja import data_fetcher
+from test_aplikacja.stub_server import StubApi
+
+
+def run(stations, sensors_per_station, latency, concurrency_levels, rate=None):
+    """
+    Runs a full network fetch through fetch_all once for every concurrency level.
+    The rate limiter is off unless a rate in requests per second is given.
+
+    Returns:
+    list: A list of dictionaries with the results of every run, with the speed-up over the first run
+          and the most requests the stub answered at the same time.
+    """
+    results = []
+    with StubApi(stations=stations, sensors_per_station=sensors_per_station, latency=latency) as stub:
+        for concurrency in concurrency_levels:
+            limiter = data_fetcher.RateLimiter(rate) if rate else None
+            stub.peak_in_flight = 0
+            with stub.patch_fetcher(rate_limiter=limiter):
+                session = data_fetcher.create_session(pool_size=concurrency)
+                start = time.perf_counter()
+                count = sum(1 for _ in data_fetcher.fetch_all(concurrency=concurrency, session=session))
+                elapsed = time.perf_counter() - start
+                session.close()
+                results.append({'concurrency': concurrency, 'requests': count, 'seconds': elapsed,
+                                'requests_per_second': count / elapsed, 'speedup': results[0]['seconds'] / elapsed
+                                if results else 1.0, 'peak_in_flight': stub.peak_in_flight})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=50)
+    parser.add_argument('--sensors-per-station', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated round trip in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--rate', type=float, default=None, help='rate limit in requests per second, off by default')
+    parser.add_argument('--min-speedup', type=float, default=None,
+                        help='fail if the last concurrency level is not this many times faster than the first')
+    args = parser.parse_args()
+
+    results = run(args.stations, args.sensors_per_station, args.latency, args.concurrency, args.rate)
+    for result in results:
+        print(f"concurrency={result['concurrency']:>3}  requests={result['requests']:>5}  "
+              f"time={result['seconds']:7.2f}s  throughput={result['requests_per_second']:8.1f} req/s  "
+              f"speedup={result['speedup']:5.1f}x  peak in flight={result['peak_in_flight']}")
+    if args.min_speedup is not None and results[-1]['speedup'] < args.min_speedup:
+        print(f"FAIL: speed-up {results[-1]['speedup']:.1f}x is below {args.min_speedup:.1f}x")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Measures the latency of the DatabaseManager read queries on a large database,
+before and after the secondary indexes of the read methods are created.
+
+Usage:
+python -m benchmarks.bench_queries --rows 2000000 --sensors 1500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from prod_aplikacja.data_analyzer import Analyze_Data, summarize_chunks
+from prod_aplikacja.database_manager import DatabaseManager, AGGREGATE_STATS
+from prod_aplikacja.rollups import to_epoch
+
+# The secondary indexes, the measurements are keyed on (sensorId, ts) by the table itself.
+INDEXES = ['idx_stations_name', 'idx_sensors_station', 'idx_air_quality_index_station',
+           'idx_air_quality_index_station_date']
+
+
+def seed(db_path, rows, sensors, sensors_per_station=6):
+    """
+    Creates a database without the secondary indexes and fills it with generated data.
+
+    Returns:
+    list: The statements creating the dropped indexes.
+    """
+    DatabaseManager(db_path).close_connection()
+    conn = sqlite3.connect(db_path)
+    statements = [row[0] for row in conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE name IN ({', '.join('?' * len(INDEXES))})", INDEXES)]
+    for index in INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+
+    stations = sensors // sensors_per_station + 1
+    conn.executemany('INSERT INTO stations VALUES (?, ?, ?, ?, ?, ?)',
+                     ((n, f'Station {n}', 50.0, 20.0, n, '') for n in range(stations)))
+    conn.executemany('INSERT INTO sensors VALUES (?, ?, ?, ?, ?, ?)',
+                     ((n, n // sensors_per_station, f'Param {n % sensors_per_station}', 'P', 'P', n % sensors_per_station)
+                      for n in range(sensors)))
+    hours = rows // sensors + 1
+    start = datetime(2020, 1, 1)
+    dates = [to_epoch(start + timedelta(hours=hour)) for hour in range(hours)]
+    conn.executemany('INSERT INTO measurements (sensorId, ts, value) VALUES (?, ?, ?)',
+                     ((n % sensors, dates[n // sensors], random.random() * 100) for n in range(rows)))
+    conn.executemany('INSERT INTO air_quality_index (stationId, stCalcDate, stIndexLevel, indexLevelName, stSourceDataDate) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     ((station, date, 1, 'Dobry', date) for date in dates for station in range(stations)))
+    conn.commit()
+    conn.close()
+    return statements
+
+
+def measure(db_manager, sensors, repeat):
+    """
+    Times every read method of the DatabaseManager and returns the mean latency in milliseconds.
+    """
+    stations = sensors // 6 + 1
+    queries = {
+        'fetch_stations': lambda: db_manager.fetch_stations(),
+        'fetch_sensors': lambda: db_manager.fetch_sensors(random.randrange(stations)),
+        'fetch_measurements': lambda: db_manager.fetch_measurements(random.randrange(sensors)),
+        'fetch_air_quality_index': lambda: db_manager.fetch_air_quality_index(random.randrange(stations)),
+        'fetch_latest_air_quality_indices': lambda: db_manager.fetch_latest_air_quality_indices(),
+        'fetch_measurements+summary': lambda: Analyze_Data.from_cursor(
+            db_manager.fetch_measurements(random.randrange(sensors))).summary(),
+        'iter_measurements+summary': lambda: summarize_chunks(
+            db_manager.iter_measurements(random.randrange(sensors))),
+        'aggregate': lambda: db_manager.aggregate(random.randrange(sensors), stats=AGGREGATE_STATS),
+    }
+    results = {}
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def run(rows, sensors, repeat):
+    """
+    Seeds a temporary database and measures the queries before and after the indexes are created.
+
+    Returns:
+    dict: The mean latency in milliseconds of every query, under the keys 'before' and 'after'.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        statements = seed(db_path, rows, sensors)
+
+        db_manager = DatabaseManager(db_path)
+        before = measure(db_manager, sensors, repeat)
+        with db_manager.bulk():
+            for statement in statements:
+                db_manager.conn.execute(statement)
+        after = measure(db_manager, sensors, repeat)
+        db_manager.close_connection()
+    return {'before': before, 'after': after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--sensors', type=int, default=1500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.sensors, args.repeat)
+    print(f"{'query':<36}{'before [ms]':>14}{'after [ms]':>14}")
+    for name in results['before']:
+        print(f"{name:<36}{results['before'][name]:>14.3f}{results['after'][name]:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
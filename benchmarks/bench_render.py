@@ -0,0 +1,104 @@
+"""
+Measures the time needed to draw a series of hourly measurements with Visualize_data,
+against the length of the series, with and without downsampling, and the time needed
+to add a new reading to the live chart of a series of that length.
+
+Usage:
+python -m benchmarks.bench_render --lengths 1000 10000 100000 1000000
+"""
+import argparse
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.live_chart import LiveChart
+
+# Longer series are not drawn point by point, it takes too long.
+MAX_FULL_LENGTH = 100000
+
+
+def render(visualizer, method):
+    """
+    Draws the series on a new figure and renders it, returning the duration in seconds.
+    """
+    start = time.perf_counter()
+    fig, ax = plt.subplots(figsize=(10, 4))
+    visualizer.draw(ax, 'value', method)
+    fig.canvas.draw()
+    duration = time.perf_counter() - start
+    plt.close(fig)
+    return duration
+
+
+def run(lengths, methods=('minmax', 'lttb', None)):
+    """
+    Renders series of the given lengths with every method.
+
+    Returns:
+    dict: The durations in milliseconds by length and method, None for skipped runs.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for length in lengths:
+        dates = pd.date_range('2000-01-01', periods=length, freq='h').strftime('%Y-%m-%d %H:%M:%S')
+        rows = pd.DataFrame({'station_id': None, 'sensor_id': 1, 'date': dates,
+                             'value': 40 + rng.normal(0, 10, length)})
+        start = time.perf_counter()
+        visualizer = Visualize_data(rows)
+        results[length] = {'parse': (time.perf_counter() - start) * 1000}
+        for method in methods:
+            if method is None and length > MAX_FULL_LENGTH:
+                results[length][method] = None
+            else:
+                results[length][method] = render(visualizer, method) * 1000
+    return results
+
+
+def run_live(lengths, appends=100):
+    """
+    Shows series of the given lengths on a live chart and adds readings one by one.
+
+    Returns:
+    dict: The time of the first drawing and the mean time of an added reading in milliseconds, by length.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for length in lengths:
+        dates = np.datetime64('2000-01-01T00:00:00') + np.arange(length + appends) * np.timedelta64(1, 'h')
+        values = 40 + rng.normal(0, 10, length + appends)
+        chart = LiveChart(size=(10, 4))
+        start = time.perf_counter()
+        chart.set_data(dates[:length], values[:length])
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for n in range(length, length + appends):
+            chart.append(dates[n:n + 1], values[n:n + 1])
+        results[length] = {'draw': first * 1000, 'append': (time.perf_counter() - start) / appends * 1000,
+                           'full_draws': chart.full_draws - 1}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    results = run(args.lengths)
+    print(f"{'points':>10}{'parse [ms]':>14}{'minmax [ms]':>14}{'lttb [ms]':>14}{'all points [ms]':>18}")
+    for length, times in results.items():
+        full = f"{times[None]:>18.1f}" if times[None] is not None else f"{'skipped':>18}"
+        print(f"{length:>10}{times['parse']:>14.1f}{times['minmax']:>14.1f}{times['lttb']:>14.1f}{full}")
+
+    print()
+    print(f"{'points':>10}{'live draw [ms]':>16}{'append [ms]':>14}{'redraws':>10}")
+    for length, times in run_live(args.lengths).items():
+        print(f"{length:>10}{times['draw']:>16.1f}{times['append']:>14.2f}{times['full_draws']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Measures the cold start of the GUI: the time to import prod_aplikacja.gui in a fresh interpreter,
+reported by python -X importtime, the modules that take longest to import, and the time to open
+a database that already has the current schema and read its station labels.
+
+Importing the GUI must not load pandas, numpy or matplotlib; they are imported when the first
+chart or analysis needs them. The benchmark fails when one of them is loaded, or when the import
+takes longer than --max-ms.
+
+Usage:
+python -m benchmarks.bench_startup --repeat 5 --max-ms 500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.name_index import NameIndex
+
+# Modules which must not be loaded by importing the GUI.
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output):
+    """
+    Parses the report written by python -X importtime to stderr.
+
+    Returns:
+    dict: A dictionary mapping every imported module to its (self, cumulative) import time in microseconds.
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if own.strip().isdigit():
+            modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+
+def import_gui():
+    """
+    Imports the GUI module in a fresh interpreter.
+
+    Returns:
+    tuple: The import times of the modules as returned by parse_importtime and the heavy modules that were loaded.
+    """
+    code = ("import sys, prod_aplikacja.gui; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return parse_importtime(result.stderr), [module for module in result.stdout.strip().split(',') if module]
+
+
+def open_database(stations):
+    """
+    Opens a database with the current schema and reads its station labels, as the GUI does at startup.
+
+    Returns:
+    tuple: The seconds taken to create the database, to open it again and to read the station labels.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        start = time.perf_counter()
+        db_manager = DatabaseManager(path, wal=True)
+        created = time.perf_counter() - start
+        db_manager.insert_stations((station, f'Station {station}', 50.0, 20.0, station % 100, '')
+                                   for station in range(1, stations + 1))
+        db_manager.close_connection()
+
+        start = time.perf_counter()
+        db_manager = DatabaseManager(path, wal=True)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        NameIndex(db_manager).station_labels()
+        labels = time.perf_counter() - start
+        db_manager.close_connection()
+    return created, opened, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="number of imports, the fastest is reported")
+    parser.add_argument('--top', type=int, default=10, help="number of slowest modules listed")
+    parser.add_argument('--stations', type=int, default=300)
+    parser.add_argument('--max-ms', type=float, default=None, help="fail if importing the GUI takes longer")
+    args = parser.parse_args()
+
+    runs = [import_gui() for _ in range(args.repeat)]
+    modules, loaded = min(runs, key=lambda run: run[0]['prod_aplikacja.gui'][1])
+    total_ms = modules['prod_aplikacja.gui'][1] / 1000
+    print(f"import prod_aplikacja.gui: {total_ms:.1f} ms (fastest of {args.repeat})")
+    print(f"{'module':<40}{'self [ms]':>12}{'cumulative [ms]':>18}")
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{name:<40}{own / 1000:>12.1f}{cumulative / 1000:>18.1f}")
+
+    created, opened, labels = open_database(args.stations)
+    print(f"create database: {created * 1000:.1f} ms, open existing database: {opened * 1000:.1f} ms, "
+          f"read {args.stations} station labels: {labels * 1000:.1f} ms")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the GUI loaded {', '.join(loaded)}")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL: importing the GUI took {total_ms:.1f} ms, more than {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Compares the storage of the measurement dates as text, as in schema version 4, with the epoch seconds
+of the current schema: the size of the measurements and their indexes, the time of the migration,
+and the latency of reading a sensor's history as arrays, of a one-month range aggregate and of
+fetch_measurements(). The text database is queried with the statements of the previous version.
+
+Usage:
+python -m benchmarks.bench_storage --rows 2000000 --sensors 500
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from prod_aplikacja.database_manager import DatabaseManager
+
+# The schema version whose measurements have text dates.
+TEXT_VERSION = 4
+START = datetime(2020, 1, 1)
+
+
+def seed(db_path, rows, sensors):
+    """
+    Creates the measurements table of a text-dated database with its indexes and fills it with hourly readings.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.execute('CREATE UNIQUE INDEX idx_measurements_sensor_date ON measurements (sensorId, date)')
+    conn.execute('CREATE INDEX idx_measurements_sensor_date_value ON measurements (sensorId, date, value)')
+    hours = rows // sensors
+    dates = [(START + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S') for hour in range(hours)]
+    rng = random.Random(0)
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     ((n % sensors, dates[n // sensors], rng.random() * 100) for n in range(hours * sensors)))
+    conn.execute(f'PRAGMA user_version = {TEXT_VERSION}')
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def measurements_size(conn):
+    """
+    Returns the size in bytes of the pages of the measurements table and its indexes.
+    """
+    return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'measurements' "
+                        "OR name LIKE 'idx_measurements%' OR name LIKE 'sqlite_autoindex_measurements%'").fetchone()[0]
+
+
+def read_text_history(conn, sensor_id):
+    """
+    Reads the history of a sensor from a text-dated database into arrays, parsing every date.
+    """
+    rows = conn.execute('SELECT date, value FROM measurements WHERE sensorId=? ORDER BY date', (sensor_id,)).fetchall()
+    return (np.array([row[0] for row in rows], dtype='datetime64[s]'),
+            np.array([row[1] for row in rows], dtype=np.float64))
+
+
+def time_queries(queries, repeat):
+    """
+    Returns the mean latency in milliseconds of every query.
+    """
+    results = {}
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def run(rows, sensors, repeat):
+    """
+    Seeds a text-dated database, migrates a copy of it and measures both.
+
+    Returns:
+    dict: The measurements size in bytes under 'size', the migration time in seconds under 'migration_seconds'
+          and the mean latency in milliseconds of every query under 'queries', each as a pair (text, epoch).
+    """
+    sensor = lambda: random.randrange(sensors)
+    month = ('2020-02-01 00:00:00', '2020-03-01 00:00:00')
+    with tempfile.TemporaryDirectory() as directory:
+        text_path, epoch_path = os.path.join(directory, 'text.db'), os.path.join(directory, 'epoch.db')
+        seed(text_path, rows, sensors)
+        shutil.copyfile(text_path, epoch_path)
+
+        start = time.perf_counter()
+        db_manager = DatabaseManager(epoch_path)
+        migration_seconds = time.perf_counter() - start
+        db_manager.conn.execute('VACUUM')
+
+        conn = sqlite3.connect(text_path)
+        text = time_queries({
+            'history as arrays': lambda: read_text_history(conn, sensor()),
+            'one month count and mean': lambda: conn.execute(
+                'SELECT COUNT(value), AVG(value) FROM measurements WHERE sensorId=? AND value IS NOT NULL '
+                'AND date >= ? AND date < ?', (sensor(), *month)).fetchone(),
+            'fetch_measurements': lambda: conn.execute('SELECT * FROM measurements WHERE sensorId=?',
+                                                       (sensor(),)).fetchall(),
+        }, repeat)
+        epoch = time_queries({
+            'history as arrays': lambda: list(db_manager.iter_measurements(sensor(), chunk_size=rows)),
+            'one month count and mean': lambda: db_manager.aggregate(sensor(), *month, stats=('count', 'mean')),
+            'fetch_measurements': lambda: db_manager.fetch_measurements(sensor()),
+        }, repeat)
+        size = (measurements_size(conn), measurements_size(db_manager.conn))
+        conn.close()
+        db_manager.close_connection()
+    return {'size': size, 'migration_seconds': migration_seconds,
+            'queries': {name: (text[name], epoch[name]) for name in text}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--sensors', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.sensors, args.repeat)
+    text_size, epoch_size = results['size']
+    print(f"measurements size: {text_size / 2**20:.1f} MiB as text, {epoch_size / 2**20:.1f} MiB as epoch seconds, "
+          f"migrated in {results['migration_seconds']:.1f} s")
+    print(f"{'query':<30}{'text [ms]':>14}{'epoch [ms]':>14}")
+    for name, (text, epoch) in results['queries'].items():
+        print(f"{name:<30}{text:>14.3f}{epoch:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+"""
+End-to-end benchmark suite. Measures the full-network fetch throughput and sync time against a local stub
+of the API, the insert rate, the per-sensor query latency on databases of the given sizes, the analysis
+time and the render time, and writes the results as JSON so that runs can be compared across commits.
+
+The stub replays responses recorded from the real API when a recording is given, and serves a generated
+network otherwise. A recording is made once, with network access, and can be kept next to the results.
+
+Usage:
+python -m benchmarks.suite record --output benchmarks/recordings/gios.json.gz
+python -m benchmarks.suite run --recording benchmarks/recordings/gios.json.gz --output results.json
+python -m benchmarks.suite run --quick --output results.json
+python -m benchmarks.suite compare old.json new.json
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from prod_aplikacja import data_fetcher
+from prod_aplikacja.chart_renderer import render_chart
+from prod_aplikacja.collector import Collector
+from prod_aplikacja.data_analyzer import Analyze_Data, summarize_chunks
+from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.database_manager import DatabaseManager, AGGREGATE_STATS
+from prod_aplikacja.rollups import create_rollup_tables, to_epoch
+from test_aplikacja.stub_server import ReplayApi, StubApi, load_recording
+from .bench_analysis import generate
+
+# Version of the layout of the result files, increased when results are renamed or measured differently.
+RESULTS_VERSION = 1
+
+# The sizes of the benchmarks, and the smaller ones of a quick run.
+DEFAULTS = {'rows': [1_000_000, 10_000_000], 'insert_rows': 500_000, 'analysis_rows': 10_000_000,
+            'render_lengths': [10_000, 100_000, 1_000_000], 'repeat': 50}
+QUICK = {'rows': [100_000], 'insert_rows': 50_000, 'analysis_rows': 1_000_000,
+         'render_lengths': [10_000, 100_000], 'repeat': 10}
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+########################################################################
+#################SECTION THAT RECORDS THE API###########################
+########################################################################
+
+
+def record(path, max_stations=None, concurrency=data_fetcher.DEFAULT_CONCURRENCY):
+    """
+    Downloads the stations, sensors, measurements and indices from the real API and saves the responses.
+
+    Parameters:
+    path (str): The file to write, gzip-compressed if the name ends with '.gz'.
+    max_stations (int): Records only the first stations of the network, all of them by default.
+    concurrency (int): The maximum number of requests in flight.
+
+    Returns:
+    int: The number of recorded responses.
+    """
+    recording = {}
+    stations = data_fetcher.fetch_station()
+    if max_stations is not None:
+        stations = stations[:max_stations]
+    recording['station/findAll'] = stations
+    station_ids = [station['id'] for station in stations]
+    for result in data_fetcher.fetch_all(station_ids, concurrency):
+        if result.error is not None:
+            print(f"{result.kind} {result.key}: {result.error}")
+        elif result.kind == 'sensors':
+            recording[f'station/sensors/{result.key}'] = result.data
+        else:
+            recording[f'data/getData/{result.key}'] = result.data
+    for result in data_fetcher.fetch_many('index', station_ids, concurrency):
+        if result.error is None:
+            recording[f'aqindex/getIndex/{result.key}'] = result.data
+    opener = gzip.open if path.endswith('.gz') else open
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with opener(path, 'wt', encoding='utf-8') as file:
+        json.dump(recording, file, ensure_ascii=False)
+    return len(recording)
+
+
+@contextmanager
+def open_api(recording=None, latency=0.0, stations=50, sensors_per_station=6):
+    """
+    Starts a stub of the API and points data_fetcher at it for the duration of the 'with' block.
+
+    Parameters:
+    recording (str): The recorded responses to replay, a generated network is served if None.
+    latency (float): The delay in seconds added to every response.
+    stations (int): The number of stations of a generated network.
+    sensors_per_station (int): The number of sensors of every station of a generated network.
+
+    Yields:
+    StubApi: The running stub.
+    """
+    if recording is not None:
+        api = ReplayApi(load_recording(recording), latency=latency)
+    else:
+        api = StubApi(stations=stations, sensors_per_station=sensors_per_station, latency=latency)
+    with api, api.patch_fetcher():
+        yield api
+
+########################################################################
+#################SECTION THAT MEASURES##################################
+########################################################################
+
+
+def _latencies(func, repeat):
+    """
+    Calls a function repeatedly and returns the mean, median and 95th percentile of its duration in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {'mean_ms': float(np.mean(durations)), 'p50_ms': float(np.percentile(durations, 50)),
+            'p95_ms': float(np.percentile(durations, 95))}
+
+
+def bench_fetch(concurrency):
+    """
+    Fetches the whole network (stations, sensors and measurements) through fetch_all.
+    """
+    session = data_fetcher.create_session(pool_size=concurrency)
+    start = time.perf_counter()
+    results = list(data_fetcher.fetch_all(concurrency=concurrency, session=session))
+    seconds = time.perf_counter() - start
+    session.close()
+    failed = sum(1 for result in results if result.error is not None)
+    return {'requests': len(results), 'failed': failed, 'seconds': seconds,
+            'requests_per_second': len(results) / seconds}
+
+
+def bench_sync(directory, concurrency):
+    """
+    Runs one collector cycle into an empty database: stations, sensors, measurements and indices.
+    """
+    db_manager = DatabaseManager(os.path.join(directory, 'sync.db'), wal=True)
+    # A date after every recorded reading, so that every sensor is requested.
+    stats = Collector(db_manager, concurrency=concurrency, now=lambda: datetime(2100, 1, 1)).run_cycle()
+    db_manager.close_connection()
+    return {'requests': stats.requests, 'failed': stats.failed, 'seconds': stats.duration,
+            'readings': stats.inserted, 'readings_per_second': stats.inserted / stats.duration}
+
+
+def _readings(start, hours):
+    """
+    Builds hourly readings as returned by the API.
+    """
+    return [{'date': (start + timedelta(hours=hour)).strftime(DATE_FORMAT), 'value': random.random() * 100}
+            for hour in range(hours)]
+
+
+def bench_insert(directory, rows, readings_per_sensor=720, sensors_per_batch=50):
+    """
+    Inserts API payloads of a month of hourly readings per sensor, several sensors per transaction
+    as IncrementalSync does, into an empty database.
+    """
+    db_manager = DatabaseManager(os.path.join(directory, 'insert.db'), wal=True)
+    payloads = [{'values': _readings(datetime(2024, 1, 1), readings_per_sensor)}
+                for _ in range(rows // readings_per_sensor)]
+    start = time.perf_counter()
+    for first in range(0, len(payloads), sensors_per_batch):
+        with db_manager.bulk():
+            for sensor_id in range(first, min(first + sensors_per_batch, len(payloads))):
+                db_manager.insert_measurements(payloads[sensor_id], sensor_id)
+    seconds = time.perf_counter() - start
+    db_manager.close_connection()
+    inserted = len(payloads) * readings_per_sensor
+    return {'rows': inserted, 'seconds': seconds, 'rows_per_second': inserted / seconds}
+
+
+def seed(db_path, rows, sensors):
+    """
+    Fills a new database with hourly readings spread over the sensors, and computes its rollups.
+    """
+    DatabaseManager(db_path).close_connection()
+    conn = sqlite3.connect(db_path)
+    hours = rows // sensors
+    start = datetime(2000, 1, 1)
+    dates = [to_epoch(start + timedelta(hours=hour)) for hour in range(hours)]
+    rng = random.Random(0)
+    conn.executemany('INSERT INTO measurements (sensorId, ts, value) VALUES (?, ?, ?)',
+                     ((sensor_id, date, rng.random() * 100) for sensor_id in range(sensors) for date in dates))
+    create_rollup_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def bench_queries(directory, rows, sensors, repeat):
+    """
+    Measures the latency of the per-sensor reads on a database of the given size.
+    """
+    db_path = os.path.join(directory, f'queries_{rows}.db')
+    start = time.perf_counter()
+    seed(db_path, rows, sensors)
+    results = {'seed_seconds': time.perf_counter() - start, 'rows_per_sensor': rows // sensors}
+    db_manager = DatabaseManager(db_path)
+    sensor = lambda: random.randrange(sensors)
+    queries = {
+        'fetch_measurements': lambda: db_manager.fetch_measurements(sensor()),
+        'iter_measurements+summary': lambda: summarize_chunks(db_manager.iter_measurements(sensor())),
+        'aggregate': lambda: db_manager.aggregate(sensor(), stats=AGGREGATE_STATS),
+        'fetch_series': lambda: db_manager.fetch_series(sensor()),
+        'fetch_latest_measurement_dates': lambda: db_manager.fetch_latest_measurement_dates([sensor()]),
+    }
+    for name, query in queries.items():
+        results[name] = _latencies(query, repeat)
+    db_manager.close_connection()
+    os.remove(db_path)
+    return results
+
+
+def bench_analysis(rows):
+    """
+    Computes the summary of a long series, at once and chunk by chunk.
+    """
+    timestamps, values = generate(rows)
+    analyzer = Analyze_Data.from_arrays(timestamps, values)
+    start = time.perf_counter()
+    analyzer.summary()
+    summary_seconds = time.perf_counter() - start
+    chunks = ({'date': timestamps[n:n + 65536], 'value': values[n:n + 65536]} for n in range(0, rows, 65536))
+    start = time.perf_counter()
+    summarize_chunks(chunks)
+    return {'rows': rows, 'summary_ms': summary_seconds * 1000,
+            'summarize_chunks_ms': (time.perf_counter() - start) * 1000}
+
+
+def bench_render(lengths, methods=('minmax', 'lttb')):
+    """
+    Renders charts of series of the given lengths to PNG without a window.
+    """
+    matplotlib.use('Agg')
+    rng = np.random.default_rng(0)
+    results = {}
+    for length in lengths:
+        dates = pd.date_range('2000-01-01', periods=length, freq='h')
+        visualizer = Visualize_data(pd.DataFrame({'date': dates, 'value': 40 + rng.normal(0, 10, length)}))
+        results[str(length)] = {}
+        for method in methods:
+            start = time.perf_counter()
+            render_chart(visualizer, method=method)
+            results[str(length)][f'{method}_ms'] = (time.perf_counter() - start) * 1000
+    return results
+
+########################################################################
+#################SECTION THAT RUNS AND COMPARES#########################
+########################################################################
+
+
+def environment():
+    """
+    Describes the commit and the machine the benchmarks ran on.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'sqlite': sqlite3.sqlite_version, 'numpy': np.__version__, 'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__}
+
+
+def run(recording=None, latency=0.02, concurrency=8, stations=50, sensors=1000, quick=False, only=None):
+    """
+    Runs the benchmarks.
+
+    Parameters:
+    recording (str): The recorded responses replayed by the stub, a generated network if None.
+    latency (float): The simulated round trip to the API in seconds.
+    concurrency (int): The number of requests in flight while fetching.
+    stations (int): The number of stations of a generated network.
+    sensors (int): The number of sensors the rows of the query benchmarks are spread over.
+    quick (bool): Whether to use the smaller sizes, e.g. to check the suite itself.
+    only (list): The names of the benchmarks to run, all by default.
+
+    Returns:
+    dict: The environment, the parameters and the results by benchmark.
+    """
+    sizes = QUICK if quick else DEFAULTS
+    selected = lambda name: only is None or name in only
+    parameters = {'recording': recording and os.path.basename(recording), 'latency': latency,
+                  'concurrency': concurrency, 'stations': None if recording else stations, 'sensors': sensors,
+                  **sizes}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if selected('fetch') or selected('sync'):
+            with open_api(recording, latency, stations):
+                if selected('fetch'):
+                    results['fetch'] = bench_fetch(concurrency)
+                if selected('sync'):
+                    results['sync'] = bench_sync(directory, concurrency)
+        if selected('insert'):
+            results['insert'] = bench_insert(directory, sizes['insert_rows'])
+        if selected('queries'):
+            results['queries'] = {str(rows): bench_queries(directory, rows, sensors, sizes['repeat'])
+                                  for rows in sizes['rows']}
+        if selected('analysis'):
+            results['analysis'] = bench_analysis(sizes['analysis_rows'])
+        if selected('render'):
+            results['render'] = bench_render(sizes['render_lengths'])
+    return {'version': RESULTS_VERSION, 'environment': environment(), 'parameters': parameters, 'results': results}
+
+
+def flatten(results, prefix=''):
+    """
+    Flattens nested results to a dictionary of numbers by dotted name, e.g. 'queries.1000000.aggregate.p50_ms'.
+    """
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{name}'] = value
+    return flat
+
+
+def compare(old, new):
+    """
+    Compares the results of two runs.
+
+    Parameters:
+    old (dict): The results of the reference run.
+    new (dict): The results of the run to compare.
+
+    Returns:
+    list: Tuples (name, old value, new value, relative change) of the measurements present in both runs.
+    """
+    old, new = flatten(old['results']), flatten(new['results'])
+    return [(name, old[name], new[name], (new[name] - old[name]) / old[name] if old[name] else None)
+            for name in old if name in new]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--recording', default=None, help='recorded API responses, a generated network if omitted')
+    run_parser.add_argument('--latency', type=float, default=0.02, help='simulated round trip in seconds')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--stations', type=int, default=50, help='stations of a generated network')
+    run_parser.add_argument('--sensors', type=int, default=1000, help='sensors of the query benchmarks')
+    run_parser.add_argument('--quick', action='store_true', help='smaller sizes')
+    run_parser.add_argument('--only', nargs='+', choices=['fetch', 'sync', 'insert', 'queries', 'analysis', 'render'])
+    record_parser = commands.add_parser('record', help='record the responses of the real API')
+    record_parser.add_argument('--output', default='benchmarks/recordings/gios.json.gz')
+    record_parser.add_argument('--stations', type=int, default=None, help='record only the first stations')
+    compare_parser = commands.add_parser('compare', help='compare the results of two runs')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        print(f"Recorded {record(args.output, args.stations)} responses to {args.output}")
+    elif args.command == 'run':
+        results = run(args.recording, args.latency, args.concurrency, args.stations, args.sensors, args.quick,
+                      args.only)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        for name, value in flatten(results['results']).items():
+            print(f"{name:<60}{value:>16.3f}")
+        print(f"Results written to {args.output}")
+    else:
+        with open(args.old, encoding='utf-8') as file:
+            old = json.load(file)
+        with open(args.new, encoding='utf-8') as file:
+            new = json.load(file)
+        print(f"{'measurement':<60}{'old':>14}{'new':>14}{'change':>10}")
+        for name, before, after, change in compare(old, new):
+            change = f"{change:+.1%}" if change is not None else ''
+            print(f"{name:<60}{before:>14.3f}{after:>14.3f}{change:>10}")
+
+
+if __name__ == '__main__':
+    main()
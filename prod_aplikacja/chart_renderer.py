@@ -0,0 +1,153 @@
+import argparse
+import io
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from . import metrics
+from .data_visualizer import Visualize_data
+from .database_manager import DatabaseManager
+
+# Size of the rendered charts in inches, and their resolution.
+DEFAULT_SIZE = (10, 4)
+DEFAULT_DPI = 100
+
+# Result of rendering the chart of one sensor.
+# output is the path of the written file, or the rendered bytes if no directory was given.
+# error is the exception raised while rendering, in which case output is None.
+RenderResult = namedtuple('RenderResult', ['sensor_id', 'output', 'error'])
+
+
+@metrics.timed('render.chart')
+def render_chart(visualizer, path=None, format='png', size=DEFAULT_SIZE, dpi=DEFAULT_DPI, method='minmax',
+                 title='Graph'):
+    """
+    Renders the chart of a visualizer without a window and without pyplot.
+
+    The chart is drawn on its own Figure with the Agg canvas, so nothing is registered in the global
+    pyplot state and the figure is freed as soon as the function returns. It is safe to call from
+    worker threads and processes.
+
+    Parameters:
+    visualizer (Visualize_data): The data to draw.
+    path (str): The file to write, the chart is returned as bytes if None.
+    format (str): The image format, e.g. 'png', 'svg' or 'pdf'.
+    size (tuple): The width and height of the chart in inches.
+    dpi (int): The resolution of the chart in dots per inch.
+    method (str): The downsampling method, see Visualize_data.points().
+    title (str): The title of the chart.
+
+    Returns:
+    str or bytes: The path of the written file, or the rendered chart.
+    """
+    fig = Figure(figsize=size, dpi=dpi, layout='constrained')
+    FigureCanvasAgg(fig)
+    visualizer.draw(fig.add_subplot(), 'value', method, title)
+    if path is not None:
+        fig.savefig(path, format=format)
+        return path
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=format)
+    return buffer.getvalue()
+
+
+def render_sensor(db_name, sensor_id, output_dir=None, format='png', start=None, end=None, size=DEFAULT_SIZE,
+                  dpi=DEFAULT_DPI, method='minmax'):
+    """
+    Reads the measurements of a sensor and renders its chart.
+
+    The values are read at the rollup resolution giving a few points per pixel of the chart,
+    see DatabaseManager.fetch_series(). The function opens its own connection, so it can run in a worker process.
+
+    Parameters:
+    db_name (str): The path of the database.
+    sensor_id (int): The ID of the sensor.
+    output_dir (str): The directory the chart is written to as 'sensor_<id>.<format>', bytes are returned if None.
+    format (str): The image format, e.g. 'png', 'svg' or 'pdf'.
+    start (datetime or str): The earliest date to draw, all history by default.
+    end (datetime or str): The date to stop before, no limit by default.
+    size (tuple): The width and height of the chart in inches.
+    dpi (int): The resolution of the chart in dots per inch.
+    method (str): The downsampling method, see Visualize_data.points().
+
+    Returns:
+    str or bytes: The path of the written file, or the rendered chart.
+    """
+    db_manager = DatabaseManager(db_name)
+    try:
+        visualizer = Visualize_data.from_database(db_manager, sensor_id, start, end,
+                                                  max_points=int(4 * size[0] * dpi))
+    finally:
+        db_manager.close_connection()
+    path = os.path.join(output_dir, f"sensor_{sensor_id}.{format}") if output_dir is not None else None
+    return render_chart(visualizer, path, format, size, dpi, method, title=f"Sensor {sensor_id}")
+
+
+def render_many(db_name, sensor_ids, output_dir=None, format='png', start=None, end=None, max_workers=None,
+                size=DEFAULT_SIZE, dpi=DEFAULT_DPI, method='minmax', mp_context=None):
+    """
+    Renders the charts of many sensors in parallel across a pool of processes.
+
+    Results are yielded as soon as each chart is ready, in completion order. A sensor that fails
+    does not stop the others, its error is returned in its result.
+
+    Parameters:
+    db_name (str): The path of the database, an in-memory database cannot be shared with the workers.
+    sensor_ids (iterable): The IDs of the sensors.
+    output_dir (str): The directory the charts are written to, created if needed. Bytes are returned if None.
+    format (str): The image format, e.g. 'png', 'svg' or 'pdf'.
+    start (datetime or str): The earliest date to draw, all history by default.
+    end (datetime or str): The date to stop before, no limit by default.
+    max_workers (int): The number of processes, the number of CPUs by default.
+    size (tuple): The width and height of the charts in inches.
+    dpi (int): The resolution of the charts in dots per inch.
+    method (str): The downsampling method, see Visualize_data.points().
+    mp_context (multiprocessing.context.BaseContext): How to start the processes. 'spawn' by default,
+                                                      which is safe to use from a program running threads.
+
+    Yields:
+    RenderResult: The outcome of every sensor.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers, mp_context or multiprocessing.get_context('spawn')) as executor:
+        futures = {executor.submit(render_sensor, db_name, sensor_id, output_dir, format, start, end, size, dpi,
+                                   method): sensor_id
+                   for sensor_id in sensor_ids}
+        for future in as_completed(futures):
+            try:
+                yield RenderResult(futures[future], future.result(), None)
+            except Exception as e:
+                yield RenderResult(futures[future], None, e)
+
+
+def main():
+    """
+    Renders the charts of all sensors in the database, e.g. for a nightly report:
+    python -m prod_aplikacja.chart_renderer --db air_quality.db --output report --format svg
+    """
+    parser = argparse.ArgumentParser(description="Renders the charts of all sensors to files.")
+    parser.add_argument('--db', default='air_quality.db')
+    parser.add_argument('--output', default='charts')
+    parser.add_argument('--format', default='png')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    id_column = db_manager.table_columns('sensors').index('id')
+    sensor_ids = [row[id_column] for chunk in db_manager.iter_table('sensors') for row in chunk]
+    db_manager.close_connection()
+    failed = 0
+    for result in render_many(args.db, sensor_ids, args.output, args.format, max_workers=args.workers):
+        if result.error is not None:
+            failed += 1
+            print(f"Sensor {result.sensor_id}: {result.error}")
+    print(f"Rendered {len(sensor_ids) - failed} of {len(sensor_ids)} charts to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from . import metrics
+from .data_fetcher import fetch_all, DEFAULT_CONCURRENCY
+from .database_manager import DatabaseManager
+from .index_sync import IndexSync
+from .measurement_sync import IncrementalSync
+from .task_runner import TaskCancelled
+
+# How often the measurements are collected, in seconds. The API publishes hourly readings.
+DEFAULT_INTERVAL = 3600
+# How often the list of stations and their sensors is refreshed, in seconds.
+DEFAULT_METADATA_INTERVAL = 24 * 3600
+
+# Summary of one collection cycle.
+# cycle is the number of the cycle from 1, started the local time it started at and duration its length in seconds.
+# requests and failed are the numbers of API requests sent and failed, stations and sensors the numbers of
+# stored stations and sensors refreshed in the cycle, skipped the number of sensors whose data was still current,
+# inserted the number of new readings stored and indices the number of new station indices stored.
+# cancelled tells whether the cycle was interrupted by stop().
+CycleStats = namedtuple('CycleStats', ['cycle', 'started', 'duration', 'requests', 'failed', 'stations', 'sensors',
+                                       'skipped', 'inserted', 'indices', 'cancelled'])
+
+
+class Collector:
+    """
+    Collects the measurements of all stations in the background, without the GUI.
+
+    Every cycle downloads the new readings of every stored sensor with an IncrementalSync and the
+    air quality index of every stored station with an IndexSync, and refreshes the stations and
+    sensors first when they are older than 'metadata_interval'. Cycles start at a fixed rate; a
+    cycle that takes longer than the interval delays the next one instead of piling up. Requests
+    run on a pool of at most 'concurrency' threads over one pooled session, and nothing is kept
+    between cycles but the counters, so memory use does not grow over time.
+    """
+    def __init__(self, db_manager, interval=DEFAULT_INTERVAL, metadata_interval=DEFAULT_METADATA_INTERVAL,
+                 concurrency=DEFAULT_CONCURRENCY, max_age=None, indices=True, session=None, clock=time.monotonic,
+                 now=datetime.now):
+        """
+        Initializes the Collector class.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the data is written to.
+        interval (float): The time between the starts of two cycles, in seconds.
+        metadata_interval (float): How often stations and sensors are refreshed, in seconds.
+        concurrency (int): The maximum number of requests in flight.
+        max_age (timedelta): How old the newest reading of a sensor may be before it is requested again,
+                             slightly less than the interval by default so that every cycle requests every sensor.
+        indices (bool): Whether to collect the air quality indices of the stations.
+        session (requests.Session): The session to use, the shared one by default.
+        clock (callable): Returns a monotonic time in seconds, used for scheduling and timing.
+        now (callable): Returns the current local time.
+        """
+        self.db_manager = db_manager
+        self.interval = interval
+        self.metadata_interval = metadata_interval
+        self.concurrency = concurrency
+        self.session = session
+        self.clock = clock
+        self.now = now
+        if max_age is None:
+            max_age = timedelta(seconds=interval * 0.9)
+        self.sync = IncrementalSync(db_manager, max_age=max_age, concurrency=concurrency, session=session, now=now)
+        self.index_sync = IndexSync(db_manager, concurrency=concurrency, session=session) if indices else None
+        self.cycles = 0
+        self.total_requests = 0
+        self.total_failed = 0
+        self.total_inserted = 0
+        self.last_stats = None
+        self._metadata_refreshed = None
+        self._stop_event = threading.Event()
+
+    @property
+    def stopping(self):
+        """
+        Whether stop() has been called.
+        """
+        return self._stop_event.is_set()
+
+    def stop(self):
+        """
+        Asks the collector to stop. The running cycle stops after the requests in flight, keeping what
+        has been downloaded, and run() returns. Safe to call from a signal handler or another thread.
+        """
+        self._stop_event.set()
+
+    def check(self):
+        """
+        Called between steps of a cycle.
+
+        Raises:
+        TaskCancelled: If the collector is stopping.
+        """
+        if self.stopping:
+            raise TaskCancelled('collector')
+
+    def refresh_metadata(self):
+        """
+        Downloads all stations and their sensors and stores them in the database.
+
+        Returns:
+        tuple: The numbers of requests sent, failed requests, stations and sensors stored.
+        """
+        requests = failed = stations = sensors = 0
+        for result in fetch_all(concurrency=self.concurrency, session=self.session, measurements=False):
+            requests += 1
+            if result.error is not None:
+                failed += 1
+            elif result.kind == 'stations':
+                self.db_manager.insert_stations(
+                    (station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
+                     station['city']['id'], station.get('addressStreet', ''))
+                    for station in result.data)
+                stations += len(result.data)
+            else:
+                self.db_manager.insert_sensors(result.data)
+                sensors += len(result.data)
+            self.check()
+        return requests, failed, stations, sensors
+
+    @metrics.timed('collector.cycle')
+    def run_cycle(self):
+        """
+        Runs one collection cycle.
+
+        Returns:
+        CycleStats: The summary of the cycle.
+        """
+        self.cycles += 1
+        started, start = self.now(), self.clock()
+        requests = failed = stations = sensors = skipped = inserted = indices = 0
+        cancelled = False
+        try:
+            if self._metadata_refreshed is None or start - self._metadata_refreshed >= self.metadata_interval:
+                requests, failed, stations, sensors = self.refresh_metadata()
+                # Try again next cycle if the list of stations could not be downloaded.
+                if stations:
+                    self._metadata_refreshed = start
+            self.check()
+            stats = self.sync.sync(progress=lambda done, total: self.check())
+            requests += stats.fetched + stats.failed
+            failed += stats.failed
+            skipped, inserted = stats.skipped, stats.inserted
+            if self.index_sync is not None:
+                self.check()
+                stats = self.index_sync.sync(progress=lambda done, total: self.check())
+                requests += stats.fetched + stats.failed
+                failed += stats.failed
+                indices = stats.inserted
+        except TaskCancelled:
+            cancelled = True
+        stats = CycleStats(self.cycles, started, self.clock() - start, requests, failed, stations, sensors, skipped,
+                           inserted, indices, cancelled)
+        self.total_requests += requests
+        self.total_failed += failed
+        self.total_inserted += inserted
+        self.last_stats = stats
+        return stats
+
+    def run(self, cycles=None, on_cycle=None):
+        """
+        Runs cycles on schedule until stop() is called.
+
+        Parameters:
+        cycles (int): The number of cycles to run, unlimited by default.
+        on_cycle (callable): Called with the CycleStats of every finished cycle.
+        """
+        next_start = self.clock()
+        done = 0
+        while not self.stopping and (cycles is None or done < cycles):
+            stats = self.run_cycle()
+            done += 1
+            if on_cycle:
+                on_cycle(stats)
+            if cycles is not None and done >= cycles:
+                break
+            next_start += self.interval
+            now = self.clock()
+            if next_start < now:
+                # Skip the starts missed by a long cycle instead of running them back to back.
+                next_start = now if self.interval <= 0 else \
+                    next_start + ((now - next_start) // self.interval + 1) * self.interval
+            self._stop_event.wait(next_start - now)
+
+
+def format_stats(stats):
+    """
+    Formats the summary of a cycle as one log line, with the throughput of the cycle.
+
+    Parameters:
+    stats (CycleStats): The summary of the cycle.
+
+    Returns:
+    str: The line.
+    """
+    seconds = max(stats.duration, 1e-9)
+    line = (f"{stats.started:%Y-%m-%d %H:%M:%S} cycle {stats.cycle}: {stats.duration:.1f} s, "
+            f"{stats.requests} requests ({stats.failed} failed, {stats.requests / seconds:.1f}/s), "
+            f"{stats.skipped} sensors current, {stats.inserted} readings inserted ({stats.inserted / seconds:.1f}/s), "
+            f"{stats.indices} indices inserted")
+    if stats.stations or stats.sensors:
+        line += f", refreshed {stats.stations} stations and {stats.sensors} sensors"
+    if stats.cancelled:
+        line += ", interrupted"
+    return line
+
+
+def write_metrics(path):
+    """
+    Writes the recorded metrics in the Prometheus text format, replacing the file at once so that
+    a scraper never reads it half written.
+
+    Parameters:
+    path (str): The file to write.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(metrics.prometheus_text())
+    os.replace(temporary, path)
+
+
+def main(argv=None):
+    """
+    Collects the measurements of all stations until interrupted, e.g. as a service:
+    python -m prod_aplikacja.collector --db air_quality.db --interval 3600
+    SIGINT (Ctrl+C) and SIGTERM stop the collector gracefully.
+    """
+    parser = argparse.ArgumentParser(description="Collects the air quality measurements of all stations on a schedule.")
+    parser.add_argument('--db', default='air_quality.db')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between two cycles")
+    parser.add_argument('--metadata-interval', type=float, default=DEFAULT_METADATA_INTERVAL,
+                        help="seconds between two refreshes of the stations and sensors")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--cycles', type=int, default=None, help="stop after this many cycles")
+    parser.add_argument('--no-indices', action='store_true', help="do not collect the air quality indices")
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help="record metrics and write them in the Prometheus text format to PATH after every cycle")
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help="profile the main thread with cProfile and save the profile to PATH when stopping")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        metrics.start_profiling()
+
+    db_manager = DatabaseManager(args.db, wal=True)
+    collector = Collector(db_manager, args.interval, args.metadata_interval, args.concurrency,
+                          indices=not args.no_indices)
+
+    def shutdown(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, stopping", flush=True)
+        collector.stop()
+
+    previous = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    def on_cycle(stats):
+        print(format_stats(stats), flush=True)
+        if args.metrics:
+            write_metrics(args.metrics)
+
+    try:
+        collector.run(args.cycles, on_cycle=on_cycle)
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        db_manager.close_connection()
+        if args.profile:
+            print(metrics.stop_profiling(args.profile, limit=20), flush=True)
+    print(f"Stopped after {collector.cycles} cycles: {collector.total_requests} requests "
+          f"({collector.total_failed} failed), {collector.total_inserted} readings inserted", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
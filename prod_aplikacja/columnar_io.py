@@ -0,0 +1,201 @@
+import os
+
+import numpy as np
+
+# pyarrow is only needed to export and import, the rest of the application works without it.
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# The number of measurements read from SQLite or Parquet at a time, which bounds the memory used.
+DEFAULT_CHUNK_SIZE = 65536
+
+STATIONS_FILE = 'stations.parquet'
+SENSORS_FILE = 'sensors.parquet'
+MEASUREMENTS_DIR = 'measurements'
+PART_FILE = 'part-0.parquet'
+
+
+def _require_pyarrow():
+    """
+    Raises:
+    ImportError: If pyarrow is not installed.
+    """
+    if pa is None:
+        raise ImportError("Parquet export and import need pyarrow, install it with: pip install pyarrow")
+
+
+def _measurement_schema():
+    """
+    The schema of the measurement files. The sensor and the month are encoded in the directory names.
+    """
+    return pa.schema([('date', pa.timestamp('s')), ('value', pa.float64())])
+
+
+def _export_table(db_manager, table, path):
+    """
+    Writes a table to a Parquet file, with the column names of the table.
+
+    Returns:
+    int: The number of rows written.
+    """
+    names = db_manager.table_columns(table)
+    rows = [row for chunk in db_manager.iter_table(table) for row in chunk]
+    columns = list(zip(*rows)) if rows else [[] for _ in names]
+    pq.write_table(pa.table({name: list(column) for name, column in zip(names, columns)}), path)
+    return len(rows)
+
+
+def export_database(db_manager, directory, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Exports the stations, sensors and measurements of a database to Parquet files.
+
+    Stations and sensors are written to 'stations.parquet' and 'sensors.parquet'. Measurements are
+    partitioned by sensor and month in the Hive layout, 'measurements/sensor=<id>/month=<YYYY-MM>/part-0.parquet',
+    with a timestamp 'date' column and a float 'value' column. They are read with DatabaseManager.iter_table
+    in sensor and date key order and written chunk by chunk, so the memory used does not depend on the size
+    of the database. Existing partitions are overwritten.
+
+    Parameters:
+    db_manager (DatabaseManager): The database to export.
+    directory (str): The directory to write to, created if needed.
+    chunk_size (int): The number of measurements read at a time.
+
+    Returns:
+    dict: The numbers of exported 'stations', 'sensors' and 'measurements', and of written 'files'.
+
+    Raises:
+    ImportError: If pyarrow is not installed.
+    """
+    _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    counts = {
+        'stations': _export_table(db_manager, 'stations', os.path.join(directory, STATIONS_FILE)),
+        'sensors': _export_table(db_manager, 'sensors', os.path.join(directory, SENSORS_FILE)),
+        'measurements': 0,
+        'files': 2,
+    }
+
+    schema = _measurement_schema()
+    writer, partition = None, None
+    try:
+        for rows in db_manager.iter_table('measurements', chunk_size):
+            sensor_ids, dates, values = zip(*rows)
+            # The stored seconds are the datetime64[s] values themselves.
+            dates = np.array(dates, dtype='datetime64[s]')
+            values = np.array(values, dtype=np.float64)
+            keys = list(zip(sensor_ids, dates.astype('datetime64[M]').astype(str)))
+            # Rows of one partition are contiguous, split the chunk where the partition changes.
+            bounds = [0] + [n for n in range(1, len(keys)) if keys[n] != keys[n - 1]] + [len(keys)]
+            for start, end in zip(bounds, bounds[1:]):
+                if keys[start] != partition:
+                    if writer is not None:
+                        writer.close()
+                    partition = keys[start]
+                    path = os.path.join(directory, MEASUREMENTS_DIR, f"sensor={partition[0]}", f"month={partition[1]}")
+                    os.makedirs(path, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(path, PART_FILE), schema)
+                    counts['files'] += 1
+                writer.write_table(pa.table({'date': dates[start:end], 'value': values[start:end]}, schema=schema))
+            counts['measurements'] += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return counts
+
+
+def _partitions(directory):
+    """
+    Lists the measurement files of an export with their sensor, in sensor and month order.
+
+    Returns:
+    list: Tuples (sensor_id, path).
+    """
+    root = os.path.join(directory, MEASUREMENTS_DIR)
+    if not os.path.isdir(root):
+        return []
+    partitions = []
+    for sensor_dir in os.listdir(root):
+        if not sensor_dir.startswith('sensor='):
+            continue
+        sensor_id = int(sensor_dir.split('=', 1)[1])
+        for month_dir in sorted(os.listdir(os.path.join(root, sensor_dir))):
+            path = os.path.join(root, sensor_dir, month_dir, PART_FILE)
+            if os.path.exists(path):
+                partitions.append((sensor_id, path))
+    return sorted(partitions)
+
+
+def import_database(db_manager, directory, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Loads an export written by export_database into a database.
+
+    Stations and sensors that already exist are kept, measurements are inserted or update the stored
+    values like downloaded ones. Every measurement file is memory-mapped and read in chunks, and
+    the whole import is one transaction.
+
+    Parameters:
+    db_manager (DatabaseManager): The database to load into.
+    directory (str): The directory of the export.
+    chunk_size (int): The number of measurements inserted at a time.
+
+    Returns:
+    dict: The numbers of imported 'stations', 'sensors' and 'measurements'.
+
+    Raises:
+    ImportError: If pyarrow is not installed.
+    """
+    _require_pyarrow()
+    counts = {'stations': 0, 'sensors': 0, 'measurements': 0}
+    with db_manager.bulk():
+        stations_path = os.path.join(directory, STATIONS_FILE)
+        if os.path.exists(stations_path):
+            stations = pq.read_table(stations_path, memory_map=True).to_pylist()
+            db_manager.insert_stations((station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
+                                        station['cityId'], station['addressStreet']) for station in stations)
+            counts['stations'] = len(stations)
+
+        sensors_path = os.path.join(directory, SENSORS_FILE)
+        if os.path.exists(sensors_path):
+            sensors = pq.read_table(sensors_path, memory_map=True).to_pylist()
+            db_manager.insert_sensors({'id': sensor['id'], 'stationId': sensor['stationId'],
+                                       'param': {'paramName': sensor['paramName'],
+                                                 'paramFormula': sensor['paramFormula'],
+                                                 'paramCode': sensor['paramCode'], 'idParam': sensor['idParam']}}
+                                      for sensor in sensors)
+            counts['sensors'] = len(sensors)
+
+        for sensor_id, path in _partitions(directory):
+            for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size):
+                # Parquet stores the timestamps in milliseconds, in seconds they are the numbers stored in the database
+                dates = batch.column('date').cast(pa.timestamp('s')).cast(pa.int64()).to_pylist()
+                values = batch.column('value').to_pylist()
+                db_manager.insert_measurements(
+                    {'values': [{'date': date, 'value': value} for date, value in zip(dates, values)]}, sensor_id)
+                counts['measurements'] += len(dates)
+    return counts
+
+
+def open_measurements(directory):
+    """
+    Opens the measurements of an export as a memory-mapped pyarrow dataset, for offline analysis
+    without SQLite. The partition columns 'sensor' and 'month' can be used in filters, e.g.
+    open_measurements('export').to_table(filter=pyarrow.dataset.field('sensor') == 101).
+
+    Parameters:
+    directory (str): The directory of the export.
+
+    Returns:
+    pyarrow.dataset.Dataset: The measurements, with the columns 'date', 'value', 'sensor' and 'month'.
+
+    Raises:
+    ImportError: If pyarrow is not installed.
+    """
+    _require_pyarrow()
+    partitioning = ds.partitioning(pa.schema([('sensor', pa.int64()), ('month', pa.string())]), flavor='hive')
+    return ds.dataset(os.path.join(directory, MEASUREMENTS_DIR), format='parquet', partitioning=partitioning,
+                      filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
@@ -1,10 +1,198 @@
+from itertools import islice
+
+import numpy as np
 import pandas as pd
 
+from . import metrics
+from .database_manager import DEFAULT_SERIES_POINTS
+
+# Percentiles computed by summary().
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def to_epoch_seconds(timestamps):
+    """
+    Converts timestamps to seconds since the epoch.
+
+    Parameters:
+    timestamps (array-like): Date strings such as '2024-01-01 00:00:00', datetime64 values or numbers of seconds.
+
+    Returns:
+    numpy.ndarray: A float64 array of seconds.
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind not in 'iuf':
+        timestamps = timestamps.astype('datetime64[s]', copy=False).view(np.int64)
+    return timestamps.astype(np.float64, copy=False)
+
+
+@metrics.timed('analysis.summarize')
+def summarize(timestamps, values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Computes all statistics of a series at once from NumPy arrays.
+
+    Readings without a value (NaN) are ignored. The series is put in time order only if it is not
+    already sorted, so the trend and slope do not depend on the order the rows were stored in.
+
+    Parameters:
+    timestamps (array-like): The time of every reading, see to_epoch_seconds().
+    values (array-like): The value of every reading.
+    percentiles (tuple): The percentiles to compute, between 0 and 100.
+
+    Returns:
+    dict: count, min, max, mean, std, one 'p<N>' entry per percentile, trend (the mean change between
+          consecutive readings) and slope (the least squares change of the value per hour).
+          The statistics are NaN when there is not enough data.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    seconds = to_epoch_seconds(timestamps)
+    valid = ~np.isnan(values)
+    if not valid.all():
+        values, seconds = values[valid], seconds[valid]
+
+    count = len(values)
+    result = {'count': count}
+    if count == 0:
+        result.update({name: np.nan for name in ('min', 'max', 'mean', 'std', 'trend', 'slope')})
+        result.update({f'p{p:g}': np.nan for p in percentiles})
+        return result
+
+    if count > 1 and np.any(seconds[1:] < seconds[:-1]):
+        order = np.argsort(seconds, kind='stable')
+        values, seconds = values[order], seconds[order]
+
+    mean = values.mean()
+    deviations = values - mean
+    result['min'] = values.min()
+    result['max'] = values.max()
+    result['mean'] = mean
+    result['std'] = np.sqrt(np.dot(deviations, deviations) / (count - 1)) if count > 1 else np.nan
+    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+        result[f'p{p:g}'] = value
+
+    # The mean of the consecutive differences telescopes to (last - first) / (count - 1).
+    result['trend'] = (values[-1] - values[0]) / (count - 1) if count > 1 else np.nan
+    hours = (seconds - seconds.mean()) / 3600
+    spread = np.dot(hours, hours)
+    result['slope'] = np.dot(hours, deviations) / spread if spread > 0 else np.nan
+    return result
+
+
+class RunningSummary:
+    """
+    Statistics of a series computed chunk by chunk in constant memory.
+
+    Every chunk is reduced to its count, extremes, means and sums of squared deviations, which are
+    merged into the running totals with the pairwise update of Chan et al., so the result does not
+    depend on how the series is split. Percentiles need the whole series and are not computed.
+    """
+    STATS = ('count', 'min', 'max', 'mean', 'std', 'trend', 'slope')
+
+    def __init__(self):
+        """
+        Initializes the RunningSummary class with an empty series.
+        """
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._origin = None
+        self._mean_hours = 0.0
+        self._mean = 0.0
+        self._hours_m2 = 0.0
+        self._m2 = 0.0
+        self._co_moment = 0.0
+        self._first = (np.inf, np.nan)
+        self._last = (-np.inf, np.nan)
+
+    def update(self, timestamps, values):
+        """
+        Adds a chunk of readings. Chunks may come in any order.
+
+        Parameters:
+        timestamps (array-like): The time of every reading, see to_epoch_seconds().
+        values (array-like): The value of every reading, NaN for unknown values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        seconds = to_epoch_seconds(timestamps)
+        valid = ~np.isnan(values)
+        if not valid.all():
+            values, seconds = values[valid], seconds[valid]
+        count = len(values)
+        if count == 0:
+            return
+        if self._origin is None:
+            # Hours are counted from the first reading seen, which keeps the sums of squares small.
+            self._origin = seconds[0]
+        hours = (seconds - self._origin) / 3600
+
+        first, last = hours.argmin(), hours.argmax()
+        if hours[first] < self._first[0]:
+            self._first = (hours[first], values[first])
+        if hours[last] >= self._last[0]:
+            self._last = (hours[last], values[last])
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        mean_hours, mean = hours.mean(), values.mean()
+        hour_deviations, deviations = hours - mean_hours, values - mean
+        total = self.count + count
+        weight = self.count * count / total
+        hours_delta, delta = mean_hours - self._mean_hours, mean - self._mean
+        self._hours_m2 += np.dot(hour_deviations, hour_deviations) + hours_delta * hours_delta * weight
+        self._m2 += np.dot(deviations, deviations) + delta * delta * weight
+        self._co_moment += np.dot(hour_deviations, deviations) + hours_delta * delta * weight
+        self._mean_hours += hours_delta * count / total
+        self._mean += delta * count / total
+        self.count = total
+
+    def result(self):
+        """
+        Returns the statistics of the readings added so far.
+
+        Returns:
+        dict: count, min, max, mean, std, trend and slope, as computed by summarize().
+              The statistics are NaN when there is not enough data.
+        """
+        count = self.count
+        if count == 0:
+            return {'count': 0, **{name: np.nan for name in self.STATS[1:]}}
+        return {
+            'count': count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self._mean,
+            'std': np.sqrt(self._m2 / (count - 1)) if count > 1 else np.nan,
+            'trend': (self._last[1] - self._first[1]) / (count - 1) if count > 1 else np.nan,
+            'slope': self._co_moment / self._hours_m2 if self._hours_m2 > 0 else np.nan,
+        }
+
+
+@metrics.timed('analysis.summarize_chunks')
+def summarize_chunks(chunks, date_column='date', value_column='value'):
+    """
+    Computes the statistics of a series read in chunks, e.g. from DatabaseManager.iter_measurements(),
+    without holding the series in memory.
+
+    Parameters:
+    chunks (iterable): Dictionaries of arrays or DataFrames with the dates and values of the readings.
+    date_column (str): The name of the dates in a chunk.
+    value_column (str): The name of the values in a chunk.
+
+    Returns:
+    dict: The statistics, see RunningSummary.result().
+    """
+    running = RunningSummary()
+    for chunk in chunks:
+        running.update(np.asarray(chunk[date_column]), np.asarray(chunk[value_column], dtype=np.float64))
+    return running.result()
+
+
 class Analyze_Data:
     """
     A class used to analyze air quality data including finding minimum, maximum,
     mean values, and determining the trend.
     """
+    @metrics.timed('analysis.dataframe')
     def __init__(self, data):
         """
         Initializes the Analyze_Data class by converting input data into a pandas DataFrame.
@@ -13,7 +201,133 @@ class Analyze_Data:
         data (list): A list of dictionaries or records containing data with 'id', 'station_id',
                      'timestamp', and 'value' columns.
         """
-        self.data = pd.DataFrame(data, columns=['id', 'station_id', 'timestamp', 'value'])
+        self._data = pd.DataFrame(data, columns=['id', 'station_id', 'timestamp', 'value'])
+        self._timestamps = None
+        self._values = None
+        self.resolution = None
+
+    @classmethod
+    def from_arrays(cls, timestamps, values):
+        """
+        Creates an analyzer directly from NumPy arrays, without building a DataFrame.
+
+        Parameters:
+        timestamps (array-like): The time of every reading, see to_epoch_seconds().
+        values (array-like): The value of every reading.
+
+        Returns:
+        Analyze_Data: The analyzer.
+        """
+        analyzer = cls.__new__(cls)
+        analyzer._data = None
+        analyzer._timestamps = np.asarray(timestamps)
+        analyzer._values = np.asarray(values, dtype=np.float64)
+        analyzer.resolution = None
+        return analyzer
+
+    @classmethod
+    @metrics.timed('analysis.from_cursor')
+    def from_cursor(cls, cursor, date_column=2, value_column=3, chunk_size=65536):
+        """
+        Creates an analyzer from database rows, e.g. a sqlite3 cursor over the 'measurements' table.
+        The rows are consumed in chunks straight into NumPy arrays, never held as one list of tuples.
+
+        Parameters:
+        cursor (iterable): The rows, a cursor or any iterable of tuples.
+        date_column (int): The position of the date in a row.
+        value_column (int): The position of the value in a row.
+        chunk_size (int): The number of rows converted at a time.
+
+        Returns:
+        Analyze_Data: The analyzer.
+        """
+        rows = iter(cursor)
+        dates, values = [], []
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            dates.append(np.array([row[date_column] for row in chunk], dtype='datetime64[s]'))
+            values.append(np.array([row[value_column] for row in chunk], dtype=np.float64))
+        if not dates:
+            return cls.from_arrays(np.empty(0, dtype='datetime64[s]'), np.empty(0))
+        return cls.from_arrays(np.concatenate(dates), np.concatenate(values))
+
+    @classmethod
+    @metrics.timed('analysis.from_chunks')
+    def from_chunks(cls, chunks, date_column='date', value_column='value'):
+        """
+        Creates an analyzer from a series read in chunks, e.g. from DatabaseManager.iter_measurements().
+        Only the dates and values are kept, as two compact arrays. To compute the statistics without
+        keeping the series at all, see summarize_chunks().
+
+        Parameters:
+        chunks (iterable): Dictionaries of arrays or DataFrames with the dates and values of the readings.
+        date_column (str): The name of the dates in a chunk.
+        value_column (str): The name of the values in a chunk.
+
+        Returns:
+        Analyze_Data: The analyzer.
+        """
+        dates, values = [np.empty(0, dtype='datetime64[s]')], [np.empty(0)]
+        for chunk in chunks:
+            dates.append(np.asarray(chunk[date_column]))
+            values.append(np.asarray(chunk[value_column], dtype=np.float64))
+        return cls.from_arrays(np.concatenate(dates), np.concatenate(values))
+
+    @classmethod
+    def from_database(cls, db_manager, sensor_id, start=None, end=None, max_points=DEFAULT_SERIES_POINTS,
+                      cache=None):
+        """
+        Creates an analyzer of the values of a sensor at the rollup resolution fitting the range,
+        see DatabaseManager.fetch_series(). For long ranges the statistics are those of the hourly,
+        daily or monthly means. The chosen resolution is kept in the 'resolution' attribute.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the values are read from.
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        max_points (int): The maximum number of values wanted.
+        cache (SeriesCache): A cache serving the readings of short ranges from memory without copying them,
+                             see SeriesCache.fetch_series().
+
+        Returns:
+        Analyze_Data: The analyzer.
+        """
+        if cache is not None:
+            resolution, series = cache.fetch_series(sensor_id, start, end, max_points)
+        else:
+            resolution, series = db_manager.fetch_series(sensor_id, start, end, max_points, as_arrays=True)
+        analyzer = cls.from_arrays(series['date'], series['value'])
+        analyzer.resolution = resolution
+        return analyzer
+
+    @property
+    def data(self):
+        """
+        The analyzed data as a pandas DataFrame, built on first use for analyzers created from arrays.
+        """
+        if self._data is None:
+            self._data = pd.DataFrame({'id': None, 'station_id': None,
+                                       'timestamp': self._timestamps, 'value': self._values})
+        return self._data
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        """
+        Computes the minimum, maximum, mean, standard deviation, count, percentiles, trend and
+        regression slope of the values in one go over a float64 array, see summarize().
+
+        Parameters:
+        percentiles (tuple): The percentiles to compute, between 0 and 100.
+
+        Returns:
+        dict: The statistics by name.
+        """
+        if self._values is None:
+            self._timestamps = self._data['timestamp'].to_numpy()
+            self._values = self._data['value'].to_numpy(dtype=np.float64, na_value=np.nan)
+        return summarize(self._timestamps, self._values, percentiles)
 
     def min_value(self, param):
         """
@@ -1,25 +1,394 @@
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+BASE_URL = "https://powietrze.gios.gov.pl/pjp-api/rest"
+
+# Number of keep-alive connections kept open to the API host by the shared session.
+DEFAULT_POOL_SIZE = 16
+
+# Default number of requests sent in parallel by the bulk fetch functions.
+DEFAULT_CONCURRENCY = 8
+
+# One item streamed back by the bulk fetch functions.
+# kind is 'stations', 'sensors', 'measurements' or 'index', key is the station or sensor ID
+# the request was made for, data is the decoded JSON and error the exception raised, if any.
+FetchResult = namedtuple('FetchResult', ['kind', 'key', 'data', 'error'])
+
+# Default maximum number of requests per second sent to the API by all threads together.
+DEFAULT_RATE = 20.0
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+
+########################################################################
+#################SECTION THAT HANDLES FAILURES##########################
+########################################################################
+
+
+class FetchError(Exception):
+    """
+    Raised when data cannot be fetched from the API.
+
+    Attributes:
+    url (str): The requested URL.
+    status_code (int): The HTTP status of the last response, None if no response was received.
+    """
+    def __init__(self, message, url=None, status_code=None):
+        super().__init__(message)
+        self.url = url
+        self.status_code = status_code
+
+
+class TransientFetchError(FetchError):
+    """
+    Raised when a request kept failing in a way that may go away later:
+    a timeout, a connection error, throttling (429) or a server error (5xx).
+    """
+
+
+class PermanentFetchError(FetchError):
+    """
+    Raised when a request failed in a way that repeating it will not fix,
+    e.g. an unknown station or sensor (404) or a body that is not valid JSON.
+    """
+
+
+class RetryPolicy:
+    """
+    Describes how long to wait for the API and how to repeat failed requests.
+
+    Transient failures are retried with exponential backoff and full jitter: the n-th retry waits
+    a random time between 0 and min(max_backoff, backoff * 2 ** n) seconds, or as long as the
+    Retry-After header of a throttled response asks.
+    """
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0, timeout=(3.05, 20.0),
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        """
+        Initializes the RetryPolicy class.
+
+        Parameters:
+        retries (int): How many times a failed request is repeated.
+        backoff (float): The base of the exponential backoff in seconds.
+        max_backoff (float): The maximum wait between two attempts in seconds.
+        timeout (float or tuple): The connect and read timeouts in seconds, passed to requests.
+        retry_statuses (tuple): The HTTP statuses treated as transient failures.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns how many seconds to wait before the next attempt.
+
+        Parameters:
+        attempt (int): The number of the failed attempt, starting from 0.
+        retry_after (float): The wait requested by the server, if any.
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+
+class RateLimiter:
+    """
+    A token bucket limiting the rate of requests sent by all threads together.
+
+    The rate adapts to the API: it is halved every time the API answers 429 Too Many Requests
+    and grows back a little with every successful request, so that bulk syncs run at the
+    fastest rate the API tolerates.
+    """
+    def __init__(self, rate=DEFAULT_RATE, burst=None, min_rate=None, increase=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        Initializes the RateLimiter class.
+
+        Parameters:
+        rate (float): The maximum number of requests per second.
+        burst (int): How many requests can be sent at once after a quiet period, 'rate' by default.
+        min_rate (float): The rate is never lowered below this value, rate / 20 by default.
+        increase (float): How much the rate grows after every successful request, rate / 100 by default.
+        clock (callable): Returns the current time in seconds.
+        sleep (callable): Waits for the given number of seconds.
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.min_rate = min_rate or rate / 20
+        self.increase = increase or rate / 100
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """
+        Adds the tokens accumulated since the last update, up to the burst size.
+        """
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+        The token is reserved before waiting, so concurrent callers are served in turn.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            self.sleep(wait)
+
+    def on_throttled(self):
+        """
+        Halves the rate and drops the saved tokens after the API answered 429.
+        """
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        """
+        Raises the rate a little after a successful request.
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+# The retry policy and the rate limiter used by all fetch functions.
+# They can be replaced, e.g. rate_limiter = None turns the rate limiting off.
+retry_policy = RetryPolicy()
+rate_limiter = RateLimiter()
+
+
+def _retry_after(response):
+    """
+    Returns the wait in seconds requested by the Retry-After header of a response, or None.
+    """
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+########################################################################
+#################SECTION THAT FETCHES DATA##############################
+########################################################################
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Creates a requests session with a connection pool large enough for concurrent use.
+
+    Parameters:
+    pool_size (int): The maximum number of keep-alive connections kept per host.
+
+    Returns:
+    requests.Session: A new session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns the session shared by all fetch functions, creating it on first use.
+
+    Reusing one session keeps TCP/TLS connections to the API alive between calls.
+
+    Returns:
+    requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def set_cache(cache):
+    """
+    Sets the response cache used by all fetch functions.
+
+    Parameters:
+    cache (ResponseCache): The cache, or None to always download.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """
+    Returns the response cache used by the fetch functions, or None if caching is off.
+    """
+    return _cache
+
+
+# Exceptions of requests raised by failures that may go away when the request is repeated:
+# no answer in time, a lost connection or a body cut off or garbled on the way.
+_TRANSIENT_EXCEPTIONS = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                         requests.exceptions.ContentDecodingError)
+
+
+def _truncated(response):
+    """
+    Whether a response body is shorter than its declared Content-Length.
+    """
+    try:
+        return len(response.content) < int(response.headers.get('Content-Length', 0))
+    except (TypeError, ValueError):
+        return False
+
+
+def _cached_json(entry, error_message, url):
+    """
+    Decodes the body of a cached response.
+
+    Raises:
+    PermanentFetchError: If the cached body is not valid JSON.
+    """
+    try:
+        return json.loads(entry.body)
+    except ValueError as e:
+        raise PermanentFetchError(error_message, url) from e
+
+
+def _get_json(url, error_message, session=None, endpoint=None):
+    """
+    Sends a GET request and returns the decoded JSON body.
+
+    If a response cache is set, a fresh cached response is returned without any request,
+    and a stale one is revalidated with the validators the server sent with it.
+    Every request waits for the rate limiter and transient failures are retried
+    according to the retry policy.
+
+    Parameters:
+    url (str): The URL to fetch.
+    error_message (str): The message of the exception raised on failure.
+    session (requests.Session): The session to use, the shared one by default.
+    endpoint (str): The name of the endpoint, selecting its time to live in the cache.
+
+    Returns:
+    list or dict: The decoded JSON response.
+
+    Raises:
+    TransientFetchError: If the request still timed out, lost its connection, received a truncated body,
+                         was throttled or failed on the server after all retries.
+    PermanentFetchError: If the API rejected the request, the request itself was invalid (e.g. too many
+                         redirects) or the body is not valid JSON.
+    """
+    cache = _cache
+    entry = cache.lookup(url) if cache else None
+    if entry is not None and cache.is_fresh(entry, endpoint):
+        cache.record('hits')
+        metrics.count('http.cache.hits')
+        return _cached_json(entry, error_message, url)
+
+    headers = {}
+    if entry is not None and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry is not None and entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+
+    session = session or get_session()
+    policy = retry_policy
+    for attempt in range(policy.retries + 1):
+        limiter = rate_limiter
+        if limiter:
+            limiter.acquire()
+        retry_after = None
+        metrics.count('http.requests')
+        try:
+            with metrics.timer(f'http.{endpoint or "request"}'):
+                response = session.get(url, headers=headers, timeout=policy.timeout)
+        except _TRANSIENT_EXCEPTIONS as e:
+            error = TransientFetchError(f"{error_message}: {e.__class__.__name__}", url)
+            error.__cause__ = e
+        except requests.RequestException as e:
+            metrics.count('http.errors')
+            raise PermanentFetchError(f"{error_message}: {e.__class__.__name__}", url) from e
+        else:
+            if response.status_code == 304 and entry is not None:
+                if limiter:
+                    limiter.on_success()
+                cache.touch(url)
+                cache.record('revalidations')
+                metrics.count('http.cache.revalidations')
+                return _cached_json(entry, error_message, url)
+            if response.status_code == 200:
+                metrics.count('http.bytes_received', len(response.content))
+                try:
+                    data = response.json()
+                except ValueError as e:
+                    if not _truncated(response):
+                        metrics.count('http.errors')
+                        raise PermanentFetchError(error_message, url, response.status_code) from e
+                    # A body cut off on the way is downloaded again.
+                    error = TransientFetchError(f"{error_message}: truncated body", url, response.status_code)
+                    error.__cause__ = e
+                else:
+                    if limiter:
+                        limiter.on_success()
+                    if cache:
+                        cache.store(url, response.content, response.headers.get('ETag'),
+                                    response.headers.get('Last-Modified'))
+                        cache.record('misses')
+                        metrics.count('http.cache.misses')
+                    return data
+            elif response.status_code not in policy.retry_statuses:
+                metrics.count('http.errors')
+                raise PermanentFetchError(error_message, url, response.status_code)
+            else:
+                if response.status_code == 429 and limiter:
+                    limiter.on_throttled()
+                retry_after = _retry_after(response)
+                error = TransientFetchError(error_message, url, response.status_code)
+        metrics.count('http.errors')
+        if attempt < policy.retries:
+            metrics.count('http.retries')
+            time.sleep(policy.delay(attempt, retry_after))
+    raise error
+
 
-def fetch_station():
+def fetch_station(session=None):
     """
     Fetches all air quality monitoring stations data from the API.
 
     Sends a GET request to the API to retrieve data about all available stations.
 
+    Parameters:
+    session (requests.Session): The session to use, the shared one by default.
+
     Returns:
     list: A list of dictionaries containing station data if the request is successful.
 
     Raises:
-    Exception: If the request fails or returns a status code other than 200.
+    FetchError: If the request fails or returns a status code other than 200.
     """
-    url = "https://powietrze.gios.gov.pl/pjp-api/rest/station/findAll"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception("Failed to fetch station data")
+    url = f"{BASE_URL}/station/findAll"
+    return _get_json(url, "Failed to fetch station data", session, 'stations')
 
-def fetch_sensor(station_id):
+def fetch_sensor(station_id, session=None):
     """
     Fetches sensor data for a specific station from the API.
 
@@ -27,21 +396,18 @@ def fetch_sensor(station_id):
 
     Parameters:
     station_id (int): The ID of the station for which to fetch the sensors.
+    session (requests.Session): The session to use, the shared one by default.
 
     Returns:
     list: A list of dictionaries containing sensor data if the request is successful.
 
     Raises:
-    Exception: If the request fails or returns a status code other than 200.
+    FetchError: If the request fails or returns a status code other than 200.
     """
-    url = f"https://powietrze.gios.gov.pl/pjp-api/rest/station/sensors/{station_id}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception("Failed to fetch sensor data")
+    url = f"{BASE_URL}/station/sensors/{station_id}"
+    return _get_json(url, "Failed to fetch sensor data", session, 'sensors')
 
-def fetch_measurement(sensor_id):
+def fetch_measurement(sensor_id, session=None):
     """
     Fetches measurement data for a specific sensor from the API.
 
@@ -49,16 +415,142 @@ def fetch_measurement(sensor_id):
 
     Parameters:
     sensor_id (int): The ID of the sensor for which to fetch the measurements.
+    session (requests.Session): The session to use, the shared one by default.
 
     Returns:
     dict: A dictionary containing the measurement data if the request is successful.
 
     Raises:
-    Exception: If the request fails or returns a status code other than 200.
-    """
-    url = f"https://powietrze.gios.gov.pl/pjp-api/rest/data/getData/{sensor_id}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception("Failed to fetch measurement data")
+    FetchError: If the request fails or returns a status code other than 200.
+    """
+    url = f"{BASE_URL}/data/getData/{sensor_id}"
+    return _get_json(url, "Failed to fetch measurement data", session, 'measurements')
+
+def fetch_index(station_id, session=None):
+    """
+    Fetches the current air quality index of a specific station from the API.
+
+    Sends a GET request to retrieve the index computed for a given station, with its overall level
+    ('stIndexLevel') and the levels of the individual pollutants.
+
+    Parameters:
+    station_id (int): The ID of the station for which to fetch the index.
+    session (requests.Session): The session to use, the shared one by default.
+
+    Returns:
+    dict: A dictionary containing the index data if the request is successful.
+
+    Raises:
+    FetchError: If the request fails or returns a status code other than 200.
+    """
+    url = f"{BASE_URL}/aqindex/getIndex/{station_id}"
+    return _get_json(url, "Failed to fetch air quality index", session, 'index')
+
+########################################################################
+#################SECTION THAT FETCHES IN BULK###########################
+########################################################################
+
+_FETCHERS = {
+    'sensors': fetch_sensor,
+    'measurements': fetch_measurement,
+    'index': fetch_index,
+}
+
+
+def _run(executor, session, kind, key):
+    """
+    Submits a single fetch to the executor and returns its future.
+    """
+    return executor.submit(_FETCHERS[kind], key, session)
+
+
+def _stream(pending):
+    """
+    Yields the finished futures from 'pending' (a dict future -> (kind, key)) as they complete.
+    The dict may be extended by the consumer between iterations.
+    """
+    while pending:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, key = pending.pop(future)
+            try:
+                result = FetchResult(kind, key, future.result(), None)
+            except Exception as e:
+                result = FetchResult(kind, key, None, e)
+            yield result
+
+
+def _cancel(pending):
+    """
+    Cancels the futures that have not started yet.
+    """
+    for future in pending:
+        future.cancel()
+
+
+def fetch_many(kind, keys, concurrency=DEFAULT_CONCURRENCY, session=None):
+    """
+    Fetches sensors or measurements for many stations or sensors concurrently.
+
+    Results are yielded as soon as each request finishes, so their order is not the order of 'keys'.
+    A failed request does not stop the others, its exception is reported in the 'error' field.
+
+    Parameters:
+    kind (str): 'sensors' to call fetch_sensor, 'measurements' to call fetch_measurement or 'index' to call fetch_index.
+    keys (iterable): The station or sensor IDs to fetch.
+    concurrency (int): The maximum number of requests in flight.
+    session (requests.Session): The session to use, the shared one by default.
+
+    Yields:
+    FetchResult: The result of each request.
+    """
+    session = session or get_session()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {_run(executor, session, kind, key): (kind, key) for key in keys}
+        try:
+            yield from _stream(pending)
+        finally:
+            _cancel(pending)
+
+
+def fetch_all(station_ids=None, concurrency=DEFAULT_CONCURRENCY, session=None, measurements=True):
+    """
+    Fetches sensors and measurements for many stations concurrently.
+
+    When no station IDs are given, the list of all stations is fetched first and yielded as
+    a 'stations' result. The sensors of every station are then fetched, and as soon as the
+    sensors of a station arrive, the measurements of each of its sensors are requested, unless
+    'measurements' is False, e.g. when they are synchronized incrementally afterwards.
+    At most 'concurrency' requests run at the same time over one pooled session.
+
+    Parameters:
+    station_ids (iterable): The IDs of the stations to fetch, all stations by default.
+    concurrency (int): The maximum number of requests in flight.
+    session (requests.Session): The session to use, the shared one by default.
+    measurements (bool): Whether to fetch the measurements of every sensor.
+
+    Yields:
+    FetchResult: The result of each request, in order of completion.
+    """
+    session = session or get_session()
+    if station_ids is None:
+        try:
+            stations = fetch_station(session)
+        except Exception as e:
+            yield FetchResult('stations', None, None, e)
+            return
+        yield FetchResult('stations', None, stations, None)
+        station_ids = [station['id'] for station in stations]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {_run(executor, session, 'sensors', station_id): ('sensors', station_id)
+                   for station_id in station_ids}
+        try:
+            for result in _stream(pending):
+                if measurements and result.kind == 'sensors' and result.error is None:
+                    for sensor in result.data:
+                        future = _run(executor, session, 'measurements', sensor['id'])
+                        pending[future] = ('measurements', sensor['id'])
+                yield result
+        finally:
+            _cancel(pending)
@@ -1,12 +1,95 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import matplotlib.dates as md
 
+from . import metrics
+from .database_manager import DEFAULT_SERIES_POINTS
+
+
+# Downsampling methods accepted by Visualize_data.draw().
+DOWNSAMPLING_METHODS = ('minmax', 'lttb', None)
+# Format of the dates returned by the database and the API.
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def lttb(x, y, threshold):
+    """
+    Selects the points of a series to draw with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept, the others are split into threshold - 2 buckets of equal size,
+    and from every bucket the point forming the largest triangle with the point chosen in the previous
+    bucket and the mean of the next bucket is kept. The shape of the series is preserved far better
+    than by taking every n-th point.
+
+    Parameters:
+    x (numpy.ndarray): The x coordinates as numbers, in increasing order.
+    y (numpy.ndarray): The y coordinates, without NaN.
+    threshold (int): The number of points to keep.
+
+    Returns:
+    numpy.ndarray: The indices of the kept points, in increasing order.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket i holds the points edges[i] to edges[i + 1], the last point is a bucket of its own.
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    counts = np.diff(np.append(edges, n))
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_per_pixel(x, y, pixels):
+    """
+    Selects the points of a series to draw by keeping the lowest and highest point of every pixel column.
+
+    A line drawn through the kept points covers exactly the same pixels as the full series,
+    so no peak is lost, with at most four points per pixel column.
+
+    Parameters:
+    x (numpy.ndarray): The x coordinates as numbers, in increasing order.
+    y (numpy.ndarray): The y coordinates, without NaN.
+    pixels (int): The width of the plot in pixels.
+
+    Returns:
+    numpy.ndarray: The indices of the kept points, in increasing order.
+    """
+    n = len(x)
+    if n <= 4 * pixels:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    starts = np.unique(np.searchsorted(x, np.linspace(x[0], x[-1], pixels + 1)[:-1]))
+    column = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    lowest = np.flatnonzero(y == np.minimum.reduceat(y, starts)[column])
+    highest = np.flatnonzero(y == np.maximum.reduceat(y, starts)[column])
+    # The first minimum and maximum of every column, plus its first and last point.
+    lowest = lowest[np.unique(column[lowest], return_index=True)[1]]
+    highest = highest[np.unique(column[highest], return_index=True)[1]]
+    return np.unique(np.concatenate([starts, np.append(starts[1:] - 1, n - 1), lowest, highest]))
+
 
 class Visualize_data:
     """
     A class used to visualize air quality data by creating plots of sensor measurements over time.
     """
+    @metrics.timed('visualize.parse')
     def __init__(self, data):
         """
         Initializes the Visualize_data class by creating a pandas DataFrame from the input data.
@@ -25,12 +108,118 @@ class Visualize_data:
         if len(self.data.columns) == 4:
             self.data.columns = ['station_id', 'sensor_id', 'date', 'value']
 
-    def plot_data(self, param):
+        # Parse the dates once, not on every drawing
+        if 'date' in self.data and not pd.api.types.is_datetime64_any_dtype(self.data['date']):
+            try:
+                self.data['date'] = pd.to_datetime(self.data['date'], format=DATE_FORMAT)
+            except ValueError:
+                self.data['date'] = pd.to_datetime(self.data['date'])
+
+        # Rollup resolution of the data when read with from_database()
+        self.resolution = None
+
+    @classmethod
+    def from_database(cls, db_manager, sensor_id, start=None, end=None, max_points=DEFAULT_SERIES_POINTS,
+                      cache=None):
+        """
+        Creates a visualizer of the values of a sensor at the rollup resolution fitting the range,
+        see DatabaseManager.fetch_series(). The chosen resolution is kept in the 'resolution' attribute.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the values are read from.
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        max_points (int): The maximum number of points wanted.
+        cache (SeriesCache): A cache serving the readings of short ranges from memory,
+                             see SeriesCache.fetch_series().
+
+        Returns:
+        Visualize_data: The visualizer.
+        """
+        if cache is not None:
+            resolution, series = cache.fetch_series(sensor_id, start, end, max_points)
+        else:
+            resolution, series = db_manager.fetch_series(sensor_id, start, end, max_points, as_arrays=True)
+        # The dates are already datetime64 values, so they are not parsed again,
+        # and the frame uses the arrays as they are, without copying them.
+        visualizer = cls(pd.DataFrame({'station_id': None, 'sensor_id': sensor_id, 'date': series['date'],
+                                       'value': series['value']}, copy=False))
+        visualizer.resolution = resolution
+        return visualizer
+
+    @metrics.timed('visualize.downsample')
+    def points(self, param, pixels, method='minmax'):
+        """
+        Returns the points of the specified parameter worth drawing on a plot 'pixels' wide.
+        Rows without a value are skipped.
+
+        Parameters:
+        param (str): The name of the column to plot (typically 'value').
+        pixels (int): The width of the plot in pixels.
+        method (str): 'minmax' to keep the extremes of every pixel column, 'lttb' to keep about one point
+                      per pixel with the Largest-Triangle-Three-Buckets algorithm, None to keep every point.
+
+        Returns:
+        tuple: The dates (numpy.ndarray of datetime64) and the values (numpy.ndarray of float64).
+
+        Raises:
+        ValueError: If the method is unknown.
+        """
+        if method not in DOWNSAMPLING_METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        data = self.data[['date', param]].dropna()
+        dates = data['date'].to_numpy()
+        values = data[param].to_numpy(dtype=np.float64)
+        if method is not None and len(dates) > pixels:
+            if not (np.diff(dates) >= np.timedelta64(0)).all():
+                order = np.argsort(dates, kind='stable')
+                dates, values = dates[order], values[order]
+            x = (dates - dates[0]) / np.timedelta64(1, 's')
+            downsample = minmax_per_pixel if method == 'minmax' else lttb
+            indices = downsample(x, values, pixels)
+            dates, values = dates[indices], values[indices]
+        return dates, values
+
+    @metrics.timed('visualize.draw')
+    def draw(self, ax, param, method='minmax', title='Graph'):
+        """
+        Draws the specified parameter over time on a matplotlib Axes, downsampled to its width in pixels.
+
+        Parameters:
+        ax (matplotlib.axes.Axes): The axes to draw on.
+        param (str): The name of the column to plot (typically 'value').
+        method (str): The downsampling method, see points().
+        title (str): The title of the graph.
+
+        Returns:
+        matplotlib.lines.Line2D: The drawn line.
+        """
+        pixels = max(int(ax.get_window_extent().width), 1)
+        dates, values = self.points(param, pixels, method)
+        line, = ax.plot(dates, values)
+
+        # Title for axes and graph
+        ax.set_xlabel('Date')  # X axis
+        ax.set_ylabel('Value')  # Y axis
+        ax.set_title(title)  # Title of graph
+
+        # Date formatting, the number of ticks and their labels adapt to the range of dates
+        locator = md.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(md.ConciseDateFormatter(locator))
+        return line
+
+    @metrics.timed('visualize.plot')
+    def plot_data(self, param, method='minmax'):
         """
         Plots the specified parameter from the dataset over time.
 
+        Long series are downsampled to the width of the figure, see points().
+
         Parameters:
         param (str): The name of the column to plot (typically 'value').
+        method (str): The downsampling method, see points().
 
         Returns:
         None: Displays the plot but does not return any value.
@@ -41,20 +230,7 @@ class Visualize_data:
             return
 
         # Create a graph
-        plt.plot(self.data['date'], self.data[param])
-
-        # Title for axes and graph
-        plt.xlabel('Date')  # X axis
-        plt.ylabel('Value')  # Y axis
-        plt.title('Graph')  # Title of graph
-
-        # Date formatting
-        plt.gca().xaxis.set_major_locator(md.AutoDateLocator())
-        # plt.gca().xaxis.set_major_formatter(md.DateFormatter('%Y-%m-%d %H:%M')) #includes hourly data
-        plt.gca().xaxis.set_major_formatter(md.DateFormatter('%Y-%m-%d')) #without hourly data
-
-        # View every 5th data point on the x-axis
-        plt.xticks(self.data['date'][::5], rotation=90)
+        self.draw(plt.gca(), param, method)
 
         # View graph
         plt.tight_layout()  # Poprawa układu wykresu
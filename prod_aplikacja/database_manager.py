@@ -1,17 +1,268 @@
+import math
 import sqlite3
+import threading
+import warnings
+from contextlib import contextmanager, nullcontext
+
+from . import metrics
+from .rollups import (RESOLUTIONS, TABLES, bucket, choose_resolution, create_rollup_tables, from_epoch, to_epoch,
+                      update_rollups)
+
+
+def _deduplicate_measurements(c):
+    """
+    Removes duplicated (sensorId, date) measurements and adds a unique key on these columns.
+    Of every group of duplicates the most recently inserted row with a value is kept.
+    """
+    c.execute('''
+    DELETE FROM measurements WHERE id NOT IN (
+        SELECT COALESCE(MAX(CASE WHEN value IS NOT NULL THEN id END), MAX(id))
+        FROM measurements
+        GROUP BY sensorId, date
+    )
+    ''')
+    c.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_measurements_sensor_date ON measurements (sensorId, date)
+    ''')
+
+
+def _create_read_indexes(c):
+    """
+    Creates the secondary indexes used by the fetch methods.
+    The measurements index also holds the values, so reading a sensor's history never touches the table.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS idx_stations_name ON stations (stationName)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sensors_station ON sensors (stationId)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_measurements_sensor_date_value ON measurements (sensorId, date, value)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_air_quality_index_station ON air_quality_index (stationId)')
+
+
+def _deduplicate_air_quality_index(c):
+    """
+    Removes duplicated (stationId, stCalcDate) indices, keeping the most recently inserted one,
+    and adds a unique key on these columns. The key also finds the latest index of a station.
+    """
+    c.execute('''
+    DELETE FROM air_quality_index WHERE id NOT IN (
+        SELECT MAX(id) FROM air_quality_index GROUP BY stationId, stCalcDate
+    )
+    ''')
+    c.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_air_quality_index_station_date ON air_quality_index (stationId, stCalcDate)
+    ''')
+
+
+def _superseded(c):
+    """
+    A migration replaced by a later one, kept so that the schema versions of existing databases keep their meaning.
+    """
+
+
+def _epoch_timestamps(c):
+    """
+    Stores the dates of the measurements, the rollups and the air quality indices as whole seconds since
+    the epoch instead of text, see rollups.to_epoch(). The measurements become a table without row IDs
+    keyed on (sensorId, ts) which also holds the values, so one B-tree replaces the table and its two indexes.
+
+    Measurements whose date SQLite cannot read have no number of seconds and cannot stay in the table.
+    They are moved as they were to the table measurements_invalid_dates (sensorId, date, value), created
+    only when there are any, and a warning gives their number. Index dates that cannot be read become NULL.
+    """
+    c.execute('''
+    CREATE TABLE measurements_epoch (
+        sensorId INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        value REAL,
+        PRIMARY KEY (sensorId, ts),
+        FOREIGN KEY(sensorId) REFERENCES sensors(id)
+    ) WITHOUT ROWID
+    ''')
+    # Of dates written differently but meaning the same second, the most recently inserted one with a value is kept.
+    c.execute('''
+    INSERT OR REPLACE INTO measurements_epoch (sensorId, ts, value)
+    SELECT sensorId, CAST(strftime('%s', date) AS INTEGER), value FROM measurements
+    WHERE strftime('%s', date) IS NOT NULL
+    ORDER BY value IS NOT NULL, id
+    ''')
+    invalid = c.execute("SELECT COUNT(*) FROM measurements WHERE strftime('%s', date) IS NULL").fetchone()[0]
+    if invalid:
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS measurements_invalid_dates (sensorId INTEGER, date TEXT, value REAL)
+        ''')
+        c.execute('''
+        INSERT INTO measurements_invalid_dates (sensorId, date, value)
+        SELECT sensorId, date, value FROM measurements WHERE strftime('%s', date) IS NULL ORDER BY id
+        ''')
+        warnings.warn(f"{invalid} measurements with unreadable dates were moved to measurements_invalid_dates",
+                      stacklevel=2)
+    c.execute('DROP TABLE measurements')
+    c.execute('ALTER TABLE measurements_epoch RENAME TO measurements')
+
+    c.execute('''
+    CREATE TABLE air_quality_index_epoch (
+        id INTEGER PRIMARY KEY,
+        stationId INTEGER,
+        stCalcDate INTEGER,
+        stIndexLevel INTEGER,
+        indexLevelName TEXT,
+        stSourceDataDate INTEGER,
+        FOREIGN KEY(stationId) REFERENCES stations(id)
+    )
+    ''')
+    c.execute('''
+    INSERT INTO air_quality_index_epoch
+    SELECT id, stationId, CAST(strftime('%s', stCalcDate) AS INTEGER), stIndexLevel, indexLevelName,
+           CAST(strftime('%s', stSourceDataDate) AS INTEGER)
+    FROM air_quality_index
+    ''')
+    c.execute('DROP TABLE air_quality_index')
+    c.execute('ALTER TABLE air_quality_index_epoch RENAME TO air_quality_index')
+    c.execute('CREATE INDEX idx_air_quality_index_station ON air_quality_index (stationId)')
+    _deduplicate_air_quality_index(c)
+
+    for table in TABLES.values():
+        c.execute(f'DROP TABLE IF EXISTS {table}')
+    create_rollup_tables(c)
+
+
+# Schema migrations, applied in order on top of the tables created by create_tables.
+# The position of a migration in the list is the schema version it upgrades to,
+# the current version of a database is kept in its 'user_version' pragma.
+MIGRATIONS = [
+    _deduplicate_measurements,
+    _create_read_indexes,
+    _superseded,  # created the rollup tables with text dates, now done by _epoch_timestamps
+    _deduplicate_air_quality_index,
+    _epoch_timestamps,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Statistics aggregate() can compute, and the ones it computes by default.
+AGGREGATE_STATS = ('count', 'min', 'max', 'mean', 'std', 'trend', 'slope')
+DEFAULT_AGGREGATE_STATS = ('count', 'min', 'max', 'mean', 'trend')
+
+# The maximum number of points fetch_series() returns by default.
+DEFAULT_SERIES_POINTS = 2000
+
+
+def series_resolution(span, start, end, max_points):
+    """
+    Chooses the resolution of a series, see fetch_series().
+
+    Parameters:
+    span (tuple): The stored dates of the oldest and newest known values of the sensor.
+    start (int): The stored date the series starts at, None for the oldest value.
+    end (int): The stored date the series ends before, None for no limit.
+    max_points (int): The maximum number of points wanted.
+
+    Returns:
+    str: One of RESOLUTIONS.
+    """
+    first, last = span
+    return choose_resolution(from_epoch(max(first, start or first)), from_epoch(min(last, end or last)), max_points)
+
+# The columns of the 'measurements' table iter_measurements() can return, with the NumPy type of their arrays.
+MEASUREMENT_COLUMNS = {'sensorId': 'int64', 'date': 'datetime64[s]', 'value': 'float64'}
+# The stored column of every name, the dates being kept in the 'ts' column as seconds since the epoch.
+_MEASUREMENT_SQL = {'sensorId': 'sensorId', 'date': 'ts', 'value': 'value'}
+# The columns of a measurement as returned by the fetch methods, with the date as a string.
+# Measurements have no ID of their own, the column is kept as NULL so that the rows keep their shape.
+_MEASUREMENT_ROW = "NULL, sensorId, datetime(ts, 'unixepoch'), value"
+# The columns of an air quality index as returned by the fetch methods, with the dates as strings.
+_INDEX_ROW = ("a.id, a.stationId, datetime(a.stCalcDate, 'unixepoch'), a.stIndexLevel, a.indexLevelName, "
+              "datetime(a.stSourceDataDate, 'unixepoch')")
+
+# The number of measurements iter_measurements() reads at a time by default.
+DEFAULT_CHUNK_SIZE = 65536
+# The tables that can be read whole with iter_table(), with the columns of their keys.
+_TABLE_KEYS = {'stations': 'id', 'sensors': 'id', 'measurements': 'sensorId, ts'}
+
 
 class DatabaseManager:
     """
     A class to manage the air quality database.
     """
-    def __init__(self, db_name='air_quality.db'):
+    def __init__(self, db_name='air_quality.db', wal=False, cache_size_kib=None, timeout=30.0):
         """
         Initializes the DatabaseManager class.
+
+        The manager can be shared between threads. Every thread reads through its own connection,
+        while writes are serialized so that there is only one writer at a time. An in-memory database
+        exists only within one connection, so it is shared by all threads and every access is serialized.
+
         Parameters:
             db_name (str): The name of the database.
+            wal (bool): Whether to use the write-ahead log, which lets readers run while a write is in progress.
+                        The 'synchronous' pragma is lowered to NORMAL, which is safe in this mode.
+            cache_size_kib (int): The size of the page cache of every connection in KiB, the SQLite default if None.
+            timeout (float): How many seconds a connection waits for a lock held by another connection.
+        """
+        self.db_name = db_name
+        self.wal = wal
+        self.cache_size_kib = cache_size_kib
+        self.timeout = timeout
+        self._shared = db_name == ':memory:'
+        self._local = threading.local()
+        self._connections = []
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._read_lock = self._write_lock if self._shared else nullcontext()
+        self._shared_conn = self._connect() if self._shared else None
+        self._bulk_depth = 0
+        self._changed_tables = set()
+        self._written_sensors = {}
+        self._insert_listeners = []
+        self._measurement_listeners = []
+        if wal and not self._shared:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        # A database already at the current schema version needs neither the DDL nor the migrations.
+        if self.schema_version() != SCHEMA_VERSION:
+            self.create_tables()
+
+########################################################################
+#################SECTION THAT MANAGES CONNECTIONS#######################
+########################################################################
+
+    def _connect(self):
+        """
+        Opens a new connection with the configured pragmas and adds it to the pool.
+
+        Returns:
+        sqlite3.Connection: The new connection.
         """
-        self.conn = sqlite3.connect(db_name)
-        self.create_tables()
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, check_same_thread=False)
+        if self.wal:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        if self.cache_size_kib:
+            conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        with self._pool_lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def conn(self):
+        """
+        The connection of the calling thread, opened on first use.
+        """
+        if self._shared:
+            return self._shared_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def release_connection(self):
+        """
+        Closes the connection of the calling thread, e.g. before a worker thread exits.
+        The thread will open a new connection if it uses the manager again.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._pool_lock:
+                self._connections.remove(conn)
+            conn.close()
 
     def create_tables(self):
         """
@@ -76,10 +327,112 @@ class DatabaseManager:
         # commit changes
         self.conn.commit()
 
+        self.migrate()
+
+    def schema_version(self):
+        """
+        Returns the schema version of the database.
+
+        Returns:
+        int: The number of migrations applied to the database.
+        """
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        """
+        Applies the schema migrations the database has not seen yet.
+        Every migration runs in its own transaction together with the update of the schema version.
+        The transaction takes the write lock of the database before the version is read, so when
+        several processes open the database at once, every migration is applied by only one of them.
+        """
+        with self._write_lock:
+            while True:
+                c = self.conn.cursor()
+                try:
+                    c.execute("BEGIN IMMEDIATE")
+                    version = self.schema_version()
+                    if version >= len(MIGRATIONS):
+                        self.conn.commit()
+                        return
+                    MIGRATIONS[version](c)
+                    c.execute(f"PRAGMA user_version = {version + 1}")
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+
 ########################################################################
 #################SECTION THAT INSERTS DATA##############################
 ########################################################################
 
+    @contextmanager
+    def bulk(self):
+        """
+        Groups all inserts made inside the 'with' block into a single transaction.
+
+        The insert methods do not commit inside the block, the whole batch is committed once when
+        the block exits, or rolled back if it raises. Blocks can be nested, only the outermost one commits.
+        Writes from other threads wait until the block exits.
+
+        Example:
+            with db_manager.bulk():
+                db_manager.insert_stations(stations)
+                db_manager.insert_sensors(sensors)
+        """
+        with self._write_lock:
+            self._bulk_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._bulk_depth -= 1
+                if self._bulk_depth == 0:
+                    self.conn.rollback()
+                    self._changed_tables.clear()
+                    self._written_sensors.clear()
+                raise
+            self._bulk_depth -= 1
+            self._commit()
+
+    def _commit(self):
+        """
+        Commits the current transaction unless it is part of a bulk() block,
+        then notifies the insert listeners about the tables it changed
+        and the measurement listeners about the sensors it wrote values of.
+        """
+        if self._bulk_depth == 0:
+            self.conn.commit()
+            tables, self._changed_tables = self._changed_tables, set()
+            written, self._written_sensors = self._written_sensors, {}
+            for table in tables:
+                for listener in self._insert_listeners:
+                    listener(table)
+            for sensor_id, (first, last) in written.items():
+                for listener in self._measurement_listeners:
+                    listener(sensor_id, first, last)
+
+    def add_insert_listener(self, listener):
+        """
+        Registers a function called with a table name after new rows in that table have been committed.
+        It is used to invalidate data cached from the database. The listener is called while the
+        write lock is held, so it must be quick and must not wait for other threads.
+
+        Parameters:
+        listener (callable): A function taking the table name.
+        """
+        self._insert_listeners.append(listener)
+
+    def add_measurement_listener(self, listener):
+        """
+        Registers a function called for every sensor whose known values were written, after they have been
+        committed, with the sensor ID and the first and last written dates as stored (seconds since the epoch).
+        It is used to update the series cached from the database. Like an insert listener it is called
+        while the write lock is held, so it must be quick and must not wait for other threads.
+
+        Parameters:
+        listener (callable): A function taking the sensor ID and the two dates.
+        """
+        self._measurement_listeners.append(listener)
+
     def insert_station(self, station_data):
         """
         Inserts a new station record into the 'stations' table if it does not already exist.
@@ -87,43 +440,78 @@ class DatabaseManager:
         Parameters:
         station_data (tuple): A tuple containing the station data.
         """
-        c = self.conn.cursor()
-        c.execute('''
-        INSERT OR IGNORE INTO stations (id, stationName, gegrLat, gegrLon, cityId, addressStreet)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', station_data)
-        self.conn.commit()
+        self.insert_stations([station_data])
 
+    @metrics.timed('db.insert_stations')
+    def insert_stations(self, stations):
+        """
+        Inserts new station records into the 'stations' table in one batch if they do not already exist.
+
+        Parameters:
+        stations (iterable): Tuples containing the station data, a generator is accepted.
+        """
+        with self._write_lock:
+            c = self.conn.cursor()
+            c.executemany('''
+            INSERT OR IGNORE INTO stations (id, stationName, gegrLat, gegrLon, cityId, addressStreet)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', stations)
+            self._changed_tables.add('stations')
+            self._commit()
+
+    @metrics.timed('db.insert_sensors')
     def insert_sensors(self, sensors):
         """
-        Inserts new sensor records into the 'sensors' table if they do not already exist.
+        Inserts new sensor records into the 'sensors' table in one batch if they do not already exist.
 
         Parameters:
-        sensors (list): A list of dictionaries containing sensor data.
+        sensors (iterable): Dictionaries containing sensor data, a generator is accepted.
         """
-        c = self.conn.cursor()
-        for sensor in sensors:
-            c.execute('''
+        with self._write_lock:
+            c = self.conn.cursor()
+            c.executemany('''
             INSERT OR IGNORE INTO sensors (id, stationId, paramName, paramFormula, paramCode, idParam)
             VALUES (?, ?, ?, ?, ?, ?)
-            ''', (sensor['id'], sensor['stationId'], sensor['param']['paramName'], sensor['param']['paramFormula'], sensor['param']['paramCode'], sensor['param']['idParam']))
-        self.conn.commit()
+            ''', ((sensor['id'], sensor['stationId'], sensor['param']['paramName'], sensor['param']['paramFormula'],
+                   sensor['param']['paramCode'], sensor['param']['idParam']) for sensor in sensors))
+            self._changed_tables.add('sensors')
+            self._commit()
 
+    @metrics.timed('db.insert_measurements')
     def insert_measurements(self, measurements, sensor_id):
         """
-        Inserts new measurement records into the 'measurements' table if they do not already exist.
+        Inserts new measurement records into the 'measurements' table in one batch.
+
+        A measurement is identified by its sensor and date. If it is already stored, only its value is
+        updated, and only when the new value is known, so repeated downloads do not grow the table.
+        The rollup buckets touched by the new values are recomputed in the same transaction.
 
         Parameters:
-        measurements (dict): A dictionary containing measurement data.
+        measurements (dict): A dictionary containing measurement data, the dates as strings, datetimes
+                             or seconds since the epoch.
         sensor_id (int): The ID of the sensor to which the measurements belong.
         """
-        c = self.conn.cursor()
-        for measurement in measurements['values']:
-            c.execute('''
-            INSERT OR IGNORE INTO measurements (sensorId, date, value)
+        rows = [(sensor_id, to_epoch(measurement['date']), measurement['value'])
+                for measurement in measurements['values']]
+        with self._write_lock:
+            c = self.conn.cursor()
+            c.executemany('''
+            INSERT INTO measurements (sensorId, ts, value)
             VALUES (?, ?, ?)
-            ''', (sensor_id, measurement['date'], measurement['value']))
-        self.conn.commit()
+            ON CONFLICT (sensorId, ts) DO UPDATE SET value = excluded.value
+            WHERE excluded.value IS NOT NULL
+            ''', rows)
+            metrics.count('db.rows_written', c.rowcount)
+            dates = [date for _, date, value in rows if value is not None]
+            if dates:
+                first, last = min(dates), max(dates)
+                update_rollups(c, sensor_id, first, last)
+                if sensor_id in self._written_sensors:
+                    written = self._written_sensors[sensor_id]
+                    first, last = min(first, written[0]), max(last, written[1])
+                self._written_sensors[sensor_id] = (first, last)
+            self._changed_tables.add('measurements')
+            self._commit()
 
     def insert_air_quality_index(self, index_data):
         """
@@ -132,17 +520,47 @@ class DatabaseManager:
         Parameters:
         index_data (tuple): A tuple containing the air quality index data (id, stationId, stCalcDate, stIndexLevel, indexLevelName, stSourceDataDate).
         """
-        c = self.conn.cursor()
-        c.execute('''
-        INSERT OR IGNORE INTO air_quality_index (id, stationId, stCalcDate, stIndexLevel, indexLevelName, stSourceDataDate)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', index_data)
-        self.conn.commit()
+        with self._write_lock:
+            c = self.conn.cursor()
+            c.execute('''
+            INSERT OR IGNORE INTO air_quality_index (id, stationId, stCalcDate, stIndexLevel, indexLevelName, stSourceDataDate)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (*index_data[:2], to_epoch(index_data[2]), *index_data[3:5], to_epoch(index_data[5])))
+            self._changed_tables.add('air_quality_index')
+            self._commit()
+
+    @metrics.timed('db.insert_air_quality_indices')
+    def insert_air_quality_indices(self, indices):
+        """
+        Inserts station indices returned by the API into the 'air_quality_index' table in one batch.
+        An index already stored for the same station and calculation date is kept, and indices
+        the API has not calculated (without 'stCalcDate') are skipped.
+
+        Parameters:
+        indices (iterable): Dictionaries containing index data, a generator is accepted.
+
+        Returns:
+        int: The number of new indices stored.
+        """
+        with self._write_lock:
+            c = self.conn.cursor()
+            before = self.conn.total_changes
+            c.executemany('''
+            INSERT OR IGNORE INTO air_quality_index (stationId, stCalcDate, stIndexLevel, indexLevelName, stSourceDataDate)
+            VALUES (?, ?, ?, ?, ?)
+            ''', ((index['id'], to_epoch(index['stCalcDate']), (index.get('stIndexLevel') or {}).get('id'),
+                   (index.get('stIndexLevel') or {}).get('indexLevelName'), to_epoch(index.get('stSourceDataDate')))
+                  for index in indices if index.get('stCalcDate')))
+            inserted = self.conn.total_changes - before
+            self._changed_tables.add('air_quality_index')
+            self._commit()
+            return inserted
 
 ########################################################################
 #################SECTION THAT DOWNLOADS DATA############################
 ########################################################################
 
+    @metrics.timed('db.fetch_stations')
     def fetch_stations(self):
         """
         Fetches all station records from the 'stations' table and returns them.
@@ -150,11 +568,13 @@ class DatabaseManager:
         Returns:
         list: A list of tuples, where each tuple contains a station record.
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM stations ORDER BY stationName ASC")
-        stations = c.fetchall()
-        return stations
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute("SELECT * FROM stations ORDER BY stationName ASC")
+            stations = c.fetchall()
+            return stations
 
+    @metrics.timed('db.fetch_sensors')
     def fetch_sensors(self, station_id):
         """
         Fetches all sensor records for a given station ID from the 'sensors' table.
@@ -165,10 +585,12 @@ class DatabaseManager:
         Returns:
         list: A list of tuples, where each tuple contains a sensor record.
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM sensors WHERE stationId=?", (station_id,))
-        return c.fetchall()
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute("SELECT * FROM sensors WHERE stationId=?", (station_id,))
+            return c.fetchall()
 
+    @metrics.timed('db.fetch_measurements')
     def fetch_measurements(self, sensor_id):
         """
         Fetches all measurement records for a given sensor ID from the 'measurements' table.
@@ -177,12 +599,341 @@ class DatabaseManager:
         sensor_id (int): The ID of the sensor for which to fetch measurements.
 
         Returns:
-        list: A list of tuples, where each tuple contains a measurement record.
+        list: A list of tuples (None, sensorId, date, value) in time order, the date as a string.
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM measurements WHERE sensorId=?", (sensor_id,))
-        return c.fetchall()
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(f"SELECT {_MEASUREMENT_ROW} FROM measurements WHERE sensorId=? ORDER BY ts", (sensor_id,))
+            rows = c.fetchall()
+        metrics.count('db.rows_read', len(rows))
+        return rows
+
+    @metrics.timed('db.fetch_measurements_after')
+    def fetch_measurements_after(self, sensor_id, date):
+        """
+        Fetches the measurement records of a sensor newer than a date, in time order.
+        It is used to follow a sensor without reading its whole history again.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        date (datetime or str): The date of the newest measurement already read.
+
+        Returns:
+        list: A list of tuples (None, sensorId, date, value), like those of fetch_measurements().
+        """
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(f"SELECT {_MEASUREMENT_ROW} FROM measurements WHERE sensorId=? AND ts > ? ORDER BY ts",
+                      (sensor_id, to_epoch(date)))
+            rows = c.fetchall()
+        metrics.count('db.rows_read', len(rows))
+        return rows
+
+    def iter_measurements(self, sensor_id, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                          columns=('date', 'value'), as_frame=False):
+        """
+        Reads the measurements of a sensor in time order, one chunk at a time.
+
+        Every chunk is converted to one NumPy array per column before the next one is read, so the
+        memory used depends on chunk_size, not on the length of the history. Reading only the date
+        and value columns reads the stored rows as they are, the dates being converted from the stored
+        seconds without parsing. The read stays open between
+        chunks, so the generator should be consumed or closed promptly.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to read, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        chunk_size (int): The maximum number of measurements per chunk.
+        columns (tuple): The columns to read, of 'sensorId', 'date' and 'value'.
+        as_frame (bool): Whether to yield pandas DataFrames instead of dictionaries of arrays.
+
+        Yields:
+        dict or pandas.DataFrame: The arrays of the requested columns by name. Dates are datetime64[s]
+                                  values and unknown values are NaN.
+
+        Raises:
+        ValueError: If a column is unknown.
+        """
+        unknown = [column for column in columns if column not in MEASUREMENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown measurement columns: {', '.join(unknown)}")
+        # numpy and pandas are imported on first use, so that opening a database does not load them.
+        import numpy as np
+        if as_frame:
+            import pandas as pd
+        selected = ', '.join(_MEASUREMENT_SQL[column] for column in columns)
+        query = f"SELECT {selected} FROM measurements WHERE sensorId=:sensor_id"
+        if start is not None:
+            query += " AND ts >= :start"
+        if end is not None:
+            query += " AND ts < :end"
+        params = {'sensor_id': sensor_id, 'start': to_epoch(start), 'end': to_epoch(end)}
+
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(query + " ORDER BY ts", params)
+        try:
+            while True:
+                with self._read_lock:
+                    rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                metrics.count('db.rows_read', len(rows))
+                chunk = {column: np.array(values, dtype=MEASUREMENT_COLUMNS[column])
+                         for column, values in zip(columns, zip(*rows))}
+                yield pd.DataFrame(chunk) if as_frame else chunk
+        finally:
+            c.close()
+
+    def table_columns(self, table):
+        """
+        Returns the names of the stored columns of a table, in the order of iter_table() rows.
+
+        Parameters:
+        table (str): The name of the table, 'stations', 'sensors' or 'measurements'.
+
+        Returns:
+        list: The column names.
+
+        Raises:
+        ValueError: If the table cannot be read whole.
+        """
+        if table not in _TABLE_KEYS:
+            raise ValueError(f"Unknown table: {table}")
+        with self._read_lock:
+            return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def iter_table(self, table, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Reads all rows of a table in key order, one chunk at a time, e.g. to export it. Like
+        iter_measurements, the read stays open between chunks, so the generator should be consumed
+        or closed promptly.
+
+        Parameters:
+        table (str): The name of the table, 'stations', 'sensors' or 'measurements'.
+        chunk_size (int): The maximum number of rows per chunk.
+
+        Yields:
+        list: Tuples of the stored columns, see table_columns(). Measurement dates are seconds since the epoch.
+
+        Raises:
+        ValueError: If the table cannot be read whole.
+        """
+        if table not in _TABLE_KEYS:
+            raise ValueError(f"Unknown table: {table}")
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(f"SELECT * FROM {table} ORDER BY {_TABLE_KEYS[table]}")
+        try:
+            while True:
+                with self._read_lock:
+                    rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                metrics.count('db.rows_read', len(rows))
+                yield rows
+        finally:
+            c.close()
+
+    @metrics.timed('db.fetch_latest_measurement_dates')
+    def fetch_latest_measurement_dates(self, sensor_ids=None):
+        """
+        Fetches the date of the newest measurement with a known value of every sensor.
+
+        Each date is found with a backward search of the measurements of the sensor in key order,
+        so the cost does not depend on the length of the stored history.
 
+        Parameters:
+        sensor_ids (iterable): The IDs of the sensors, all sensors in the 'sensors' table by default.
+
+        Returns:
+        dict: A dictionary mapping every sensor ID to the date of its newest measurement,
+              or to None if it has no measurements.
+        """
+        with self._read_lock:
+            c = self.conn.cursor()
+            if sensor_ids is None:
+                sensor_ids = [row[0] for row in c.execute("SELECT id FROM sensors")]
+            latest = {}
+            for sensor_id in sensor_ids:
+                row = c.execute('''
+                SELECT ts FROM measurements
+                WHERE sensorId=? AND value IS NOT NULL
+                ORDER BY ts DESC LIMIT 1
+                ''', (sensor_id,)).fetchone()
+                latest[sensor_id] = from_epoch(row[0]) if row else None
+            return latest
+
+    @metrics.timed('db.aggregate')
+    def aggregate(self, sensor_id, start=None, end=None, stats=DEFAULT_AGGREGATE_STATS):
+        """
+        Computes statistics of the measurements of a sensor inside SQLite, without reading the rows into Python.
+
+        Only measurements with a known value count. The statistics have the same meaning as in
+        Analyze_Data.summary(): trend is the mean change between consecutive measurements in time order,
+        slope the least squares change of the value per hour. count, min, max, mean and trend come from
+        one scan of the measurements of the sensor plus two key seeks, std and slope need one more scan.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        stats (tuple): The statistics to compute, a subset of AGGREGATE_STATS.
+
+        Returns:
+        dict: The requested statistics by name. Except for count they are None when there is not enough data.
+
+        Raises:
+        ValueError: If an unknown statistic is requested.
+        """
+        unknown = set(stats) - set(AGGREGATE_STATS)
+        if unknown:
+            raise ValueError(f"Unknown statistics: {', '.join(sorted(unknown))}")
+
+        where = "sensorId=:sensor_id AND value IS NOT NULL"
+        params = {'sensor_id': sensor_id}
+        if start is not None:
+            where += " AND ts >= :start"
+            params['start'] = to_epoch(start)
+        if end is not None:
+            where += " AND ts < :end"
+            params['end'] = to_epoch(end)
+
+        result = dict.fromkeys(AGGREGATE_STATS)
+        with self._read_lock:
+            c = self.conn.cursor()
+            count, result['min'], result['max'], mean = c.execute(
+                f"SELECT COUNT(value), MIN(value), MAX(value), AVG(value) FROM measurements WHERE {where}",
+                params).fetchone()
+            result['count'], result['mean'] = count, mean
+
+            if count > 1 and {'trend', 'slope'} & set(stats):
+                params['first_ts'], first = c.execute(
+                    f"SELECT ts, value FROM measurements WHERE {where} ORDER BY ts ASC LIMIT 1",
+                    params).fetchone()
+                last = c.execute(
+                    f"SELECT value FROM measurements WHERE {where} ORDER BY ts DESC LIMIT 1", params).fetchone()[0]
+                result['trend'] = (last - first) / (count - 1)
+
+            if count > 1 and {'std', 'slope'} & set(stats):
+                # Deviations from the mean and days since the first measurement keep the sums well conditioned.
+                params['mean'] = mean
+                columns = "SUM((value - :mean) * (value - :mean))"
+                if 'slope' in stats:
+                    day = "((ts - :first_ts) / 86400.0)"
+                    columns += f", SUM({day}), SUM({day} * {day}), SUM({day} * (value - :mean))"
+                sums = c.execute(f"SELECT {columns} FROM measurements WHERE {where}", params).fetchone()
+                result['std'] = math.sqrt(max(sums[0], 0.0) / (count - 1))
+                if 'slope' in stats:
+                    days, days_squared, products = sums[1:]
+                    spread = days_squared - days * days / count
+                    result['slope'] = products / spread / 24 if spread > 0 else None
+        return {name: result[name] for name in stats}
+
+    @metrics.timed('db.fetch_rollups')
+    def fetch_rollups(self, sensor_id, resolution, start=None, end=None):
+        """
+        Fetches the rollup buckets of a sensor at one resolution.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        resolution (str): 'hour', 'day' or 'month'.
+        start (datetime or str): The earliest bucket to include, all history by default.
+        end (datetime or str): The bucket to stop before, no limit by default.
+
+        Returns:
+        list: Tuples (bucket, count, sum, min, max) in time order, bucket being the start date of the bucket.
+
+        Raises:
+        ValueError: If the resolution is unknown.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        return self._fetch_buckets("datetime(bucket, 'unixepoch'), count, sum, min, max", sensor_id, resolution,
+                                   to_epoch(start), to_epoch(end))
+
+    def _fetch_buckets(self, columns, sensor_id, resolution, start, end):
+        """
+        Reads columns of the rollup buckets of a sensor between two stored dates, in time order.
+        """
+        query = f"SELECT {columns} FROM {TABLES[resolution]} WHERE sensorId=?"
+        params = [sensor_id]
+        if start is not None:
+            query += " AND bucket >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND bucket < ?"
+            params.append(end)
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(query + " ORDER BY bucket", params)
+            rows = c.fetchall()
+        metrics.count('db.rollup_rows_read', len(rows))
+        return rows
+
+    def fetch_measurement_span(self, sensor_id):
+        """
+        Fetches the dates of the oldest and the newest measurement with a known value of a sensor.
+        Each is read by walking the (sensorId, ts) key from one end and stopping at the first known
+        value; MIN() and MAX() with the value filter would read the sensor's whole history.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+
+        Returns:
+        tuple: The two dates as stored (seconds since the epoch), None if the sensor has no known values.
+        """
+        with self._read_lock:
+            first = self.conn.execute(
+                "SELECT ts FROM measurements WHERE sensorId=? AND value IS NOT NULL ORDER BY ts ASC LIMIT 1",
+                (sensor_id,)).fetchone()
+            if first is None:
+                return None
+            last = self.conn.execute(
+                "SELECT ts FROM measurements WHERE sensorId=? AND value IS NOT NULL ORDER BY ts DESC LIMIT 1",
+                (sensor_id,)).fetchone()
+        return first[0], last[0]
+
+    @metrics.timed('db.fetch_series')
+    def fetch_series(self, sensor_id, start=None, end=None, max_points=DEFAULT_SERIES_POINTS, as_arrays=False):
+        """
+        Fetches the values of a sensor at the finest rollup resolution giving at most max_points points,
+        so that long ranges are read as a few daily or monthly means instead of every measurement.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        max_points (int): The maximum number of points wanted.
+        as_arrays (bool): Whether to return the dates and values as NumPy arrays instead of rows,
+                          converted from the stored seconds without formatting or parsing dates.
+
+        Returns:
+        tuple: The chosen resolution and the rows, shaped like those of fetch_measurements():
+               (id, sensorId, date, value) with None as the id, the start of the bucket as the date
+               and the mean of the bucket as the value. With as_arrays, instead of the rows a dictionary
+               of a datetime64[s] array 'date' and a float64 array 'value'.
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        span = self.fetch_measurement_span(sensor_id)
+        if span is None:
+            resolution, rows = RESOLUTIONS[0], []
+        else:
+            resolution = series_resolution(span, start, end, max_points)
+            start = start and to_epoch(bucket(from_epoch(start), resolution))
+            if as_arrays:
+                rows = self._fetch_buckets("bucket, sum / count", sensor_id, resolution, start, end)
+            else:
+                rows = self._fetch_buckets("NULL, sensorId, datetime(bucket, 'unixepoch'), sum / count", sensor_id,
+                                           resolution, start, end)
+        if not as_arrays:
+            return resolution, rows
+        import numpy as np
+        dates, values = zip(*rows) if rows else ((), ())
+        return resolution, {'date': np.array(dates, dtype='datetime64[s]'), 'value': np.array(values, dtype=np.float64)}
+
+    @metrics.timed('db.fetch_air_quality_index')
     def fetch_air_quality_index(self, station_id):
         """
         Fetches the air quality index records for a given station ID from the 'air_quality_index' table.
@@ -193,12 +944,39 @@ class DatabaseManager:
         Returns:
         list: A list of tuples, where each tuple contains an air quality index record.
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM air_quality_index WHERE stationId=?", (station_id,))
-        return c.fetchall()
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(f"SELECT {_INDEX_ROW} FROM air_quality_index a WHERE stationId=?", (station_id,))
+            return c.fetchall()
+
+    @metrics.timed('db.fetch_latest_air_quality_indices')
+    def fetch_latest_air_quality_indices(self):
+        """
+        Fetches the most recent air quality index of every stored station, e.g. for a status view
+        of the whole network. Every station costs one lookup in the (stationId, stCalcDate) key,
+        however long the history of indices is.
+
+        Returns:
+        list: A list of tuples, where each tuple contains an air quality index record, in station order.
+              Stations without an index are left out.
+        """
+        with self._read_lock:
+            c = self.conn.cursor()
+            c.execute(f'''
+            SELECT {_INDEX_ROW} FROM stations s
+            JOIN air_quality_index a ON a.id = (
+                SELECT id FROM air_quality_index WHERE stationId = s.id ORDER BY stCalcDate DESC LIMIT 1
+            )
+            ORDER BY s.id
+            ''')
+            return c.fetchall()
 
     def close_connection(self):
         """
-        Closes the connection to the SQLite database.
+        Closes all connections to the SQLite database opened by any thread.
         """
-        self.conn.close()
\ No newline at end of file
+        with self._pool_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
\ No newline at end of file
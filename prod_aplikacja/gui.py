@@ -1,15 +1,26 @@
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, font
-from database_manager import DatabaseManager
-from data_fetcher import fetch_station, fetch_sensor, fetch_measurement
-from data_analyzer import Analyze_Data
-from data_visualizer import Visualize_data
+from .database_manager import DatabaseManager, AGGREGATE_STATS
+from .data_fetcher import fetch_station, fetch_sensor, fetch_all, set_cache, TransientFetchError, PermanentFetchError
+from .http_cache import ResponseCache
+from .task_runner import BackgroundTaskRunner
+from .name_index import NameIndex
+from .measurement_sync import IncrementalSync
+
+# How often the live chart checks for new readings in the database, in milliseconds.
+LIVE_REFRESH_MS = 250
+# How often the live chart downloads new readings of its sensor, in seconds.
+LIVE_SYNC_SECONDS = 300
 
 
 class AirQualityMonitorApp:
     """
     A GUI application class for monitoring air quality data, allowing the user to load stations, sensors,
     download data, analyze data, and visualize it in a chart.
+
+    Network requests, database queries and analysis run on background threads, so the window stays
+    responsive. Their results are delivered back to the Tk main loop by a BackgroundTaskRunner.
     """
     def __init__(self, root):
         """
@@ -26,15 +37,41 @@ class AirQualityMonitorApp:
         default_font.configure(size=15, weight="bold", underline=True, family="Helvetica")
         self.root.option_add("*Font", default_font)
 
-        self.db_manager = DatabaseManager()
+        self.response_cache = ResponseCache()
+        set_cache(self.response_cache)
+        self.db_manager = DatabaseManager(wal=True)
+        self.names = NameIndex(self.db_manager)
+        self.measurement_sync = IncrementalSync(self.db_manager)
+        self.tasks = BackgroundTaskRunner(self.root)
+        self.current_task = None
+        # Readings of the recently charted sensors, created with the first chart
+        self.series_cache = None
+
+        # State of the embedded chart and of its live refresh
+        self.chart_sensor_id = None
+        self.chart_resolution = None
+        self.chart_last_date = None
+        self._measurements_changed = False
+        self._live_job = None
+        self._live_task = None
+        self._last_live_sync = 0.0
+        self.db_manager.add_measurement_listener(self._on_measurements)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
         self.setup_gui()
+        self.show_stored_stations()
 
     def setup_gui(self):
         """
         Sets up the graphical user interface, including dropdowns and buttons for stations, sensors,
         data downloading, analysis, and plotting.
         """
+        # Chart, embedded on the right of the controls. matplotlib is loaded when the first chart is drawn,
+        # until then the space is held by an empty frame.
+        self.chart = None
+        self.chart_frame = ttk.Frame(self.root)
+        self.chart_frame.pack(side='right', fill='both', expand=True, padx=10, pady=10)
+
         # Stations
         self.station_label = ttk.Label(self.root, text="Select a station:")
         self.station_label.pack(padx=10, pady=5, anchor='w')
@@ -67,130 +104,400 @@ class AirQualityMonitorApp:
         self.plot_data_button = ttk.Button(self.root, text="Draw a chart", command=self.plot_data)
         self.plot_data_button.pack(padx=10, pady=5, anchor='w')
 
+        # Live refresh of the chart
+        self.live_refresh = tk.BooleanVar(value=False)
+        self.live_refresh_button = ttk.Checkbutton(self.root, text="Live refresh", variable=self.live_refresh,
+                                                   command=self.toggle_live_refresh)
+        self.live_refresh_button.pack(padx=10, pady=5, anchor='w')
+
+        # Button to download the whole network
+        self.sync_all_button = ttk.Button(self.root, text="Sync all stations", command=self.sync_all)
+        self.sync_all_button.pack(padx=10, pady=5, anchor='w')
+
+        # Progress of the background work
+        self.progress_bar = ttk.Progressbar(self.root, mode='determinate')
+        self.progress_bar.pack(padx=10, pady=5, fill='x')
+
+        self.status_label = ttk.Label(self.root, text="Ready.")
+        self.status_label.pack(padx=10, pady=5, anchor='w')
+
+        self.cancel_button = ttk.Button(self.root, text="Cancel", command=self.cancel, state='disabled')
+        self.cancel_button.pack(padx=10, pady=5, anchor='w')
+
+    def get_chart(self):
+        """
+        Returns the embedded chart, creating it on first use.
+
+        Returns:
+        LiveChart: The chart.
+        """
+        if self.chart is None:
+            from .live_chart import LiveChart
+            self.chart = LiveChart(self.chart_frame)
+            self.chart.widget().pack(fill='both', expand=True)
+        return self.chart
+
+    def get_series_cache(self):
+        """
+        Returns the cache of the readings of the charted sensors, creating it on first use.
+
+        Returns:
+        SeriesCache: The cache.
+        """
+        if self.series_cache is None:
+            from .series_cache import SeriesCache
+            self.series_cache = SeriesCache(self.db_manager)
+        return self.series_cache
+
+    def show_stored_stations(self):
+        """
+        Fills the station dropdown list with the stations stored in the local database, read in the background,
+        so that they can be browsed without downloading them again.
+        """
+        def done(station_labels):
+            if not self.station_combobox['values']:
+                self.station_combobox['values'] = station_labels
+
+        self.tasks.submit(lambda task: self.names.station_labels(), name="Reading stations", on_success=done)
+
+########################################################################
+#################SECTION THAT RUNS BACKGROUND TASKS#####################
+########################################################################
+
+    def run_in_background(self, name, func, *args, on_success=None, error_title="Error!"):
+        """
+        Runs func(task, *args) on a worker thread while the progress widgets show that it is running.
+
+        Parameters:
+        name (str): The description of the work shown in the status line.
+        func (callable): The function to run, it must not touch any widget.
+        on_success (callable): Called on the main loop with the value returned by func.
+        error_title (str): The title of the message box shown when func raises.
+
+        Returns:
+        Task: The handle of the started task.
+        """
+        def succeeded(result):
+            self._task_finished(task, "Ready.")
+            if on_success:
+                on_success(result)
+
+        def failed(error):
+            self._task_finished(task, "Failed.")
+            message = str(error)
+            if isinstance(error, TransientFetchError):
+                message += "\nThe problem may be temporary, try again later."
+            elif isinstance(error, PermanentFetchError):
+                message += "\nRepeating the request will not help."
+            messagebox.showerror(error_title, message)
+
+        def cancelled(_):
+            self._task_finished(task, "Cancelled.")
+
+        task = self.tasks.submit(func, *args, name=name, on_success=succeeded, on_error=failed,
+                                 on_progress=self.show_progress, on_cancel=cancelled)
+        self.current_task = task
+        self.status_label['text'] = f"{name}..."
+        self.progress_bar.configure(mode='indeterminate')
+        self.progress_bar.start(20)
+        self.cancel_button['state'] = 'normal'
+        return task
+
+    def show_progress(self, task, done, total, message):
+        """
+        Shows the progress reported by a background task.
+        """
+        if total:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode='determinate', maximum=total, value=done)
+        self.status_label['text'] = message or f"{task.name}..."
+
+    def _task_finished(self, task, status):
+        """
+        Resets the progress widgets after the current task finished.
+        """
+        if task is not self.current_task:
+            return
+        self.current_task = None
+        self.progress_bar.stop()
+        self.progress_bar.configure(mode='determinate', value=0)
+        self.status_label['text'] = status
+        self.cancel_button['state'] = 'disabled'
+
+    def cancel(self):
+        """
+        Cancels the running background tasks.
+        """
+        self.tasks.cancel_all()
+        self.status_label['text'] = "Cancelling..."
+
+    def close(self):
+        """
+        Stops the background work and closes the window.
+        """
+        if self._live_job is not None:
+            self.root.after_cancel(self._live_job)
+        self.tasks.shutdown()
+        self.db_manager.close_connection()
+        set_cache(None)
+        self.response_cache.close()
+        self.root.destroy()
+
+########################################################################
+#################SECTION THAT HANDLES BUTTONS###########################
+########################################################################
+
     def load_stations(self):
         """
         Loads the available stations from the API and stores them in the database.
         Populates the station dropdown list in the GUI.
         """
-        try:
+        def work(task):
             stations = fetch_station()
-            for station in stations:
-                station_data = (
-                    station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
-                    station['city']['id'],
-                    station.get('addressStreet', ''))
-                self.db_manager.insert_station(station_data)
-            self.station_combobox['values'] = [station['stationName'] for station in stations]
+            task.check()
+            self.db_manager.insert_stations(
+                (station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
+                 station['city']['id'],
+                 station.get('addressStreet', ''))
+                for station in stations)
+            return self.names.station_labels()
+
+        def done(station_labels):
+            self.station_combobox['values'] = station_labels
             messagebox.showinfo("Information", "Stations have been loaded.")
-        except Exception as e:
-            messagebox.showerror("Błąd", str(e))
+
+        self.run_in_background("Loading stations", work, on_success=done, error_title="Błąd")
 
     def load_sensors(self):
         """
         Loads the available sensors for the selected station from the API and stores them in the database.
         Populates the sensor dropdown list in the GUI.
         """
-        try:
-            station_name = self.station_combobox.get()
+        def work(task, station_name):
             station_id = self.get_station_id_by_name(station_name)
-            if station_id:
-                sensors = fetch_sensor(station_id)
-                for sensor in sensors:
-                    self.db_manager.insert_sensors([sensor])
-                self.sensor_combobox['values'] = [sensor['param']['paramName'] for sensor in sensors]
-                messagebox.showinfo("Information", "Sensors have been loaded.")
-            else:
+            if not station_id:
+                return None
+            sensors = fetch_sensor(station_id)
+            task.check()
+            self.db_manager.insert_sensors(sensors)
+            return self.names.sensor_labels(station_id)
+
+        def done(sensor_labels):
+            if sensor_labels is None:
                 messagebox.showerror("Error!", "Select a station.")
-        except Exception as e:
-            messagebox.showerror("Error!", str(e))
+                return
+            self.sensor_combobox['values'] = sensor_labels
+            messagebox.showinfo("Information", "Sensors have been loaded.")
+
+        self.run_in_background("Loading sensors", work, self.station_combobox.get(), on_success=done)
 
     def load_data(self):
         """
         Downloads measurement data for the selected sensor from the API and stores it in the database.
+        Only readings newer than the stored ones are written, and nothing is downloaded if they are current.
         """
-        try:
-            sensor_name = self.sensor_combobox.get()
-            sensor_id = self.get_sensor_id_by_name(sensor_name)
-            if sensor_id:
-                measurements = fetch_measurement(sensor_id)
-                self.db_manager.insert_measurements(measurements, sensor_id)
+        def work(task, sensor_name, station_name):
+            sensor_id = self.get_sensor_id_by_name(sensor_name, station_name)
+            if not sensor_id:
+                return False
+            stats = self.measurement_sync.sync([sensor_id])
+            if stats.error is not None:
+                raise stats.error
+            return True
+
+        def done(downloaded):
+            if downloaded:
                 messagebox.showinfo("Information", "Data has been downloaded and saved in the database.")
             else:
                 messagebox.showerror("Error!", "Select a sensor.")
-        except Exception as e:
-            messagebox.showerror("Error!", str(e))
+
+        self.run_in_background("Downloading data", work, self.sensor_combobox.get(), self.station_combobox.get(),
+                               on_success=done)
 
     def analyze_data(self):
         """
         Analyzes the data for the selected sensor, including calculating the minimum, maximum,
-        mean values, and trend. Displays the results in a messagebox.
-        """
-        try:
-            sensor_name = self.sensor_combobox.get()
-            sensor_id = self.get_sensor_id_by_name(sensor_name)
-            if sensor_id:
-                measurements = self.db_manager.fetch_measurements(sensor_id)
-                analyzer = Analyze_Data(measurements)
-                min_val = analyzer.min_value('value')
-                max_val = analyzer.max_value('value')
-                mean_val = analyzer.mean_value('value')
-                trend = analyzer.trend('value')
-                messagebox.showinfo("Analyze data",
-                                    f"Min: {min_val}\nMax: {max_val}\nMean: {mean_val}\nTrend: {trend}")
-            else:
+        mean values, spread and trend. The statistics are computed by the database, so only
+        a few numbers are read. Displays the results in a messagebox.
+        """
+        def work(task, sensor_name, station_name):
+            sensor_id = self.get_sensor_id_by_name(sensor_name, station_name)
+            if not sensor_id:
+                return None
+            return self.db_manager.aggregate(sensor_id, stats=AGGREGATE_STATS)
+
+        def done(summary):
+            if summary is None:
                 messagebox.showerror("Error!", "Select a sensor.")
-        except Exception as e:
-            messagebox.showerror("Error!", str(e))
+                return
+            messagebox.showinfo("Analyze data",
+                                f"Count: {summary['count']}\nMin: {summary['min']}\nMax: {summary['max']}\n"
+                                f"Mean: {summary['mean']}\nStd: {summary['std']}\n"
+                                f"Trend: {summary['trend']}\nSlope per hour: {summary['slope']}")
+
+        self.run_in_background("Analyzing data", work, self.sensor_combobox.get(), self.station_combobox.get(),
+                               on_success=done)
 
     def plot_data(self):
         """
-        Plots the measurement data for the selected sensor using matplotlib.
+        Plots the measurement data for the selected sensor in the chart embedded in the window.
+        The data is read in the background at the rollup resolution fitting its range,
+        the chart is drawn on the main loop. Short ranges are read from the series cache, so going back
+        to a sensor charted before does not read its readings again.
         """
-        try:
-            sensor_name = self.sensor_combobox.get()
-            sensor_id = self.get_sensor_id_by_name(sensor_name)
-            if sensor_id:
-                measurements = self.db_manager.fetch_measurements(sensor_id)
-                visualizer = Visualize_data(measurements)
-                visualizer.plot_data('value')
-            else:
+        cache = self.get_series_cache()
+
+        def work(task, sensor_name, station_name):
+            sensor_id = self.get_sensor_id_by_name(sensor_name, station_name)
+            if not sensor_id:
+                return None
+            from .data_visualizer import Visualize_data
+            return sensor_id, sensor_name, Visualize_data.from_database(self.db_manager, sensor_id, cache=cache)
+
+        def done(results):
+            if results is None:
                 messagebox.showerror("Error!", "Select a sensor.")
-        except Exception as e:
-            messagebox.showerror("Error!", str(e))
+                return
+            sensor_id, sensor_name, visualizer = results
+            data = visualizer.data
+            self.chart_sensor_id = sensor_id
+            self.chart_resolution = visualizer.resolution
+            self.chart_last_date = data['date'].max().strftime('%Y-%m-%d %H:%M:%S') if len(data) else None
+            self._measurements_changed = False
+            self.get_chart().set_data(data['date'].to_numpy(), data['value'].to_numpy(dtype=float), title=sensor_name)
+
+        self.run_in_background("Preparing the chart", work, self.sensor_combobox.get(), self.station_combobox.get(),
+                               on_success=done)
+
+    def sync_all(self):
+        """
+        Downloads all stations and their sensors, then the new measurements of every sensor,
+        and stores them in the database. The progress is shown while the requests complete
+        and the sync can be cancelled.
+        """
+        def work(task):
+            requests_done, requests_total, failed = 0, 1, 0
+            for result in fetch_all(measurements=False):
+                task.check()
+                requests_done += 1
+                if result.error is not None:
+                    failed += 1
+                elif result.kind == 'stations':
+                    self.db_manager.insert_stations(
+                        (station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
+                         station['city']['id'], station.get('addressStreet', ''))
+                        for station in result.data)
+                    requests_total += len(result.data)
+                else:
+                    self.db_manager.insert_sensors(result.data)
+                task.report(requests_done, requests_total,
+                            f"Synchronizing stations: {requests_done}/{requests_total} requests")
+
+            stats = self.measurement_sync.sync(
+                progress=lambda done, total: task.report(done, total, f"Synchronizing measurements: {done}/{total} sensors"))
+            return self.names.station_labels(), failed + stats.failed
+
+        def done(results):
+            station_labels, failed = results
+            self.station_combobox['values'] = station_labels
+            messagebox.showinfo("Information", f"All stations have been synchronized ({failed} requests failed).")
+
+        self.run_in_background("Synchronizing", work, on_success=done)
+
+    def toggle_live_refresh(self):
+        """
+        Starts or stops the live refresh of the chart.
+        """
+        if self._live_job is not None:
+            self.root.after_cancel(self._live_job)
+            self._live_job = None
+        if self.live_refresh.get():
+            self._last_live_sync = 0.0
+            self.live_tick()
+
+    def _on_measurements(self, sensor_id, first, last):
+        """
+        Notes that new readings of the charted sensor were committed. Called on the writing thread,
+        so it only sets a flag.
+        """
+        if sensor_id == self.chart_sensor_id:
+            self._measurements_changed = True
+
+    def live_tick(self):
+        """
+        Keeps the chart current while the live refresh is on: new readings of the charted sensor are
+        downloaded every LIVE_SYNC_SECONDS, and whenever measurements were committed the readings newer
+        than the charted ones are read and added to the chart without redrawing it from scratch.
+        Readings committed for other sensors do not cause a read.
+        """
+        self._live_job = None
+        if not self.live_refresh.get():
+            return
+        sensor_id = self.chart_sensor_id
+        if sensor_id is not None and time.monotonic() - self._last_live_sync >= LIVE_SYNC_SECONDS:
+            self._last_live_sync = time.monotonic()
+            self.tasks.submit(lambda task: self.measurement_sync.sync([sensor_id]), name="Live sync")
+        if sensor_id is not None and self._measurements_changed and (
+                self._live_task is None or self._live_task.done):
+            self._measurements_changed = False
+            self._live_task = self.tasks.submit(self._read_new_readings, sensor_id, self.chart_resolution,
+                                                self.chart_last_date, name="Live refresh",
+                                                on_success=self._show_new_readings)
+        self._live_job = self.root.after(LIVE_REFRESH_MS, self.live_tick)
+
+    def _read_new_readings(self, task, sensor_id, resolution, last_date):
+        """
+        Reads what changed for the charted sensor. Hourly charts get the readings newer than the last one
+        charted from the series cache, which reads only them from the database, charts of daily or monthly
+        means are read again from the rollups.
+
+        Returns:
+        tuple: The sensor ID, whether the readings replace the charted ones, their dates and values.
+        """
+        if resolution == 'hour' and last_date is not None:
+            from .rollups import to_epoch
+            dates, values = self.get_series_cache().series(sensor_id, start=to_epoch(last_date) + 1)
+            return sensor_id, False, dates, values
+        _, series = self.db_manager.fetch_series(sensor_id, as_arrays=True)
+        return sensor_id, True, series['date'], series['value']
+
+    def _show_new_readings(self, results):
+        """
+        Adds the readings read by _read_new_readings to the chart, unless another sensor is charted meanwhile.
+        """
+        sensor_id, replace, dates, values = results
+        if sensor_id != self.chart_sensor_id or self.chart is None or not len(dates):
+            return
+        if replace:
+            self.chart.set_data(dates, values, title=self.chart.ax.get_title())
+        else:
+            self.chart.append(dates, values)
+        self.chart_last_date = str(dates.max()).replace('T', ' ')
 
     def get_station_id_by_name(self, station_name):
         """
-        Retrieves the station ID for a given station name from the database.
+        Retrieves the station ID for a given station label from the name index.
 
         Parameters:
-        station_name (str): The name of the station to search for.
+        station_name (str): The label of the station to search for.
 
         Returns:
         int: The ID of the station, or None if not found.
         """
-        stations = self.db_manager.fetch_stations()
-        for station in stations:
-            if station[1] == station_name:
-                return station[0]
-        return None
+        return self.names.station_id(station_name)
 
-    def get_sensor_id_by_name(self, sensor_name):
+    def get_sensor_id_by_name(self, sensor_name, station_name):
         """
-        Retrieves the sensor ID for a given sensor name from the database.
+        Retrieves the sensor ID for a given sensor label from the name index.
 
         Parameters:
-        sensor_name (str): The name of the sensor to search for.
+        sensor_name (str): The label of the sensor to search for.
+        station_name (str): The label of the station the sensor belongs to.
 
         Returns:
         int: The ID of the sensor, or None if not found.
         """
-        station_name = self.station_combobox.get()
-        station_id = self.get_station_id_by_name(station_name)
-        sensors = self.db_manager.fetch_sensors(station_id)
-        for sensor in sensors:
-            if sensor[2] == sensor_name:
-                return sensor[0]
-        return None
+        return self.names.sensor_id(self.get_station_id_by_name(station_name), sensor_name)
 
 
 def run_gui():
@@ -198,10 +505,10 @@ def run_gui():
     Initializes and runs the tkinter graphical user interface.
     """
     root = tk.Tk()
-    root.geometry("400x600")  # Window size
+    root.geometry("1200x760")  # Window size
     app = AirQualityMonitorApp(root)
     root.mainloop()
 
 
 if __name__ == "__main__":
-    run_gui()
\ No newline at end of file
+    run_gui()
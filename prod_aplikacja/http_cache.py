@@ -0,0 +1,209 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Default time to live in seconds of the cached responses of every endpoint.
+# Stations and sensors change rarely, measurements are published every hour,
+# so they are always revalidated with the server (which is cheap when it answers 304 Not Modified).
+# The index is recomputed together with the measurements.
+DEFAULT_TTLS = {
+    'stations': 24 * 3600,
+    'sensors': 24 * 3600,
+    'measurements': 0,
+    'index': 0,
+}
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# How many access times are kept in memory before they are written to the file.
+ACCESS_FLUSH_SIZE = 256
+
+# A cached response: the raw body, the validators sent by the server and the time it was stored or revalidated.
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'last_modified', 'stored_at'])
+
+
+class ResponseCache:
+    """
+    An on-disk cache of API responses, kept in a SQLite file next to the application database.
+
+    Every endpoint has its own time to live. A response younger than it is served without any request,
+    an older one is revalidated with If-None-Match / If-Modified-Since when the server sent an ETag or
+    Last-Modified header. When the stored bodies exceed 'max_bytes', the least recently used are evicted.
+
+    A lookup only reads the file: the access times of the hits are kept in memory and written together
+    with the next store or revalidation, before an eviction, every ACCESS_FLUSH_SIZE hits and on close,
+    so that concurrent fetches answered from the cache do not wait for one commit each. The file uses
+    the write-ahead log, whose commits do not wait for the disk.
+    """
+    def __init__(self, path='http_cache.db', max_bytes=DEFAULT_MAX_BYTES, ttls=None, clock=time.time):
+        """
+        Initializes the ResponseCache class.
+
+        Parameters:
+        path (str): The path of the cache file, ':memory:' for a cache that is not persisted.
+        max_bytes (int): The maximum total size of the cached bodies.
+        ttls (dict): The time to live in seconds of every endpoint, overriding DEFAULT_TTLS.
+        clock (callable): Returns the current time in seconds.
+        """
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # URL -> time of the last lookup, not yet written to the file.
+        self._accessed = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            body BLOB,
+            etag TEXT,
+            lastModified TEXT,
+            storedAt REAL,
+            lastAccess REAL,
+            size INTEGER
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (lastAccess)')
+        self.conn.commit()
+        self.size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def record(self, outcome):
+        """
+        Counts the outcome of a cached request.
+
+        Parameters:
+        outcome (str): 'hits', 'revalidations' or 'misses'.
+        """
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def ttl(self, endpoint):
+        """
+        Returns the time to live in seconds of an endpoint, 0 for endpoints without one.
+        """
+        return self.ttls.get(endpoint, 0)
+
+    def lookup(self, url):
+        """
+        Returns the cached response of a URL, fresh or not, and marks it as recently used.
+
+        Returns:
+        CacheEntry: The cached response, or None.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT body, etag, lastModified, storedAt FROM responses WHERE url=?', (url,)).fetchone()
+            if row is None:
+                return None
+            self._accessed[url] = self.clock()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self.conn.commit()
+            return CacheEntry(*row)
+
+    def _flush_access(self):
+        """
+        Writes the access times kept in memory, in the current transaction. Called with the lock held.
+        """
+        if self._accessed:
+            self.conn.executemany('UPDATE responses SET lastAccess=? WHERE url=?',
+                                  [(accessed, url) for url, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def is_fresh(self, entry, endpoint):
+        """
+        Whether a cached response is younger than the time to live of its endpoint.
+        """
+        return self.clock() - entry.stored_at < self.ttl(endpoint)
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Stores a response and evicts the least recently used ones if the cache is full.
+
+        Parameters:
+        url (str): The requested URL.
+        body (bytes): The raw response body.
+        etag (str): The ETag header of the response.
+        last_modified (str): The Last-Modified header of the response.
+        """
+        now = self.clock()
+        with self._lock:
+            self._accessed.pop(url, None)
+            self._flush_access()
+            old = self.conn.execute('SELECT size FROM responses WHERE url=?', (url,)).fetchone()
+            self.conn.execute('''
+            INSERT OR REPLACE INTO responses (url, body, etag, lastModified, storedAt, lastAccess, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (url, body, etag, last_modified, now, now, len(body)))
+            self.size += len(body) - (old[0] if old else 0)
+            self._evict()
+            self.conn.commit()
+
+    def touch(self, url):
+        """
+        Marks a cached response as fresh again after the server confirmed it has not changed.
+        """
+        with self._lock:
+            self._flush_access()
+            self.conn.execute('UPDATE responses SET storedAt=? WHERE url=?', (self.clock(), url))
+            self.conn.commit()
+
+    def _evict(self):
+        """
+        Deletes the least recently used responses until the cache fits in max_bytes.
+        """
+        while self.size > self.max_bytes:
+            rows = self.conn.execute(
+                'SELECT url, size FROM responses ORDER BY lastAccess ASC LIMIT 32').fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self.size <= self.max_bytes:
+                    break
+                self.conn.execute('DELETE FROM responses WHERE url=?', (url,))
+                self.size -= size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Deletes all cached responses.
+        """
+        with self._lock:
+            self._accessed.clear()
+            self.conn.execute('DELETE FROM responses')
+            self.conn.commit()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+        dict: The numbers of hits (served without a request), revalidations (served after a 304 answer),
+              misses (downloaded) and evictions, the hit rate and the size of the cached bodies in bytes.
+        """
+        requests = self.hits + self.revalidations + self.misses
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.revalidations) / requests if requests else 0.0,
+            'size': self.size,
+        }
+
+    def close(self):
+        """
+        Writes the pending access times and closes the cache file.
+        """
+        with self._lock:
+            self._flush_access()
+            self.conn.commit()
+        self.conn.close()
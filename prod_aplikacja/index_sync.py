@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from .data_fetcher import fetch_many, DEFAULT_CONCURRENCY
+
+# Summary of one index synchronization run.
+# stations is the number of stations requested, fetched and failed the numbers of successful and failed requests,
+# inserted the number of new indices stored.
+IndexSyncStats = namedtuple('IndexSyncStats', ['stations', 'fetched', 'failed', 'inserted'])
+
+
+class IndexSync:
+    """
+    Downloads the current air quality index of many stations concurrently and stores it.
+
+    The indices are written in batches, several stations per transaction. An index is identified by its
+    station and calculation date, so requesting a station whose index has not been recalculated
+    since the last run stores nothing.
+    """
+    def __init__(self, db_manager, concurrency=DEFAULT_CONCURRENCY, batch_size=50, session=None):
+        """
+        Initializes the IndexSync class.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the indices are written to.
+        concurrency (int): The maximum number of requests in flight.
+        batch_size (int): The number of stations whose indices are written in one transaction.
+        session (requests.Session): The session to use, the shared one by default.
+        """
+        self.db_manager = db_manager
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.session = session
+
+    def sync(self, station_ids=None, progress=None):
+        """
+        Downloads and stores the indices of the given stations.
+
+        Parameters:
+        station_ids (iterable): The IDs of the stations, all stored stations by default.
+        progress (callable): Called with (done, total) after every finished request.
+
+        Returns:
+        IndexSyncStats: The summary of the run.
+        """
+        if station_ids is None:
+            station_ids = [station[0] for station in self.db_manager.fetch_stations()]
+        station_ids = list(station_ids)
+        fetched = failed = inserted = 0
+        batch = []
+        try:
+            for done, result in enumerate(fetch_many('index', station_ids, self.concurrency, self.session), start=1):
+                if result.error is not None:
+                    failed += 1
+                else:
+                    fetched += 1
+                    batch.append(result.data)
+                if len(batch) >= self.batch_size:
+                    inserted += self.db_manager.insert_air_quality_indices(batch)
+                    batch = []
+                if progress:
+                    progress(done, len(station_ids))
+        finally:
+            # Keep what has been downloaded even if the run is interrupted.
+            if batch:
+                inserted += self.db_manager.insert_air_quality_indices(batch)
+        return IndexSyncStats(len(station_ids), fetched, failed, inserted)
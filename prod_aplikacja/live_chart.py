@@ -0,0 +1,174 @@
+import numpy as np
+import matplotlib.dates as md
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .data_visualizer import DOWNSAMPLING_METHODS, lttb, minmax_per_pixel
+
+# Fraction of the visible range added ahead of the data when the axes grow,
+# so that the next readings can be drawn without redrawing the whole figure.
+HEADROOM = 0.1
+
+
+class LiveChart:
+    """
+    A chart embedded in a Tk window and updated in place when new measurements arrive.
+
+    The figure is drawn once with the axes, ticks and labels. New readings only change the data of the
+    line artist, which is redrawn over a saved copy of the background (blitting) as long as it fits
+    in the current limits. Only when the data leaves the limits is the whole figure redrawn, with some
+    headroom so that it does not happen on every new reading.
+    """
+    def __init__(self, master=None, size=(6, 4), dpi=100, method='lttb'):
+        """
+        Initializes the LiveChart class.
+
+        Parameters:
+        master (tk.Widget): The widget the chart is embedded in. Without one the chart is drawn off screen
+                            with the Agg canvas, e.g. in tests and benchmarks.
+        size (tuple): The width and height of the chart in inches.
+        dpi (int): The resolution of the chart in dots per inch.
+        method (str): The downsampling method of long series, see Visualize_data.points().
+                      LTTB keeps about one point per pixel, which makes redrawing the line cheaper than
+                      the up to four points per pixel column of 'minmax'.
+
+        Raises:
+        ValueError: If the method is unknown.
+        """
+        if method not in DOWNSAMPLING_METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        self.method = method
+        self.figure = Figure(figsize=size, dpi=dpi, layout='constrained')
+        if master is not None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self.canvas = FigureCanvasTkAgg(self.figure, master)
+        else:
+            self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlabel('Date')
+        self.ax.set_ylabel('Value')
+        self.ax.xaxis_date()
+        locator = md.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(md.ConciseDateFormatter(locator))
+        self.line, = self.ax.plot([], [], animated=True)
+        self.dates = np.empty(0)
+        self.values = np.empty(0)
+        self.full_draws = 0
+        self.blits = 0
+        self._background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def widget(self):
+        """
+        Returns the Tk widget of the chart, to be packed in the window.
+        """
+        return self.canvas.get_tk_widget()
+
+    def _on_draw(self, event):
+        """
+        Saves the freshly drawn background and draws the line over it.
+        """
+        self.full_draws += 1
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def set_data(self, dates, values, title='Graph'):
+        """
+        Replaces the drawn series and redraws the whole chart.
+
+        Parameters:
+        dates (array-like): The dates of the readings, datetime64 values.
+        values (array-like): The values of the readings, NaN for unknown values.
+        title (str): The title of the chart.
+        """
+        self.dates = np.empty(0)
+        self.values = np.empty(0)
+        self.ax.set_title(title)
+        self._add(dates, values)
+        self._rescale()
+        self._downsample()
+        self.canvas.draw_idle()
+
+    def append(self, dates, values):
+        """
+        Adds new readings to the drawn series.
+
+        Only the line is redrawn if the readings fit in the current limits, otherwise the limits
+        are extended and the whole chart is redrawn.
+
+        Parameters:
+        dates (array-like): The dates of the new readings, datetime64 values.
+        values (array-like): The values of the new readings, NaN for unknown values.
+        """
+        added = self._add(dates, values)
+        if added is None:
+            return
+        (left, right), (bottom, top) = self.ax.get_xlim(), self.ax.get_ylim()
+        new_dates, new_values = added
+        drawn = self.line.get_xdata()
+        if (self._background is not None and len(drawn) and drawn[-1] <= new_dates[0]
+                and left <= new_dates[0] and new_dates[-1] <= right
+                and bottom <= new_values.min() and new_values.max() <= top):
+            # The pixel columns do not move, the new readings are simply added to the drawn line
+            self.line.set_data(np.append(self.line.get_xdata(), new_dates), np.append(self.line.get_ydata(), new_values))
+            self._blit()
+        else:
+            self._rescale()
+            self._downsample()
+            self.canvas.draw_idle()
+
+    def _add(self, dates, values):
+        """
+        Merges readings into the series.
+
+        Returns:
+        tuple: The dates (as matplotlib date numbers) and values of the added readings, None if none was added.
+        """
+        dates = md.date2num(np.asarray(dates, dtype='datetime64[s]'))
+        values = np.asarray(values, dtype=np.float64)
+        known = ~np.isnan(values)
+        if not known.any():
+            return None
+        dates, values = dates[known], values[known]
+        in_order = (np.diff(dates) >= 0).all() and (not len(self.dates) or self.dates[-1] <= dates[0])
+        self.dates = np.concatenate([self.dates, dates])
+        self.values = np.concatenate([self.values, values])
+        if not in_order:
+            order = np.argsort(self.dates, kind='stable')
+            self.dates, self.values = self.dates[order], self.values[order]
+        return dates, values
+
+    def _downsample(self):
+        """
+        Sets the data of the line to the series, downsampled to the width of the axes.
+        """
+        pixels = max(int(self.ax.get_window_extent().width), 1)
+        if self.method is not None and len(self.dates) > pixels:
+            downsample = minmax_per_pixel if self.method == 'minmax' else lttb
+            indices = downsample(self.dates, self.values, pixels)
+            self.line.set_data(self.dates[indices], self.values[indices])
+        else:
+            self.line.set_data(self.dates, self.values)
+
+    def _rescale(self):
+        """
+        Sets the limits of the axes around the series, with headroom ahead of the newest reading.
+        """
+        if not len(self.dates):
+            return
+        first, last = self.dates[0], self.dates[-1]
+        span = max(last - first, 1 / 24)
+        self.ax.set_xlim(first, last + span * HEADROOM)
+        low, high = self.values.min(), self.values.max()
+        margin = max(high - low, 1.0) * HEADROOM
+        self.ax.set_ylim(low - margin, high + margin)
+
+    def _blit(self):
+        """
+        Redraws only the line over the saved background.
+        """
+        self.blits += 1
+        self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
@@ -0,0 +1,137 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .data_fetcher import fetch_many, DEFAULT_CONCURRENCY
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Summary of one synchronization run.
+# sensors is the number of sensors checked, skipped the number of sensors whose data was still current,
+# fetched and failed the numbers of successful and failed requests, inserted the number of new readings stored,
+# error the FetchError of the first failed request, None if all of them succeeded.
+SyncStats = namedtuple('SyncStats', ['sensors', 'skipped', 'fetched', 'failed', 'inserted', 'error'])
+
+
+class IncrementalSync:
+    """
+    Synchronizes the stored measurements with the API, downloading and writing only what is new.
+
+    The date of the newest stored reading of every sensor is used as its watermark. Sensors whose
+    watermark is younger than 'max_age' are not requested at all, and of the readings returned for
+    the other sensors only those newer than the watermark and with a known value are inserted.
+    A periodic sync therefore costs work proportional to the new readings, not to the stored history.
+    """
+    def __init__(self, db_manager, max_age=timedelta(hours=1), concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=50, session=None, now=datetime.now):
+        """
+        Initializes the IncrementalSync class.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the measurements are written to.
+        max_age (timedelta): How old the newest reading of a sensor may be before the sensor is requested again.
+                             The API publishes hourly readings, so one hour by default.
+        concurrency (int): The maximum number of requests in flight.
+        batch_size (int): The number of sensors whose readings are written in one transaction.
+        session (requests.Session): The session to use, the shared one by default.
+        now (callable): Returns the current local time, the API dates are in local time.
+        """
+        self.db_manager = db_manager
+        self.max_age = max_age
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.session = session
+        self.now = now
+
+    def watermarks(self, sensor_ids=None):
+        """
+        Returns the date of the newest stored reading of every sensor.
+
+        Parameters:
+        sensor_ids (iterable): The IDs of the sensors, all stored sensors by default.
+
+        Returns:
+        dict: A dictionary mapping every sensor ID to a datetime, or to None if nothing is stored.
+        """
+        return {sensor_id: datetime.strptime(date, DATE_FORMAT) if date else None
+                for sensor_id, date in self.db_manager.fetch_latest_measurement_dates(sensor_ids).items()}
+
+    def stale_sensors(self, watermarks):
+        """
+        Selects the sensors whose newest reading is older than max_age.
+
+        Parameters:
+        watermarks (dict): The result of watermarks().
+
+        Returns:
+        list: The IDs of the sensors to request.
+        """
+        threshold = self.now() - self.max_age
+        return [sensor_id for sensor_id, latest in watermarks.items() if latest is None or latest < threshold]
+
+    @staticmethod
+    def new_readings(measurements, watermark):
+        """
+        Selects the readings newer than the watermark and with a known value.
+
+        Parameters:
+        measurements (dict): The measurement data returned by the API.
+        watermark (datetime): The date of the newest stored reading, or None.
+
+        Returns:
+        list: The readings to insert.
+        """
+        if watermark is None:
+            return [value for value in measurements['values'] if value['value'] is not None]
+        since = watermark.strftime(DATE_FORMAT)
+        return [value for value in measurements['values'] if value['value'] is not None and value['date'] > since]
+
+    def sync(self, sensor_ids=None, progress=None):
+        """
+        Downloads and stores the new readings of the given sensors.
+
+        Parameters:
+        sensor_ids (iterable): The IDs of the sensors to synchronize, all stored sensors by default.
+        progress (callable): Called with (done, total) after every finished request.
+
+        Returns:
+        SyncStats: The summary of the run.
+        """
+        watermarks = self.watermarks(sensor_ids)
+        stale = self.stale_sensors(watermarks)
+        fetched = failed = inserted = 0
+        error = None
+        batch = []
+        try:
+            for done, result in enumerate(fetch_many('measurements', stale, self.concurrency, self.session), start=1):
+                if result.error is not None:
+                    failed += 1
+                    if error is None:
+                        error = result.error
+                else:
+                    fetched += 1
+                    readings = self.new_readings(result.data, watermarks[result.key])
+                    if readings:
+                        batch.append((result.key, readings))
+                if len(batch) >= self.batch_size:
+                    inserted += self._write(batch)
+                    batch = []
+                if progress:
+                    progress(done, len(stale))
+        finally:
+            # Keep what has been downloaded even if the run is interrupted.
+            inserted += self._write(batch)
+        return SyncStats(len(watermarks), len(watermarks) - len(stale), fetched, failed, inserted, error)
+
+    def _write(self, batch):
+        """
+        Writes the readings of several sensors in one transaction.
+
+        Returns:
+        int: The number of readings written.
+        """
+        if not batch:
+            return 0
+        with self.db_manager.bulk():
+            for sensor_id, readings in batch:
+                self.db_manager.insert_measurements({'values': readings}, sensor_id)
+        return sum(len(readings) for _, readings in batch)
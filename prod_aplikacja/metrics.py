@@ -0,0 +1,245 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+
+# Instrumentation of the hot paths: timings of operations and counters of requests, rows, bytes and cache
+# outcomes, kept in this process. Recording is off by default; the instrumented functions then only test
+# one flag. It is turned on with enable(), or for the whole run with the AQ_METRICS=1 environment variable.
+
+# Prefix of the metric names in the Prometheus text format.
+PROMETHEUS_PREFIX = 'aq'
+
+# Counters whose ratio is reported as a hit rate by stats(), by cache: (hits, revalidations, misses).
+# The series cache revalidates a series by reading only the readings newer than the cached ones.
+CACHE_COUNTERS = {
+    'http_cache': ('http.cache.hits', 'http.cache.revalidations', 'http.cache.misses'),
+    'series_cache': ('series_cache.hits', 'series_cache.appends', 'series_cache.misses'),
+}
+
+_enabled = os.environ.get('AQ_METRICS', '') not in ('', '0')
+_lock = threading.Lock()
+# Operation name -> [calls, total seconds, maximum seconds]
+_timings = {}
+# Counter name -> value
+_counters = {}
+_profiler = None
+
+
+def enable():
+    """
+    Starts recording metrics.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Stops recording metrics. What has been recorded is kept until reset().
+    """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """
+    Whether metrics are being recorded.
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Forgets all recorded metrics.
+    """
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def observe(name, seconds):
+    """
+    Records one call of an operation.
+
+    Parameters:
+    name (str): The name of the operation, e.g. 'db.fetch_measurements'.
+    seconds (float): The duration of the call.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+
+def count(name, amount=1):
+    """
+    Adds to a counter.
+
+    Parameters:
+    name (str): The name of the counter, e.g. 'db.rows_read'.
+    amount (int): The amount to add.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def timed(name):
+    """
+    Decorates a function so that the duration of every call is recorded as the operation 'name'.
+
+    Parameters:
+    name (str): The name of the operation.
+
+    Returns:
+    callable: The decorator.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class timer:
+    """
+    Records the duration of a 'with' block as the operation 'name'.
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if _enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start)
+
+########################################################################
+#################SECTION THAT REPORTS###################################
+########################################################################
+
+
+def stats():
+    """
+    Returns a snapshot of the recorded metrics.
+
+    Returns:
+    dict: 'timings' maps every operation to its calls, total, mean and maximum seconds, 'counters' maps every
+          counter to its value and 'caches' maps every cache to its hits, revalidations, misses and hit rate
+          (the share of lookups answered without downloading the body, None before the first lookup).
+    """
+    with _lock:
+        timings = {name: {'calls': calls, 'total_seconds': total, 'mean_seconds': total / calls,
+                          'max_seconds': longest}
+                   for name, (calls, total, longest) in _timings.items()}
+        counters = dict(_counters)
+    caches = {}
+    for cache, names in CACHE_COUNTERS.items():
+        hits, revalidations, misses = (counters.get(name, 0) for name in names)
+        lookups = hits + revalidations + misses
+        caches[cache] = {'hits': hits, 'revalidations': revalidations, 'misses': misses,
+                         'hit_rate': (hits + revalidations) / lookups if lookups else None}
+    return {'timings': timings, 'counters': counters, 'caches': caches}
+
+
+def _metric_name(name):
+    """
+    Converts a dotted metric name to a Prometheus one, e.g. 'http.bytes_received' to 'aq_http_bytes_received'.
+    """
+    return f"{PROMETHEUS_PREFIX}_{name.replace('.', '_').replace('-', '_')}"
+
+
+def prometheus_text():
+    """
+    Formats the recorded metrics in the Prometheus text exposition format, e.g. to be served over HTTP
+    or written to a file read by the node exporter.
+
+    Returns:
+    str: The metrics, one sample per line.
+    """
+    snapshot = stats()
+    operation = f'{PROMETHEUS_PREFIX}_operation_seconds'
+    lines = [f'# HELP {operation} Duration of the instrumented operations.', f'# TYPE {operation} summary']
+    for name, timing in sorted(snapshot['timings'].items()):
+        lines.append(f'{operation}_count{{operation="{name}"}} {timing["calls"]}')
+        lines.append(f'{operation}_sum{{operation="{name}"}} {timing["total_seconds"]:.9f}')
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = f'{_metric_name(name)}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {value}')
+    for cache, outcome in sorted(snapshot['caches'].items()):
+        if outcome['hit_rate'] is not None:
+            metric = f'{_metric_name(cache)}_hit_ratio'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {outcome["hit_rate"]:.6f}')
+    return '\n'.join(lines) + '\n'
+
+########################################################################
+#################SECTION THAT PROFILES##################################
+########################################################################
+
+
+def start_profiling():
+    """
+    Starts profiling the calling thread with cProfile, with every function call recorded.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profiling(path=None, sort='cumulative', limit=30):
+    """
+    Stops the profiler started by start_profiling().
+
+    Parameters:
+    path (str): A file to save the raw profile to, readable with pstats or snakeviz.
+    sort (str): The column the report is sorted by.
+    limit (int): The number of functions in the report.
+
+    Returns:
+    str: The report of the most expensive functions, None if the profiler was not running.
+    """
+    global _profiler
+    if _profiler is None:
+        return None
+    profiler, _profiler = _profiler, None
+    profiler.disable()
+    if path is not None:
+        profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+    return report.getvalue()
+
+
+def is_profiling():
+    """
+    Whether the profiler is running.
+    """
+    return _profiler is not None
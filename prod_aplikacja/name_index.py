@@ -0,0 +1,133 @@
+import threading
+from collections import Counter
+
+
+def _labels(rows):
+    """
+    Builds unique display labels for (id, name) pairs, sorted by name.
+    A name shared by several rows gets the ID appended, e.g. 'Kraków (402)'.
+
+    Returns:
+    dict: A dictionary mapping every label to its ID, in display order.
+    """
+    counts = Counter(name for _, name in rows)
+    labels = {}
+    for row_id, name in sorted(rows, key=lambda row: (row[1] or '', row[0])):
+        labels[name if counts[name] == 1 else f"{name} ({row_id})"] = row_id
+    return labels
+
+
+class NameIndex:
+    """
+    A cache resolving the station and sensor names shown in the GUI to their IDs.
+
+    The index is built from the database on first use and kept in memory, so a lookup is a dictionary
+    access instead of a query and a linear scan. It registers itself with the DatabaseManager and drops
+    the cached stations or sensors whenever new ones are committed, the next lookup rebuilds them.
+    Names that are not unique (stations in the same town, the same parameter measured twice)
+    get the ID appended to their label, so that every label resolves to exactly one ID.
+    """
+    def __init__(self, db_manager):
+        """
+        Initializes the NameIndex class.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the stations and sensors are read from.
+        """
+        self.db_manager = db_manager
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stations = None
+        self._sensors = {}
+        db_manager.add_insert_listener(self.invalidate)
+
+    def invalidate(self, table=None):
+        """
+        Drops the cached stations or sensors. Commits to other tables, e.g. measurements, keep the index.
+
+        Parameters:
+        table (str): 'stations' or 'sensors' to drop one of them, everything if None.
+        """
+        if table not in (None, 'stations', 'sensors'):
+            return
+        with self._lock:
+            self._generation += 1
+            if table in (None, 'stations'):
+                self._stations = None
+            if table in (None, 'sensors'):
+                self._sensors = {}
+
+    def _station_labels(self):
+        """
+        Returns the label -> ID dictionary of the stations, building it if needed.
+        """
+        stations = self._stations
+        if stations is None:
+            generation = self._generation
+            stations = _labels([(row[0], row[1]) for row in self.db_manager.fetch_stations()])
+            with self._lock:
+                # Keep the result only if nothing was inserted while it was being built.
+                if generation == self._generation:
+                    self._stations = stations
+        return stations
+
+    def _sensor_labels(self, station_id):
+        """
+        Returns the label -> ID dictionary of the sensors of a station, building it if needed.
+        """
+        sensors = self._sensors.get(station_id)
+        if sensors is None:
+            generation = self._generation
+            sensors = _labels([(row[0], row[2]) for row in self.db_manager.fetch_sensors(station_id)])
+            with self._lock:
+                if generation == self._generation:
+                    self._sensors[station_id] = sensors
+        return sensors
+
+    def station_labels(self):
+        """
+        Returns the labels of all stored stations, sorted by name.
+
+        Returns:
+        list: The station labels to show in the GUI.
+        """
+        return list(self._station_labels())
+
+    def sensor_labels(self, station_id):
+        """
+        Returns the labels of the stored sensors of a station, sorted by parameter name.
+
+        Parameters:
+        station_id (int): The ID of the station.
+
+        Returns:
+        list: The sensor labels to show in the GUI.
+        """
+        return list(self._sensor_labels(station_id))
+
+    def station_id(self, label):
+        """
+        Resolves a station label to the station ID.
+
+        Parameters:
+        label (str): The label of the station.
+
+        Returns:
+        int: The ID of the station, or None if not found.
+        """
+        return self._station_labels().get(label)
+
+    def sensor_id(self, station_id, label):
+        """
+        Resolves a sensor label to the sensor ID within a station.
+
+        Parameters:
+        station_id (int): The ID of the station the sensor belongs to.
+        label (str): The label of the sensor.
+
+        Returns:
+        int: The ID of the sensor, or None if not found.
+        """
+        if station_id is None:
+            return None
+        return self._sensor_labels(station_id).get(label)
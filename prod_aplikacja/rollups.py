@@ -0,0 +1,167 @@
+import numbers
+from datetime import datetime, timedelta, timezone
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Dates are stored as whole seconds since this moment. The API gives local times without a time zone,
+# they are counted as if they were UTC, so that every date has exactly one number and back.
+EPOCH = datetime(1970, 1, 1)
+
+# The rollup resolutions from the finest to the coarsest.
+# Every resolution has its table, the resolution its buckets are computed from ('measurements' for the raw rows)
+# and the SQL expression giving the start of the bucket of a stored date, see bucket().
+RESOLUTIONS = ('hour', 'day', 'month')
+TABLES = {'hour': 'rollup_hourly', 'day': 'rollup_daily', 'month': 'rollup_monthly'}
+SOURCES = {'hour': 'measurements', 'day': 'hour', 'month': 'day'}
+_BUCKET_SQL = {
+    'hour': "{column} - {column} % 3600",
+    'day': "{column} - {column} % 86400",
+    'month': "CAST(strftime('%s', {column}, 'unixepoch', 'start of month') AS INTEGER)",
+}
+
+# Approximate length of a bucket in seconds, used to estimate the number of buckets in a range.
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400, 'month': 30 * 86400}
+
+
+def to_epoch(date):
+    """
+    Converts a date to the number of seconds it is stored as.
+
+    Naive dates are counted as they are, like the local times of the API. Dates with a time zone,
+    e.g. '2024-01-31 13:00:00+02:00', are converted to UTC first.
+
+    Parameters:
+    date (datetime, str or int): A datetime, a string such as '2024-01-31 13:00:00' or '2024-01-31',
+                                 or a number of seconds, returned as it is.
+
+    Returns:
+    int: The seconds since EPOCH, None if the date is None.
+    """
+    if date is None:
+        return None
+    if isinstance(date, numbers.Integral):
+        return int(date)
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return (date - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(seconds):
+    """
+    Converts a stored number of seconds to a date string such as '2024-01-31 13:00:00'.
+    The queries returning dates do the same with SQLite's datetime(column, 'unixepoch').
+    """
+    return None if seconds is None else (EPOCH + timedelta(seconds=seconds)).strftime(DATE_FORMAT)
+
+
+def bucket(date, resolution):
+    """
+    Returns the start of the bucket a date belongs to.
+
+    Parameters:
+    date (str): A date in the format of the 'measurements' table, e.g. '2024-01-31 13:00:00'.
+    resolution (str): One of RESOLUTIONS.
+
+    Returns:
+    str: The start of the bucket, in the same format.
+    """
+    if resolution == 'hour':
+        return date[:13] + ':00:00'
+    if resolution == 'day':
+        return date[:10] + ' 00:00:00'
+    return date[:7] + '-01 00:00:00'
+
+
+def next_bucket(start, resolution):
+    """
+    Returns the start of the bucket following the one starting at 'start'.
+    """
+    date = datetime.strptime(start, DATE_FORMAT)
+    if resolution == 'hour':
+        date += timedelta(hours=1)
+    elif resolution == 'day':
+        date += timedelta(days=1)
+    else:
+        date = date.replace(year=date.year + date.month // 12, month=date.month % 12 + 1)
+    return date.strftime(DATE_FORMAT)
+
+
+def create_rollup_tables(c):
+    """
+    Creates the rollup tables and fills them from the stored measurements.
+    A rollup row holds the count, sum, minimum and maximum of the known values of a sensor in one bucket,
+    the bucket being the stored start date of the bucket.
+    """
+    for resolution in RESOLUTIONS:
+        c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {TABLES[resolution]} (
+            sensorId INTEGER,
+            bucket INTEGER,
+            count INTEGER,
+            sum REAL,
+            min REAL,
+            max REAL,
+            PRIMARY KEY (sensorId, bucket)
+        ) WITHOUT ROWID
+        ''')
+        c.execute(f"INSERT OR REPLACE INTO {TABLES[resolution]} {_select(resolution)} GROUP BY sensorId, 2")
+
+
+def _select(resolution, where=''):
+    """
+    Returns the query computing the buckets of a resolution from its source.
+    """
+    source = SOURCES[resolution]
+    if source == 'measurements':
+        return f'''
+        SELECT sensorId, {_BUCKET_SQL[resolution].format(column='ts')}, COUNT(value), SUM(value), MIN(value), MAX(value)
+        FROM measurements WHERE value IS NOT NULL {where.format(column='ts')}
+        '''
+    return f'''
+    SELECT sensorId, {_BUCKET_SQL[resolution].format(column='bucket')}, SUM(count), SUM(sum), MIN(min), MAX(max)
+    FROM {TABLES[source]} WHERE 1 {where.format(column='bucket')}
+    '''
+
+
+def update_rollups(c, sensor_id, first, last):
+    """
+    Recomputes the buckets of a sensor touched by measurements written between two dates.
+
+    Every resolution is computed from the one below it, the hourly buckets from the measurements,
+    so an insert of a few hours reads a few rows at every level instead of the whole history.
+    Buckets are recomputed rather than adjusted, which keeps them right when stored values are replaced.
+
+    Parameters:
+    c (sqlite3.Cursor): The cursor of the transaction that wrote the measurements.
+    sensor_id (int): The ID of the sensor.
+    first (int): The earliest date written, as stored.
+    last (int): The latest date written, as stored.
+    """
+    first, last = from_epoch(first), from_epoch(last)
+    for resolution in RESOLUTIONS:
+        start, end = bucket(first, resolution), next_bucket(bucket(last, resolution), resolution)
+        c.execute(f'''
+        INSERT OR REPLACE INTO {TABLES[resolution]}
+        {_select(resolution, "AND sensorId=? AND {column} >= ? AND {column} < ?")}
+        GROUP BY sensorId, 2
+        ''', (sensor_id, to_epoch(start), to_epoch(end)))
+
+
+def choose_resolution(start, end, max_points):
+    """
+    Chooses the finest resolution giving at most 'max_points' buckets between two dates.
+
+    Parameters:
+    start (str): The earliest date of the range.
+    end (str): The latest date of the range.
+    max_points (int): The maximum number of buckets.
+
+    Returns:
+    str: One of RESOLUTIONS, the coarsest one if even it gives more buckets.
+    """
+    span = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+    for resolution in RESOLUTIONS:
+        if span / BUCKET_SECONDS[resolution] + 1 <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
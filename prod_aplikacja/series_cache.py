@@ -0,0 +1,266 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import metrics
+from .database_manager import DEFAULT_CHUNK_SIZE, DEFAULT_SERIES_POINTS, series_resolution
+from .rollups import RESOLUTIONS, to_epoch
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class _Entry:
+    """
+    The cached readings of one sensor in two contiguous arrays, with room for appended readings:
+    only the first 'length' elements are readings. The readings in use are never written again,
+    new ones go after them or into new arrays, so views handed out stay valid.
+    """
+    __slots__ = ('dates', 'values', 'length', 'stale_from')
+
+    def __init__(self, dates, values):
+        self.dates = dates
+        self.values = values
+        self.length = len(dates)
+        # The earliest date written since the readings were read, None while they are current.
+        self.stale_from = None
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.values.nbytes
+
+    def readings(self):
+        """
+        Returns read-only views of the readings.
+        """
+        dates, values = self.dates[:self.length], self.values[:self.length]
+        dates.flags.writeable = values.flags.writeable = False
+        return dates, values
+
+    def append(self, dates, values):
+        """
+        Adds readings newer than the cached ones, in place when there is room, otherwise into arrays
+        half as large again as needed, so that a series growing by a few readings at a time is not
+        copied on every append.
+        """
+        length = self.length + len(dates)
+        if length > len(self.dates):
+            capacity = length + length // 2
+            grown_dates, grown_values = np.empty(capacity, dtype=self.dates.dtype), np.empty(capacity)
+            grown_dates[:self.length], grown_values[:self.length] = self.dates[:self.length], self.values[:self.length]
+            self.dates, self.values = grown_dates, grown_values
+        self.dates[self.length:length], self.values[self.length:length] = dates, values
+        self.length = length
+
+
+class SeriesCache:
+    """
+    An in-memory cache of the readings of recently used sensors, in front of a DatabaseManager.
+
+    The known readings of a sensor are kept as two contiguous NumPy arrays, datetime64[s] dates and
+    float64 values in time order, and served as read-only views without copying. The cache registers
+    itself with the DatabaseManager: readings written after the cached ones are read and appended on
+    the next lookup, any other write to the cached range drops the series, which is read again.
+    When the arrays exceed 'max_bytes', the least recently used series are evicted. Writes made
+    outside the DatabaseManager, e.g. by another process, are not seen.
+    """
+    def __init__(self, db_manager, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initializes the SeriesCache class.
+
+        Parameters:
+        db_manager (DatabaseManager): The database the readings are read from.
+        max_bytes (int): The maximum total size of the cached arrays.
+        """
+        self.db_manager = db_manager
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.appends = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Sensor ID -> number of writes notified, to detect writes made while a series is being read.
+        self._generations = {}
+        db_manager.add_measurement_listener(self._on_write)
+
+    def _on_write(self, sensor_id, first, last):
+        """
+        Marks the cached series of a sensor as stale from the earliest written date.
+        """
+        with self._lock:
+            self._generations[sensor_id] = self._generations.get(sensor_id, 0) + 1
+            entry = self._entries.get(sensor_id)
+            if entry is not None:
+                entry.stale_from = first if entry.stale_from is None else min(entry.stale_from, first)
+
+    def invalidate(self, sensor_id=None):
+        """
+        Drops the cached series of a sensor.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor, every sensor if None.
+        """
+        with self._lock:
+            for key in list(self._entries) if sensor_id is None else [sensor_id]:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= entry.nbytes
+
+    @metrics.timed('series_cache.read')
+    def _read(self, sensor_id, start=None):
+        """
+        Reads the known readings of a sensor from the database, from a stored date on.
+
+        Returns:
+        tuple: The datetime64[s] dates and the float64 values.
+        """
+        dates, values = [np.empty(0, dtype='datetime64[s]')], [np.empty(0)]
+        for chunk in self.db_manager.iter_measurements(sensor_id, start=start, chunk_size=DEFAULT_CHUNK_SIZE):
+            known = ~np.isnan(chunk['value'])
+            dates.append(chunk['date'][known])
+            values.append(chunk['value'][known])
+        return np.concatenate(dates), np.concatenate(values)
+
+    def _store(self, sensor_id, entry):
+        """
+        Adds a series and evicts the least recently used ones until the cache fits in max_bytes.
+        A series larger than the whole cache is not kept.
+        """
+        if entry.nbytes > self.max_bytes:
+            return
+        self._entries[sensor_id] = entry
+        self.size += entry.nbytes
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.nbytes
+            self.evictions += 1
+
+    def _record(self, outcome):
+        """
+        Counts the outcome of a lookup: 'hits', 'appends' or 'misses'. Called with the lock held.
+        """
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        metrics.count(f'series_cache.{outcome}')
+
+    def readings(self, sensor_id):
+        """
+        Returns all known readings of a sensor, reading them from the database if they are not cached.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+
+        Returns:
+        tuple: Read-only views of the datetime64[s] dates and the float64 values, in time order.
+        """
+        with self._lock:
+            generation = self._generations.get(sensor_id, 0)
+            entry = self._entries.get(sensor_id)
+            if entry is not None:
+                self._entries.move_to_end(sensor_id)
+                if entry.stale_from is None:
+                    self._record('hits')
+                    return entry.readings()
+                stale_from = entry.stale_from
+                last = int(entry.dates[entry.length - 1].astype(np.int64)) if entry.length else None
+                if last is not None and stale_from > last:
+                    cached = entry.readings()
+                else:
+                    # A cached reading may have changed, the series is read again.
+                    del self._entries[sensor_id]
+                    self.size -= entry.nbytes
+                    entry = None
+
+        if entry is None:
+            dates, values = self._read(sensor_id)
+            with self._lock:
+                self._record('misses')
+                if generation == self._generations.get(sensor_id, 0) and sensor_id not in self._entries:
+                    entry = _Entry(dates, values)
+                    self._store(sensor_id, entry)
+                    return entry.readings()
+            return _Entry(dates, values).readings()
+
+        dates, values = self._read(sensor_id, start=stale_from)
+        with self._lock:
+            self._record('appends')
+            if generation == self._generations.get(sensor_id, 0) and self._entries.get(sensor_id) is entry:
+                self.size -= entry.nbytes
+                entry.append(dates, values)
+                entry.stale_from = None
+                del self._entries[sensor_id]
+                self._store(sensor_id, entry)
+                return entry.readings()
+        # The series was written again meanwhile, return what was read without keeping it.
+        return _Entry(np.concatenate([cached[0], dates]), np.concatenate([cached[1], values])).readings()
+
+    def series(self, sensor_id, start=None, end=None):
+        """
+        Returns the known readings of a sensor between two dates, as views of the cached arrays.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+
+        Returns:
+        tuple: Read-only views of the datetime64[s] dates and the float64 values, in time order.
+        """
+        dates, values = self.readings(sensor_id)
+        first = 0 if start is None else np.searchsorted(dates, np.datetime64(to_epoch(start), 's'))
+        last = len(dates) if end is None else np.searchsorted(dates, np.datetime64(to_epoch(end), 's'))
+        return dates[first:last], values[first:last]
+
+    def fetch_series(self, sensor_id, start=None, end=None, max_points=DEFAULT_SERIES_POINTS):
+        """
+        Returns the values of a sensor like DatabaseManager.fetch_series(..., as_arrays=True).
+
+        When the range fits max_points at the hourly resolution, the readings themselves are served from
+        the cache; the API publishes hourly readings, so they equal the hourly means. Coarser series are
+        read from the rollups, which are a few rows.
+
+        Parameters:
+        sensor_id (int): The ID of the sensor.
+        start (datetime or str): The earliest date to include, all history by default.
+        end (datetime or str): The date to stop before, no limit by default.
+        max_points (int): The maximum number of points wanted.
+
+        Returns:
+        tuple: The chosen resolution and a dictionary of a datetime64[s] array 'date' and a float64 array 'value'.
+        """
+        with self._lock:
+            cached = sensor_id in self._entries
+        if cached:
+            dates, _ = self.readings(sensor_id)
+            span = (int(dates[0].astype(np.int64)), int(dates[-1].astype(np.int64))) if len(dates) else None
+        else:
+            span = self.db_manager.fetch_measurement_span(sensor_id)
+        resolution = RESOLUTIONS[0] if span is None else \
+            series_resolution(span, to_epoch(start), to_epoch(end), max_points)
+        if resolution != RESOLUTIONS[0]:
+            return self.db_manager.fetch_series(sensor_id, start, end, max_points, as_arrays=True)
+        dates, values = self.series(sensor_id, start, end)
+        return resolution, {'date': dates, 'value': values}
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+        dict: The numbers of hits (served from memory), appends (served after reading only the newer readings),
+              misses (read from the database) and evictions, the hit rate, the number of cached series
+              and the size of the cached arrays in bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.appends + self.misses
+            return {
+                'hits': self.hits,
+                'appends': self.appends,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.appends) / lookups if lookups else 0.0,
+                'series': len(self._entries),
+                'size': self.size,
+            }
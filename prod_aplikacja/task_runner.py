@@ -0,0 +1,200 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskCancelled(Exception):
+    """
+    Raised inside a background task when it has been cancelled.
+    """
+
+
+class Task:
+    """
+    A handle to a function running in the background, shared by the worker thread and the GUI.
+
+    The worker uses it to report progress and to check whether it should stop,
+    the GUI uses it to cancel the work.
+    """
+    def __init__(self, runner, name, on_success, on_error, on_progress, on_cancel):
+        """
+        Initializes the Task class.
+
+        Parameters:
+        runner (BackgroundTaskRunner): The runner executing the task.
+        name (str): A name describing the task, shown in progress messages.
+        on_success, on_error, on_progress, on_cancel (callable): The callbacks run on the Tk main loop.
+        """
+        self.runner = runner
+        self.name = name
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self.done = False
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """
+        Whether cancel() has been called.
+        """
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Asks the task to stop. The worker stops at its next call to check() or report().
+        """
+        self._cancel_event.set()
+
+    def check(self):
+        """
+        Called by the worker between steps of its work.
+
+        Raises:
+        TaskCancelled: If the task has been cancelled.
+        """
+        if self.cancelled:
+            raise TaskCancelled(self.name)
+
+    def report(self, done, total=None, message=''):
+        """
+        Called by the worker to report its progress to the GUI.
+
+        Parameters:
+        done (int): The number of finished steps.
+        total (int): The number of all steps, or None if it is not known.
+        message (str): A description of the current step.
+
+        Raises:
+        TaskCancelled: If the task has been cancelled.
+        """
+        self.check()
+        self.runner._post(self, 'progress', (done, total, message))
+
+
+class BackgroundTaskRunner:
+    """
+    Runs functions on a thread pool and delivers their results to the Tk main loop.
+
+    Workers never touch widgets. They put their results and progress reports into a queue,
+    which the main loop polls with root.after and drains for at most a few milliseconds per poll,
+    so that the window keeps redrawing while the work is in progress.
+    """
+    def __init__(self, root, max_workers=4, poll_interval_ms=16, time_budget_ms=8):
+        """
+        Initializes the BackgroundTaskRunner class and starts polling the result queue.
+
+        Parameters:
+        root (Tk): The main window whose 'after' method schedules the polling.
+        max_workers (int): The maximum number of tasks running at the same time.
+        poll_interval_ms (int): How often the result queue is polled.
+        time_budget_ms (int): How long a single poll may spend running callbacks.
+        """
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.time_budget = time_budget_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._results = queue.Queue()
+        self._tasks = set()
+        self._closed = False
+        self._after_id = self.root.after(self.poll_interval_ms, self.poll)
+
+    def submit(self, func, *args, name='', on_success=None, on_error=None, on_progress=None, on_cancel=None):
+        """
+        Runs func(task, *args) in the background.
+
+        The callbacks are called on the Tk main loop: on_success with the value returned by func,
+        on_error with the exception it raised, on_progress with the task and its (done, total, message)
+        report, and on_cancel with the task when it stopped because it was cancelled.
+
+        Returns:
+        Task: The handle of the submitted task.
+        """
+        task = Task(self, name, on_success, on_error, on_progress, on_cancel)
+        self._tasks.add(task)
+        self._executor.submit(self._run, task, func, args)
+        return task
+
+    @property
+    def active_tasks(self):
+        """
+        The tasks that have not finished yet.
+        """
+        return [task for task in self._tasks if not task.done]
+
+    def cancel_all(self):
+        """
+        Cancels all running tasks.
+        """
+        for task in self.active_tasks:
+            task.cancel()
+
+    def _run(self, task, func, args):
+        """
+        Executes a task on a worker thread and posts its outcome to the result queue.
+        """
+        try:
+            task.check()
+            result = func(task, *args)
+        except TaskCancelled:
+            self._post(task, 'cancel', None)
+        except Exception as e:
+            self._post(task, 'error', e)
+        else:
+            self._post(task, 'success', result)
+
+    def _post(self, task, kind, payload):
+        """
+        Puts an event of a task into the result queue.
+        """
+        self._results.put((task, kind, payload))
+
+    def poll(self):
+        """
+        Runs the callbacks of the events queued by the workers, within the time budget of one frame.
+        Called periodically by the Tk main loop. An exception raised by a callback is reported with
+        root.report_callback_exception, like one raised by a Tk callback, and the polling goes on.
+        """
+        deadline = time.perf_counter() + self.time_budget
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    task, kind, payload = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._dispatch(task, kind, payload)
+                except Exception:
+                    self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            if not self._closed:
+                self._after_id = self.root.after(self.poll_interval_ms, self.poll)
+
+    def _dispatch(self, task, kind, payload):
+        """
+        Calls the callback matching an event of a task.
+        """
+        if kind == 'progress':
+            if task.on_progress and not task.cancelled:
+                task.on_progress(task, *payload)
+            return
+        task.done = True
+        self._tasks.discard(task)
+        if kind == 'success' and task.on_success:
+            task.on_success(payload)
+        elif kind == 'error' and task.on_error:
+            task.on_error(payload)
+        elif kind == 'cancel' and task.on_cancel:
+            task.on_cancel(task)
+
+    def shutdown(self):
+        """
+        Cancels all tasks, waits for the workers to stop and stops polling.
+        """
+        self._closed = True
+        self.cancel_all()
+        self._executor.shutdown(wait=True)
+        self.root.after_cancel(self._after_id)
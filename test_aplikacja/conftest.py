@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from test_aplikacja.stub_server import StubApi
+
+# The first hour of the readings built by hourly_readings() and hourly_dates().
+START = datetime(2024, 1, 1)
+
+
+def hourly_readings(count, first=0, value=lambda hour: float(hour % 24), start=START):
+    """
+    Builds 'count' hourly readings as returned by the API, from the hour 'first' after 'start'.
+    'value' gives the value of the reading of every hour, counted from 'start'.
+    """
+    return {'values': [{'date': (start + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S'), 'value': value(hour)}
+                       for hour in range(first, first + count)]}
+
+
+def hourly_dates(count, first=0, start=START):
+    """Returns the datetime64 dates of 'count' hourly readings from the hour 'first' after 'start'."""
+    return np.datetime64(start, 's') + (first + np.arange(count)) * np.timedelta64(1, 'h')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "stub_api(**kwargs): the arguments of the StubApi of the stub_api fixture")
+
+
+@pytest.fixture
+def stub_api(request):
+    """
+    Fixture that serves a generated network from a local stub of the API and points the fetchers at it.
+    The network has 5 stations of 3 sensors unless a test or module sets other StubApi arguments, e.g.
+    pytestmark = pytest.mark.stub_api(stations=2, sensors_per_station=3).
+    """
+    marker = request.node.get_closest_marker('stub_api')
+    kwargs = dict({'stations': 5, 'sensors_per_station': 3}, **(marker.kwargs if marker else {}))
+    with StubApi(**kwargs) as stub:
+        with stub.patch_fetcher():
+            yield stub
@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for many simultaneous connects, the default backlog of 5 stalls high concurrency runs.
+    request_queue_size = 128
+
+
+class StubApi:
+    """
+    A local HTTP server imitating the GIOŚ REST API, used to test and benchmark the fetchers offline.
+
+    The network is generated from the number of stations and sensors per station, and every
+    response can be delayed to simulate the round trip to the real API. Responses carry an ETag
+    and requests revalidating an unchanged body are answered with 304 Not Modified.
+    """
+    def __init__(self, stations=10, sensors_per_station=4, values_per_sensor=72, latency=0.0):
+        """
+        Initializes the stub and generates the data it serves.
+
+        Parameters:
+        stations (int): The number of stations in the network.
+        sensors_per_station (int): The number of sensors of every station.
+        values_per_sensor (int): The number of hourly values returned for every sensor.
+        latency (float): The delay in seconds added to every response.
+        """
+        self.latency = latency
+        self.values_per_sensor = values_per_sensor
+        self.stations = [
+            {'id': station_id, 'stationName': f'Station {station_id}', 'gegrLat': 50.0 + station_id / 1000,
+             'gegrLon': 20.0 + station_id / 1000, 'city': {'id': station_id % 7}, 'addressStreet': None}
+            for station_id in range(1, stations + 1)
+        ]
+        self.sensors = {
+            station['id']: [
+                {'id': station['id'] * 100 + n, 'stationId': station['id'],
+                 'param': {'paramName': f'Param {n}', 'paramFormula': f'P{n}', 'paramCode': f'P{n}', 'idParam': n}}
+                for n in range(sensors_per_station)
+            ]
+            for station in self.stations
+        }
+        self.index_date = '2024-01-03 23:20:00'
+        self.requests = 0
+        self.not_modified = 0
+        # The number of requests being answered, and the most that were answered at the same time.
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.etags = True
+        self.status_overrides = {}
+        self.failures = {}
+        self.retry_after = None
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """
+        The URL to assign to data_fetcher.BASE_URL so that the fetchers talk to the stub, see patch_fetcher().
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/pjp-api/rest"
+
+    @property
+    def sensor_ids(self):
+        """
+        The IDs of all sensors in the network.
+        """
+        return [sensor['id'] for sensors in self.sensors.values() for sensor in sensors]
+
+    def measurements(self, sensor_id):
+        """
+        Returns the measurement payload served for a sensor.
+        """
+        values = [
+            {'date': f'2024-01-{1 + hour // 24:02d} {hour % 24:02d}:00:00', 'value': float(sensor_id % 50 + hour % 10)}
+            for hour in reversed(range(self.values_per_sensor))
+        ]
+        return {'key': f'S{sensor_id}', 'values': values}
+
+    def index(self, station_id):
+        """
+        Returns the air quality index payload served for a station, calculated at 'index_date'.
+        """
+        level = {'id': station_id % 6, 'indexLevelName': ['Bardzo dobry', 'Dobry', 'Umiarkowany', 'Dostateczny',
+                                                          'Zły', 'Bardzo zły'][station_id % 6]}
+        return {'id': station_id, 'stCalcDate': self.index_date, 'stIndexLevel': level,
+                'stSourceDataDate': self.index_date[:14] + '00:00', 'stIndexStatus': True, 'stIndexCrParam': 'PYL'}
+
+    def route(self, path):
+        """
+        Returns the (status, payload) pair served for a request path.
+
+        A path is answered with the statuses queued in 'failures' first, then with
+        the status set in 'status_overrides' or the generated data.
+        """
+        with self._lock:
+            self.requests += 1
+            if self.failures.get(path):
+                return self.failures[path].pop(0), {}
+        if path in self.status_overrides:
+            return self.status_overrides[path], {}
+        return self.payload(path)
+
+    def payload(self, path):
+        """
+        Returns the (status, payload) pair of the generated network for a request path.
+        """
+        match = re.fullmatch(r'/pjp-api/rest/station/findAll', path)
+        if match:
+            return 200, self.stations
+        match = re.fullmatch(r'/pjp-api/rest/station/sensors/(\d+)', path)
+        if match and int(match.group(1)) in self.sensors:
+            return 200, self.sensors[int(match.group(1))]
+        match = re.fullmatch(r'/pjp-api/rest/data/getData/(\d+)', path)
+        if match:
+            return 200, self.measurements(int(match.group(1)))
+        match = re.fullmatch(r'/pjp-api/rest/aqindex/getIndex/(\d+)', path)
+        if match and int(match.group(1)) in self.sensors:
+            return 200, self.index(int(match.group(1)))
+        return 404, {}
+
+    @contextmanager
+    def patch_fetcher(self, rate_limiter=None, retry_policy=None):
+        """
+        Points data_fetcher at the stub for the duration of the 'with' block.
+        Rate limiting is turned off and failed requests are retried without waiting, unless given.
+        """
+        from prod_aplikacja import data_fetcher
+
+        retry_policy = retry_policy or data_fetcher.RetryPolicy(retries=2, backoff=0, timeout=5)
+        with patch.object(data_fetcher, 'BASE_URL', self.base_url), \
+                patch.object(data_fetcher, 'rate_limiter', rate_limiter), \
+                patch.object(data_fetcher, 'retry_policy', retry_policy):
+            yield self
+
+    def start(self):
+        """
+        Starts the server on a free local port in a background thread.
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                try:
+                    self.answer()
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def answer(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = stub.route(self.path)
+                body = json.dumps(payload).encode('utf-8')
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if stub.etags and status == 200 and self.headers.get('If-None-Match') == etag:
+                    with stub._lock:
+                        stub.not_modified += 1
+                    status, body = 304, b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if stub.etags:
+                    self.send_header('ETag', etag)
+                if status == 429 and stub.retry_after is not None:
+                    self.send_header('Retry-After', str(stub.retry_after))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Shuts the server down.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# The prefix of the request paths served by the stubs, the path of data_fetcher.BASE_URL.
+API_PREFIX = '/pjp-api/rest/'
+
+
+def load_recording(path):
+    """
+    Reads responses recorded from the real API, see benchmarks.suite.record().
+
+    Parameters:
+    path (str): The recording, a JSON object mapping request paths relative to the API root
+                (e.g. 'station/findAll') to response bodies, gzip-compressed if the name ends with '.gz'.
+
+    Returns:
+    dict: The responses by relative path.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as file:
+        return json.load(file)
+
+
+class ReplayApi(StubApi):
+    """
+    A stub of the API replaying responses recorded from the real one, so that benchmarks run against the
+    real shape and size of the network. Paths that were not recorded are answered with 404 Not Found.
+    """
+    def __init__(self, recording, latency=0.0):
+        """
+        Initializes the stub with recorded responses.
+
+        Parameters:
+        recording (dict): The responses by path relative to the API root, see load_recording().
+        latency (float): The delay in seconds added to every response.
+        """
+        super().__init__(stations=0, latency=latency)
+        self.recording = recording
+        self.stations = recording.get('station/findAll', [])
+        self.sensors = {station['id']: recording.get(f"station/sensors/{station['id']}", [])
+                        for station in self.stations}
+
+    def measurements(self, sensor_id):
+        """
+        Returns the recorded measurement payload of a sensor.
+        """
+        return self.recording.get(f'data/getData/{sensor_id}')
+
+    def payload(self, path):
+        """
+        Returns the recorded response of a request path.
+        """
+        if path.startswith(API_PREFIX) and path[len(API_PREFIX):] in self.recording:
+            return 200, self.recording[path[len(API_PREFIX):]]
+        return 404, {}
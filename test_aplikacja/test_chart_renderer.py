@@ -0,0 +1,84 @@
+import multiprocessing
+import pytest
+import matplotlib.pyplot as plt
+from prod_aplikacja.chart_renderer import render_chart, render_many, main
+from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.database_manager import DatabaseManager
+from test_aplikacja.conftest import hourly_readings
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fixture providing a database file with the measurements of three sensors."""
+    db_path = str(tmp_path / 'charts.db')
+    db_manager = DatabaseManager(db_path)
+    for sensor_id in (101, 102, 103):
+        db_manager.insert_measurements(hourly_readings(24 * 30), sensor_id)
+    db_manager.close_connection()
+    return db_path
+
+
+def test_render_chart_to_bytes():
+    """
+    Test that a chart is rendered to PNG and SVG bytes without creating pyplot figures.
+    """
+    visualizer = Visualize_data(hourly_readings(48)['values'])
+
+    png = render_chart(visualizer)
+    svg = render_chart(visualizer, format='svg')
+
+    assert png.startswith(PNG_SIGNATURE)
+    assert b'<svg' in svg
+    assert plt.get_fignums() == []
+
+
+def test_render_many_writes_files(db_path, tmp_path):
+    """
+    Test that the charts of several sensors are rendered in worker processes and written to files.
+    """
+    output_dir = tmp_path / 'report'
+
+    results = sorted(render_many(db_path, [101, 102, 103], str(output_dir), max_workers=2))
+
+    assert [result.sensor_id for result in results] == [101, 102, 103]
+    assert all(result.error is None for result in results)
+    for result in results:
+        assert result.output == str(output_dir / f'sensor_{result.sensor_id}.png')
+        with open(result.output, 'rb') as file:
+            assert file.read(8) == PNG_SIGNATURE
+
+
+def test_render_many_returns_bytes_and_errors(db_path):
+    """
+    Test that without a directory the charts are returned as bytes, and a failing chart does not stop the others.
+    """
+    fork = multiprocessing.get_context('fork')
+    results = {result.sensor_id: result
+               for result in render_many(db_path, [101, 102], format='svg', max_workers=2, mp_context=fork)}
+    failed = list(render_many(db_path, [101], format='no-such-format', max_workers=1, mp_context=fork))
+
+    assert b'<svg' in results[101].output and b'<svg' in results[102].output
+    assert failed[0].output is None
+    assert isinstance(failed[0].error, ValueError)
+
+
+def test_main_renders_every_sensor(db_path, tmp_path, monkeypatch, capsys):
+    """
+    Test that the command line renders the chart of every stored sensor.
+    """
+    db_manager = DatabaseManager(db_path)
+    db_manager.insert_sensors({'id': sensor_id, 'stationId': 1,
+                               'param': {'paramName': 'pył zawieszony PM10', 'paramFormula': 'PM10',
+                                         'paramCode': 'PM10', 'idParam': 3}}
+                              for sensor_id in (101, 102))
+    db_manager.close_connection()
+    output_dir = tmp_path / 'report'
+    monkeypatch.setattr('sys.argv', ['chart_renderer', '--db', db_path, '--output', str(output_dir),
+                                     '--workers', '1'])
+
+    main()
+
+    assert sorted(path.name for path in output_dir.iterdir()) == ['sensor_101.png', 'sensor_102.png']
+    assert "Rendered 2 of 2 charts" in capsys.readouterr().out
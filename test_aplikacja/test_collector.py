@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from prod_aplikacja.collector import Collector, format_stats, main
+from prod_aplikacja.database_manager import DatabaseManager
+
+pytestmark = pytest.mark.stub_api(stations=2, sensors_per_station=3)
+
+# The stub serves hourly readings up to 2024-01-03 23:00, shortly after which the collector runs.
+NOW = datetime(2024, 1, 4, 0, 10)
+
+
+@pytest.fixture
+def db_manager():
+    """Fixture providing an empty in-memory database."""
+    return DatabaseManager(':memory:')
+
+
+def test_cycle_collects_stations_sensors_and_measurements(stub_api, db_manager):
+    """
+    Test that the first cycle stores the stations, their sensors, the readings of every sensor and the indices.
+    """
+    stats = Collector(db_manager, concurrency=4, now=lambda: NOW).run_cycle()
+
+    assert (stats.cycle, stats.stations, stats.sensors, stats.inserted, stats.indices) == (1, 2, 6, 6 * 72, 2)
+    assert stats.requests == 1 + 2 + 6 + 2 and stats.failed == 0
+    assert not stats.cancelled
+    assert len(db_manager.fetch_stations()) == 2
+    assert len(db_manager.fetch_measurements(101)) == 72
+    assert 'cycle 1' in format_stats(stats)
+
+
+def test_metadata_refreshed_on_its_own_schedule(stub_api, db_manager):
+    """
+    Test that later cycles only request the sensors whose readings are not current and the indices,
+    and stations and sensors again once metadata_interval has passed.
+    """
+    clock = [0.0]
+    collector = Collector(db_manager, concurrency=4, metadata_interval=100, max_age=timedelta(hours=2),
+                          clock=lambda: clock[0], now=lambda: NOW)
+    collector.run_cycle()
+    requests_before = stub_api.requests
+
+    clock[0] = 50.0
+    stats = collector.run_cycle()
+    assert (stats.requests, stats.stations, stats.skipped, stats.inserted, stats.indices) == (2, 0, 6, 0, 0)
+    assert stub_api.requests == requests_before + 2
+
+    clock[0] = 150.0
+    assert collector.run_cycle().stations == 2
+    assert collector.cycles == 3 and collector.total_inserted == 6 * 72
+
+
+def test_stop_interrupts_cycle_and_run(stub_api, db_manager):
+    """
+    Test that a stopped collector ends its cycle early and run() returns without waiting for the next one.
+    """
+    collector = Collector(db_manager, interval=3600, concurrency=1, now=lambda: NOW)
+    cycles = []
+
+    def on_cycle(stats):
+        cycles.append(stats)
+        collector.stop()
+
+    thread = threading.Thread(target=collector.run, kwargs={'on_cycle': on_cycle})
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert len(cycles) == 1
+
+    stopped = Collector(db_manager, now=lambda: NOW)
+    stopped.stop()
+    assert stopped.run_cycle().cancelled
+
+
+def test_main_runs_given_number_of_cycles(stub_api, tmp_path, capsys):
+    """
+    Test the command line entry point with a limited number of cycles.
+    """
+    db_path = str(tmp_path / 'collector.db')
+
+    assert main(['--db', db_path, '--interval', '0', '--cycles', '2', '--concurrency', '4']) == 0
+
+    output = capsys.readouterr().out
+    assert 'cycle 1' in output and 'cycle 2' in output
+    assert 'Stopped after 2 cycles' in output
+    db_manager = DatabaseManager(db_path)
+    assert len(db_manager.fetch_measurements(101)) == 72
+    db_manager.close_connection()
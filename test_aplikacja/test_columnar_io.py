@@ -0,0 +1,73 @@
+import os
+import pytest
+from prod_aplikacja.database_manager import DatabaseManager
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.dataset as ds
+from prod_aplikacja.columnar_io import export_database, import_database, open_measurements
+
+readings = [
+    {'date': '2024-01-31 22:00:00', 'value': 10.0},
+    {'date': '2024-01-31 23:00:00', 'value': None},
+    {'date': '2024-02-01 00:00:00', 'value': 30.0},
+    {'date': '2024-02-01 01:00:00', 'value': 40.0},
+    {'date': '2024-02-01 02:00:00', 'value': 50.0},
+]
+
+
+@pytest.fixture
+def db_manager():
+    """Fixture providing an in-memory database with one station, two sensors and their measurements."""
+    db_manager = DatabaseManager(':memory:')
+    db_manager.insert_stations([(1, 'Station A', '50.0', '19.0', 10, 'Street 1')])
+    db_manager.insert_sensors([
+        {'id': sensor_id, 'stationId': 1, 'param': {'paramName': 'pył zawieszony PM10', 'paramFormula': 'PM10',
+                                                   'paramCode': 'PM10', 'idParam': 3}}
+        for sensor_id in (101, 102)])
+    db_manager.insert_measurements({'values': readings}, 101)
+    db_manager.insert_measurements({'values': readings[:2]}, 102)
+    return db_manager
+
+
+def test_round_trip(db_manager, tmp_path):
+    """
+    Test that an export read back into an empty database gives the same stations, sensors and measurements,
+    also when the chunks do not line up with the partitions.
+    """
+    counts = export_database(db_manager, str(tmp_path), chunk_size=2)
+    assert counts == {'stations': 1, 'sensors': 2, 'measurements': 7, 'files': 5}
+
+    restored = DatabaseManager(':memory:')
+    assert import_database(restored, str(tmp_path), chunk_size=2) == {'stations': 1, 'sensors': 2, 'measurements': 7}
+
+    assert restored.fetch_stations() == db_manager.fetch_stations()
+    assert restored.fetch_sensors(1) == db_manager.fetch_sensors(1)
+    for sensor_id in (101, 102):
+        assert ([row[1:] for row in restored.fetch_measurements(sensor_id)]
+                == [row[1:] for row in db_manager.fetch_measurements(sensor_id)])
+    assert restored.fetch_rollups(101, 'month') == db_manager.fetch_rollups(101, 'month')
+
+
+def test_partitioned_by_sensor_and_month(db_manager, tmp_path):
+    """
+    Test that the measurements are written in one directory per sensor and month.
+    """
+    export_database(db_manager, str(tmp_path))
+
+    root = tmp_path / 'measurements'
+    assert sorted(os.listdir(root)) == ['sensor=101', 'sensor=102']
+    assert sorted(os.listdir(root / 'sensor=101')) == ['month=2024-01', 'month=2024-02']
+    assert sorted(os.listdir(root / 'sensor=102')) == ['month=2024-01']
+
+
+def test_open_measurements_filters_partitions(db_manager, tmp_path):
+    """
+    Test that the exported dataset can be filtered on the partition columns without the database.
+    """
+    export_database(db_manager, str(tmp_path))
+
+    table = open_measurements(str(tmp_path)).to_table(
+        filter=(ds.field('sensor') == 101) & (ds.field('month') == '2024-02'))
+
+    assert table.column('value').to_pylist() == [30.0, 40.0, 50.0]
+    assert str(table.column('date')[0]) == '2024-02-01 00:00:00'
@@ -1,5 +1,7 @@
+import sqlite3
+import numpy as np
 import pytest
-from prod_aplikacja.data_analyzer import Analyze_Data
+from prod_aplikacja.data_analyzer import Analyze_Data, RunningSummary, summarize_chunks
 
 # Sample data for testing
 sample_data = [
@@ -53,3 +55,93 @@ def test_trend(analyzer):
     """
     expected_trend = (20.0 - 10.0 + 30.0 - 20.0 + 40.0 - 30.0 + 50.0 - 40.0) / 4
     assert analyzer.trend('value') == pytest.approx(expected_trend)
+
+
+def test_summary(analyzer):
+    """
+    Test for the summary method.
+    Ensures that all statistics agree with the single-statistic methods and with NumPy.
+    """
+    summary = analyzer.summary()
+
+    assert summary['count'] == 5
+    assert summary['min'] == analyzer.min_value('value')
+    assert summary['max'] == analyzer.max_value('value')
+    assert summary['mean'] == pytest.approx(analyzer.mean_value('value'))
+    assert summary['std'] == pytest.approx(np.std([10.0, 20.0, 30.0, 40.0, 50.0], ddof=1))
+    assert summary['p50'] == pytest.approx(30.0)
+    assert summary['trend'] == pytest.approx(analyzer.trend('value'))
+    assert summary['slope'] == pytest.approx(10.0)
+
+
+def test_summary_sorts_by_time_and_skips_missing_values():
+    """
+    Test that the trend and slope follow the timestamps, not the order of the rows, and ignore missing values.
+    """
+    analyzer = Analyze_Data.from_arrays(
+        np.array(['2024-01-01 02:00:00', '2024-01-01 00:00:00', '2024-01-01 03:00:00', '2024-01-01 01:00:00'],
+                 dtype='datetime64[s]'),
+        np.array([30.0, 10.0, np.nan, 20.0]))
+
+    summary = analyzer.summary()
+
+    assert summary['count'] == 3
+    assert summary['trend'] == pytest.approx(10.0)
+    assert summary['slope'] == pytest.approx(10.0)
+
+
+def test_summary_of_empty_series():
+    """
+    Test that a series without values has a count of 0 and undefined statistics.
+    """
+    summary = Analyze_Data.from_arrays(np.array([], dtype='datetime64[s]'), np.array([])).summary()
+
+    assert summary['count'] == 0
+    assert np.isnan(summary['mean'])
+    assert np.isnan(summary['trend'])
+
+
+def test_from_cursor():
+    """
+    Test that an analyzer reads the rows of a SQL cursor over the 'measurements' table.
+    """
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     [(101, row['timestamp'], row['value']) for row in sample_data])
+
+    analyzer = Analyze_Data.from_cursor(conn.execute('SELECT * FROM measurements'), chunk_size=2)
+
+    assert analyzer.summary() == pytest.approx(Analyze_Data(sample_data).summary())
+    assert analyzer.max_value('value') == 50.0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_summarize_chunks_matches_summary(chunk_size):
+    """
+    Test that the statistics computed chunk by chunk agree with summary() over the whole series,
+    whatever the size and order of the chunks.
+    """
+    rng = np.random.default_rng(1)
+    dates = np.datetime64('2024-01-01T00:00:00') + np.arange(500) * np.timedelta64(1, 'h')
+    values = rng.normal(30, 8, 500) + np.arange(500) * 0.05
+    values[[7, 100]] = np.nan
+    chunks = [{'date': dates[n:n + chunk_size], 'value': values[n:n + chunk_size]}
+              for n in range(0, 500, chunk_size)]
+
+    expected = Analyze_Data.from_arrays(dates, values).summary()
+    for streamed in (summarize_chunks(chunks), summarize_chunks(chunks[::-1])):
+        assert set(streamed) == set(RunningSummary.STATS)
+        for name in RunningSummary.STATS:
+            assert streamed[name] == pytest.approx(expected[name])
+    assert Analyze_Data.from_chunks(chunks).summary() == pytest.approx(expected, nan_ok=True)
+
+
+def test_summarize_chunks_of_empty_series():
+    """
+    Test that a series without chunks has a count of 0 and undefined statistics.
+    """
+    summary = summarize_chunks([])
+
+    assert summary['count'] == 0
+    assert np.isnan(summary['mean']) and np.isnan(summary['slope'])
@@ -1,7 +1,13 @@
+import gzip
+import json
+import time
 import pytest
 import requests
 from unittest.mock import patch
-from prod_aplikacja.data_fetcher import fetch_station, fetch_sensor, fetch_measurement
+from prod_aplikacja import data_fetcher
+from prod_aplikacja.data_fetcher import (fetch_station, fetch_sensor, fetch_measurement, fetch_index, fetch_many, fetch_all,
+                                         RateLimiter, RetryPolicy, TransientFetchError, PermanentFetchError)
+from test_aplikacja.stub_server import StubApi, ReplayApi, load_recording
 
 # Mock data
 mock_station_data = [
@@ -21,40 +27,271 @@ mock_measurement_data = {
     ]
 }
 
+mock_index_data = {
+    'id': 1, 'stCalcDate': '2024-01-01 01:20:00', 'stIndexLevel': {'id': 1, 'indexLevelName': 'Dobry'},
+    'stSourceDataDate': '2024-01-01 01:00:00',
+}
+
 # Test for fetch_station
-@patch('prod_aplikacja.data_fetcher.requests.get')
-def test_fetch_station(mock_get):
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_fetch_station(mock_get_session):
     """Test for the fetch_station function."""
+    mock_get = mock_get_session.return_value.get
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = mock_station_data
 
     stations = fetch_station()
     assert len(stations) == 2
     assert stations[0]['stationName'] == 'Station 1'
-    mock_get.assert_called_once_with("https://powietrze.gios.gov.pl/pjp-api/rest/station/findAll")
+    mock_get.assert_called_once_with("https://powietrze.gios.gov.pl/pjp-api/rest/station/findAll", headers={}, timeout=data_fetcher.retry_policy.timeout)
 
 # Test for fetch_sensor
-@patch('prod_aplikacja.data_fetcher.requests.get')
-def test_fetch_sensor(mock_get):
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_fetch_sensor(mock_get_session):
     """Test for the fetch_sensor function."""
     station_id = 1
+    mock_get = mock_get_session.return_value.get
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = mock_sensor_data
 
     sensors = fetch_sensor(station_id)
     assert len(sensors) == 2
     assert sensors[0]['param']['paramName'] == 'PM10'
-    mock_get.assert_called_once_with(f"https://powietrze.gios.gov.pl/pjp-api/rest/station/sensors/{station_id}")
+    mock_get.assert_called_once_with(f"https://powietrze.gios.gov.pl/pjp-api/rest/station/sensors/{station_id}", headers={}, timeout=data_fetcher.retry_policy.timeout)
 
 # Test for fetch_measurement
-@patch('prod_aplikacja.data_fetcher.requests.get')
-def test_fetch_measurement(mock_get):
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_fetch_measurement(mock_get_session):
     """Test for the fetch_measurement function."""
     sensor_id = 101
+    mock_get = mock_get_session.return_value.get
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = mock_measurement_data
 
     measurements = fetch_measurement(sensor_id)
     assert len(measurements['values']) == 2
     assert measurements['values'][0]['value'] == 10.0
-    mock_get.assert_called_once_with(f"https://powietrze.gios.gov.pl/pjp-api/rest/data/getData/{sensor_id}")
+    mock_get.assert_called_once_with(f"https://powietrze.gios.gov.pl/pjp-api/rest/data/getData/{sensor_id}", headers={}, timeout=data_fetcher.retry_policy.timeout)
+
+
+
+# Test for fetch_index
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_fetch_index(mock_get_session):
+    """Test for the fetch_index function."""
+    station_id = 1
+    mock_get = mock_get_session.return_value.get
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = mock_index_data
+
+    index = fetch_index(station_id)
+    assert index['stIndexLevel']['indexLevelName'] == 'Dobry'
+    mock_get.assert_called_once_with(f"https://powietrze.gios.gov.pl/pjp-api/rest/aqindex/getIndex/{station_id}", headers={}, timeout=data_fetcher.retry_policy.timeout)
+
+
+def test_fetch_station_uses_shared_session(stub_api):
+    """Test that consecutive fetches reuse the shared keep-alive session."""
+    assert data_fetcher.get_session() is data_fetcher.get_session()
+    assert len(fetch_station()) == 5
+
+
+def test_fetch_all(stub_api):
+    """Test that fetch_all streams the stations, the sensors of every station and the measurements of every sensor."""
+    results = list(fetch_all(concurrency=4))
+
+    kinds = [result.kind for result in results]
+    assert kinds[0] == 'stations'
+    assert kinds.count('sensors') == 5
+    assert kinds.count('measurements') == 15
+    assert all(result.error is None for result in results)
+    assert {result.key for result in results if result.kind == 'measurements'} == set(stub_api.sensor_ids)
+
+
+def test_fetch_all_selected_stations(stub_api):
+    """Test that fetch_all only fetches the given stations and skips the station list."""
+    results = list(fetch_all(station_ids=[1, 2], concurrency=2))
+
+    assert {result.key for result in results if result.kind == 'sensors'} == {1, 2}
+    assert sum(result.kind == 'measurements' for result in results) == 6
+
+
+def test_fetch_many_reports_errors(stub_api):
+    """Test that a failed request is reported in its result and does not stop the others."""
+    stub_api.status_overrides['/pjp-api/rest/data/getData/102'] = 500
+
+    results = {result.key: result for result in fetch_many('measurements', [101, 102, 103])}
+
+    assert results[101].error is None
+    assert len(results[101].data['values']) == 72
+    assert str(results[102].error) == "Failed to fetch measurement data"
+    assert results[103].error is None
+
+
+@pytest.mark.parametrize('concurrency', [1, 4, 16])
+def test_fetch_many_concurrency(stub_api, concurrency):
+    """
+    Test that fetch_many keeps up to 'concurrency' requests in flight and never more.
+    The throughput itself is measured by benchmarks/bench_fetch.py.
+    """
+    stub_api.latency = 0.05
+    sensor_ids = stub_api.sensor_ids
+
+    results = list(fetch_many('measurements', sensor_ids, concurrency=concurrency))
+
+    assert len(results) == len(sensor_ids)
+    assert stub_api.peak_in_flight <= concurrency
+    assert stub_api.peak_in_flight >= min(concurrency, 2)
+
+
+def test_transient_failures_are_retried(stub_api):
+    """Test that server errors and throttling are retried until the request succeeds."""
+    stub_api.failures['/pjp-api/rest/station/sensors/1'] = [503, 429]
+
+    sensors = fetch_sensor(1)
+
+    assert len(sensors) == 3
+    assert stub_api.requests == 3
+
+
+def test_transient_failure_after_retries(stub_api):
+    """Test that a request failing on every attempt raises TransientFetchError with the last status."""
+    stub_api.status_overrides['/pjp-api/rest/station/sensors/1'] = 502
+
+    with pytest.raises(TransientFetchError) as error:
+        fetch_sensor(1)
+
+    assert error.value.status_code == 502
+    assert stub_api.requests == 3
+
+
+def test_permanent_failure_not_retried(stub_api):
+    """Test that a request rejected by the API raises PermanentFetchError at once."""
+    with pytest.raises(PermanentFetchError) as error:
+        fetch_sensor(999)
+
+    assert error.value.status_code == 404
+    assert str(error.value) == "Failed to fetch sensor data"
+    assert stub_api.requests == 1
+
+
+def test_timeout_is_transient(stub_api):
+    """Test that a response slower than the read timeout raises TransientFetchError instead of hanging."""
+    stub_api.latency = 0.5
+
+    with patch.object(data_fetcher, 'retry_policy', RetryPolicy(retries=1, backoff=0, timeout=0.1)):
+        start = time.perf_counter()
+        with pytest.raises(TransientFetchError):
+            fetch_station()
+
+    assert time.perf_counter() - start < 0.45
+
+
+@pytest.mark.parametrize('exception, expected, attempts', [
+    (requests.exceptions.ChunkedEncodingError, TransientFetchError, 3),
+    (requests.exceptions.ContentDecodingError, TransientFetchError, 3),
+    (requests.exceptions.TooManyRedirects, PermanentFetchError, 1),
+])
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_request_exceptions_are_typed(mock_get_session, exception, expected, attempts):
+    """Test that every failure of requests is raised as a FetchError, retried only when it may go away."""
+    mock_get = mock_get_session.return_value.get
+    mock_get.side_effect = exception("failed")
+
+    with patch.object(data_fetcher, 'retry_policy', RetryPolicy(retries=2, backoff=0)):
+        with pytest.raises(expected) as error:
+            fetch_station()
+
+    assert isinstance(error.value.__cause__, exception)
+    assert mock_get.call_count == attempts
+
+
+@patch('prod_aplikacja.data_fetcher.get_session')
+def test_truncated_body_is_retried(mock_get_session):
+    """Test that a body shorter than its Content-Length is downloaded again, and other invalid bodies are not."""
+    truncated = requests.Response()
+    truncated.status_code, truncated._content = 200, b'[{"id": 1'
+    truncated.headers['Content-Length'] = '40'
+    complete = requests.Response()
+    complete.status_code, complete._content = 200, json.dumps(mock_station_data).encode()
+    mock_get = mock_get_session.return_value.get
+    mock_get.side_effect = [truncated, complete]
+
+    with patch.object(data_fetcher, 'retry_policy', RetryPolicy(retries=2, backoff=0)):
+        assert fetch_station() == mock_station_data
+        invalid = requests.Response()
+        invalid.status_code, invalid._content = 200, b'<html>'
+        mock_get.side_effect = [invalid]
+        with pytest.raises(PermanentFetchError):
+            fetch_station()
+
+    assert mock_get.call_count == 3
+
+
+def test_throttling_slows_down_the_rate_limiter(stub_api):
+    """Test that a 429 answer halves the shared rate and that Retry-After is respected."""
+    limiter = RateLimiter(rate=100)
+    stub_api.failures['/pjp-api/rest/station/findAll'] = [429]
+    stub_api.retry_after = 0.2
+
+    with patch.object(data_fetcher, 'rate_limiter', limiter):
+        start = time.perf_counter()
+        fetch_station()
+
+    assert time.perf_counter() - start >= 0.2
+    assert limiter.rate == pytest.approx(50 + 1)
+
+
+def test_retry_policy_backoff():
+    """Test that the backoff grows exponentially up to its cap and honours Retry-After."""
+    policy = RetryPolicy(backoff=1, max_backoff=10)
+
+    assert all(0 <= policy.delay(0) <= 1 for _ in range(100))
+    assert all(0 <= policy.delay(2) <= 4 for _ in range(100))
+    assert all(policy.delay(10) <= 10 for _ in range(100))
+    assert policy.delay(0, retry_after=5) >= 5
+
+
+def test_rate_limiter_shared_by_threads():
+    """Test that the token bucket spaces requests from all callers at the configured rate after the burst."""
+    clock = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+
+    limiter = RateLimiter(rate=10, burst=2, clock=lambda: clock[0], sleep=sleep)
+    for _ in range(5):
+        limiter.acquire()
+
+    assert waits == pytest.approx([0.1, 0.2, 0.3])
+
+    clock[0] = 10.0
+    limiter.on_throttled()
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.rate == 5
+    assert waits[-2:] == pytest.approx([0.2, 0.4])
+
+
+def test_replayed_recording(tmp_path):
+    """
+    Test that recorded responses are served by the replaying stub, and paths that were not recorded are not found.
+    """
+    recording = {
+        'station/findAll': mock_station_data,
+        'station/sensors/1': mock_sensor_data,
+        'data/getData/101': mock_measurement_data,
+    }
+    path = str(tmp_path / 'recording.json.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        json.dump(recording, file)
+
+    with ReplayApi(load_recording(path)) as stub, stub.patch_fetcher():
+        results = list(fetch_all())
+
+    by_kind = {(result.kind, result.key): result for result in results}
+    assert by_kind[('stations', None)].data == mock_station_data
+    assert by_kind[('sensors', 1)].data == mock_sensor_data
+    assert by_kind[('measurements', 101)].data == mock_measurement_data
+    assert isinstance(by_kind[('sensors', 2)].error, PermanentFetchError)
+    assert len(results) == 1 + 2 + 2
@@ -1,7 +1,9 @@
 import pytest
+import numpy as np
 import pandas as pd
 from unittest.mock import patch
-from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.data_visualizer import Visualize_data, lttb
+import matplotlib.dates as md
 import matplotlib.pyplot as plt
 
 # Mock data for testing
@@ -20,19 +22,79 @@ def visualizer():
     return Visualize_data(mock_data)
 
 
-@patch('visualize_data.plt.show')
+@patch('prod_aplikacja.data_visualizer.plt.show')
 def test_plot_data(mock_show, visualizer):
     """
     Test for the plot_data method.
-    This test checks whether the plotting function is called correctly without errors.
+    This test checks whether the data is plotted against parsed dates with adaptive date ticks.
     """
-    with patch('data_visualizer.plot_data.plt.plot') as mock_plot, patch('data_visualizer.data_visualizer.plot_data.plt.xticks') as mock_xticks:
+    with patch('prod_aplikacja.data_visualizer.plt.xticks') as mock_xticks:
         visualizer.plot_data('value')
 
-        # Ensure that plt.plot and plt.show were called
-        mock_plot.assert_called_once_with(visualizer.data['date'], visualizer.data['value'])
-        mock_xticks.assert_called_once_with(visualizer.data['date'][::5], rotation=90)
+        ax = plt.gca()
+        line = ax.get_lines()[-1]
+        assert list(line.get_ydata()) == [10.0, 20.0, 30.0, 40.0, 50.0]
+        assert isinstance(ax.xaxis.get_major_formatter(), md.ConciseDateFormatter)
+        mock_xticks.assert_not_called()
         mock_show.assert_called_once()
+    plt.close('all')
+
+
+def test_dates_parsed_once(visualizer):
+    """
+    Test that the dates are converted to datetimes when the visualizer is created.
+    """
+    assert pd.api.types.is_datetime64_any_dtype(visualizer.data['date'])
+    assert visualizer.data['date'][0] == pd.Timestamp('2024-01-01')
+
+
+def test_database_dates_parsed():
+    """
+    Test that rows as returned by fetch_measurements() are parsed with the format of the stored dates.
+    """
+    visualizer = Visualize_data([(None, 101, '2024-01-01 00:00:00', 1.0), (None, 101, '2024-01-01 01:00:00', 2.0)])
+    assert list(visualizer.data['date']) == [pd.Timestamp('2024-01-01 00:00'), pd.Timestamp('2024-01-01 01:00')]
+
+
+@pytest.mark.parametrize('method', ['minmax', 'lttb'])
+def test_long_series_downsampled(method):
+    """
+    Test that a long series is reduced to a few points per pixel without losing its extremes and end points.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.normal(40, 5, 100000)
+    values[12345], values[67890] = 500.0, -100.0
+    dates = pd.date_range('2010-01-01', periods=len(values), freq='h')
+    visualizer = Visualize_data(pd.DataFrame({'date': dates, 'value': values}))
+
+    x, y = visualizer.points('value', 640, method)
+
+    assert len(y) <= 4 * 640
+    assert y.max() == 500.0 and y.min() == -100.0
+    assert x[0] == dates[0] and x[-1] == dates[-1]
+    assert (np.diff(x) > np.timedelta64(0)).all()
+
+
+def test_lttb_keeps_threshold_points():
+    """
+    Test that LTTB returns the requested number of indices, including the first and the last one.
+    """
+    x = np.arange(1000, dtype=float)
+    indices = lttb(x, np.sin(x / 10), 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert (np.diff(indices) > 0).all()
+    assert list(lttb(x[:10], x[:10], 50)) == list(range(10))
+
+
+def test_short_series_not_downsampled(visualizer):
+    """
+    Test that a series shorter than the plot width is drawn point by point, and unknown methods are rejected.
+    """
+    assert len(visualizer.points('value', 640)[1]) == 5
+    with pytest.raises(ValueError):
+        visualizer.points('value', 640, method='every-fifth')
 
 
 def test_missing_data(visualizer):
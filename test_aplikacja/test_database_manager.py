@@ -1,6 +1,12 @@
+import multiprocessing
 import pytest
 import sqlite3
-from prod_aplikacja.database_manager import DatabaseManager
+import threading
+import numpy as np
+from datetime import datetime
+from prod_aplikacja.data_analyzer import Analyze_Data
+from prod_aplikacja.database_manager import DatabaseManager, SCHEMA_VERSION, AGGREGATE_STATS
+from prod_aplikacja.rollups import to_epoch
 
 
 @pytest.fixture
@@ -86,3 +92,510 @@ def test_insert_air_quality_index(db_manager):
     air_quality_index = db_manager.fetch_air_quality_index(1)
     assert len(air_quality_index) == 1
     assert air_quality_index[0][4] == 'Good'
+
+
+def test_insert_measurements_deduplicates(db_manager):
+    """
+    Test that downloading the same measurements again does not duplicate them
+    and that a value which became known replaces the missing one.
+    """
+    first_download = {
+        'values': [
+            {'date': '2024-01-01 01:00:00', 'value': None},
+            {'date': '2024-01-01 00:00:00', 'value': 10.0},
+        ]
+    }
+    second_download = {
+        'values': [
+            {'date': '2024-01-01 02:00:00', 'value': None},
+            {'date': '2024-01-01 01:00:00', 'value': 20.0},
+            {'date': '2024-01-01 00:00:00', 'value': None},
+        ]
+    }
+
+    db_manager.insert_measurements(first_download, 101)
+    db_manager.insert_measurements(second_download, 101)
+    db_manager.insert_measurements(second_download, 101)
+
+    measurements = sorted(db_manager.fetch_measurements(101), key=lambda row: row[2])
+    assert [(row[2], row[3]) for row in measurements] == [
+        ('2024-01-01 00:00:00', 10.0),
+        ('2024-01-01 01:00:00', 20.0),
+        ('2024-01-01 02:00:00', None),
+    ]
+
+
+def test_migration_deduplicates_existing_database(tmp_path):
+    """
+    Test that opening a database created before the unique key existed removes its duplicated measurements
+    and brings it to the current schema version.
+    """
+    db_path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)', [
+        (101, '2024-01-01 00:00:00', 10.0),
+        (101, '2024-01-01 01:00:00', None),
+        (101, '2024-01-01 00:00:00', 10.0),
+        (101, '2024-01-01 01:00:00', 20.0),
+        (101, '2024-01-01 01:00:00', None),
+        (102, '2024-01-01 00:00:00', 5.0),
+    ])
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_path)
+
+    assert db_manager.schema_version() == SCHEMA_VERSION
+    measurements = sorted(db_manager.fetch_measurements(101), key=lambda row: row[2])
+    assert [(row[2], row[3]) for row in measurements] == [
+        ('2024-01-01 00:00:00', 10.0),
+        ('2024-01-01 01:00:00', 20.0),
+    ]
+    assert len(db_manager.fetch_measurements(102)) == 1
+    db_manager.close_connection()
+
+
+@pytest.mark.parametrize('query, params, index', [
+    ("SELECT * FROM measurements WHERE sensorId=?", (101,), 'PRIMARY KEY'),
+    ("SELECT ts FROM measurements WHERE sensorId=? AND value IS NOT NULL ORDER BY ts ASC LIMIT 1", (101,),
+     'PRIMARY KEY'),
+    ("SELECT ts FROM measurements WHERE sensorId=? AND value IS NOT NULL ORDER BY ts DESC LIMIT 1", (101,),
+     'PRIMARY KEY'),
+    ("SELECT * FROM sensors WHERE stationId=?", (1,), 'INDEX idx_sensors_station'),
+    ("SELECT * FROM air_quality_index WHERE stationId=?", (1,), 'INDEX idx_air_quality_index_station'),
+    ("SELECT * FROM stations ORDER BY stationName ASC", (), 'INDEX idx_stations_name'),
+])
+def test_read_queries_use_indexes(db_manager, query, params, index):
+    """
+    Test that the queries of the fetch methods are answered from the secondary indexes
+    instead of scanning whole tables.
+    """
+    plan = db_manager.conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    details = ' '.join(row[3] for row in plan)
+
+    assert f'USING {index}' in details
+    assert 'TEMP B-TREE' not in details
+
+
+def test_measurement_span_does_not_read_history(db_manager):
+    """
+    Test that the span of a sensor is found in the same number of steps whatever the length of its history.
+    """
+    def steps(sensor_id):
+        counted = []
+        db_manager.conn.set_progress_handler(lambda: counted.append(1), 1)
+        try:
+            span = db_manager.fetch_measurement_span(sensor_id)
+        finally:
+            db_manager.conn.set_progress_handler(None, 1)
+        return span, len(counted)
+
+    db_manager.insert_measurements({'values': [{'date': f'2024-01-01 {hour:02d}:00:00', 'value': 1.0}
+                                               for hour in range(2)]}, 1)
+    db_manager.insert_measurements({'values': [{'date': f'2024-01-{day:02d} {hour:02d}:00:00', 'value': 1.0}
+                                               for day in range(1, 29) for hour in range(24)]}, 2)
+
+    (first, last), short = steps(1)
+    _, long = steps(2)
+    assert (first, last) == (to_epoch('2024-01-01 00:00:00'), to_epoch('2024-01-01 01:00:00'))
+    assert long == short
+    assert db_manager.fetch_measurement_span(3) is None
+
+
+def test_iter_table_reads_in_key_order(db_manager):
+    """
+    Test that iter_table reads a whole table in key order, in chunks of stored columns.
+    """
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 01:00:00', 'value': 2.0},
+                                               {'date': '2024-01-01 00:00:00', 'value': 1.0}]}, 2)
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 00:00:00', 'value': 3.0}]}, 1)
+
+    chunks = list(db_manager.iter_table('measurements', chunk_size=2))
+
+    assert db_manager.table_columns('measurements') == ['sensorId', 'ts', 'value']
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert [(row[0], row[2]) for chunk in chunks for row in chunk] == [(1, 3.0), (2, 1.0), (2, 2.0)]
+    with pytest.raises(ValueError):
+        list(db_manager.iter_table('sqlite_master'))
+
+
+def test_insert_stations_from_generator(db_manager):
+    """
+    Test that insert_stations writes a whole collection given as a generator.
+    """
+    db_manager.insert_stations((n, f'Station {n}', 50.0, 20.0, n, '') for n in range(1, 101))
+
+    assert len(db_manager.fetch_stations()) == 100
+
+
+def test_bulk_commits_once(db_manager):
+    """
+    Test that inserts inside bulk() are committed together when the block exits.
+    """
+    sensor_data = ({'id': n, 'stationId': 1,
+                    'param': {'paramName': f'P{n}', 'paramFormula': 'P', 'paramCode': 'P', 'idParam': n}}
+                   for n in range(10))
+
+    with db_manager.bulk():
+        db_manager.insert_station((1, 'Station 1', 52.229675, 21.012230, 1, 'Street 1'))
+        with db_manager.bulk():
+            db_manager.insert_sensors(sensor_data)
+        assert db_manager.conn.in_transaction
+        db_manager.insert_measurements({'values': [{'date': '2024-01-01 00:00:00', 'value': 1.0}]}, 0)
+        assert db_manager.conn.in_transaction
+
+    assert not db_manager.conn.in_transaction
+    assert len(db_manager.fetch_stations()) == 1
+    assert len(db_manager.fetch_sensors(1)) == 10
+    assert len(db_manager.fetch_measurements(0)) == 1
+
+
+def test_bulk_rolls_back_on_error(db_manager):
+    """
+    Test that nothing written inside a failed bulk() block is kept.
+    """
+    with pytest.raises(KeyError):
+        with db_manager.bulk():
+            db_manager.insert_station((1, 'Station 1', 52.229675, 21.012230, 1, 'Street 1'))
+            db_manager.insert_sensors([{'id': 101, 'stationId': 1}])
+
+    assert db_manager.fetch_stations() == []
+    assert not db_manager.conn.in_transaction
+
+
+def test_wal_mode(tmp_path):
+    """
+    Test that the write-ahead log and the tuned pragmas are applied to every connection.
+    """
+    db_manager = DatabaseManager(str(tmp_path / 'wal.db'), wal=True, cache_size_kib=8192)
+
+    assert db_manager.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert db_manager.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert db_manager.conn.execute("PRAGMA cache_size").fetchone()[0] == -8192
+    db_manager.close_connection()
+
+
+@pytest.mark.parametrize('wal', [True, False])
+def test_concurrent_writers_and_readers(tmp_path, wal):
+    """
+    Test that several threads can write and read through one manager at the same time,
+    each of them on its own connection.
+    """
+    db_manager = DatabaseManager(str(tmp_path / 'threads.db'), wal=wal)
+    errors = []
+
+    def write(sensor_id):
+        try:
+            for hour in range(20):
+                db_manager.insert_measurements(
+                    {'values': [{'date': f'2024-01-01 {hour:02d}:00:00', 'value': float(hour)}]}, sensor_id)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(50):
+                db_manager.fetch_measurements(1)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(sensor_id,)) for sensor_id in range(4)]
+    threads += [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [len(db_manager.fetch_measurements(sensor_id)) for sensor_id in range(4)] == [20, 20, 20, 20]
+    assert len(db_manager._connections) == 9
+    db_manager.close_connection()
+    assert db_manager._connections == []
+
+
+def test_in_memory_database_shared_between_threads(db_manager):
+    """
+    Test that an in-memory database is visible from other threads.
+    """
+    db_manager.insert_station((1, 'Station 1', 52.229675, 21.012230, 1, 'Street 1'))
+    result = []
+
+    thread = threading.Thread(target=lambda: result.extend(db_manager.fetch_stations()))
+    thread.start()
+    thread.join()
+
+    assert len(result) == 1
+
+
+def test_fetch_latest_measurement_dates(db_manager):
+    """
+    Test that the newest date with a known value is returned for every requested sensor.
+    """
+    db_manager.insert_measurements({'values': [
+        {'date': '2024-01-01 02:00:00', 'value': None},
+        {'date': '2024-01-01 01:00:00', 'value': 20.0},
+        {'date': '2024-01-01 00:00:00', 'value': 10.0},
+    ]}, 101)
+
+    assert db_manager.fetch_latest_measurement_dates([101, 102]) == {101: '2024-01-01 01:00:00', 102: None}
+
+
+def test_aggregate_matches_summary(db_manager):
+    """
+    Test that the statistics computed by SQLite agree with Analyze_Data.summary() over the same rows,
+    whatever order the measurements were inserted in.
+    """
+    values = [12.0, 15.5, None, 9.0, 20.0, 18.0, 11.5, None, 14.0]
+    readings = [{'date': f'2024-01-01 {hour:02d}:00:00', 'value': value} for hour, value in enumerate(values)]
+    db_manager.insert_measurements({'values': readings[::-1]}, 101)
+
+    aggregate = db_manager.aggregate(101, stats=AGGREGATE_STATS)
+    summary = Analyze_Data.from_cursor(db_manager.fetch_measurements(101)).summary()
+
+    assert aggregate['count'] == 7
+    for name in AGGREGATE_STATS:
+        assert aggregate[name] == pytest.approx(summary[name])
+
+
+def test_aggregate_date_range(db_manager):
+    """
+    Test that only measurements from start (inclusive) to end (exclusive) are aggregated.
+    """
+    db_manager.insert_measurements({'values': [
+        {'date': f'2024-01-01 {hour:02d}:00:00', 'value': float(hour)} for hour in range(10)]}, 101)
+
+    aggregate = db_manager.aggregate(101, start=datetime(2024, 1, 1, 2), end='2024-01-01 05:00:00')
+
+    assert aggregate == {'count': 3, 'min': 2.0, 'max': 4.0, 'mean': 3.0, 'trend': 1.0}
+
+
+def test_aggregate_without_data(db_manager):
+    """
+    Test that a sensor without measurements has a count of 0 and no other statistics.
+    """
+    assert db_manager.aggregate(101, stats=AGGREGATE_STATS) == dict.fromkeys(AGGREGATE_STATS) | {'count': 0}
+    with pytest.raises(ValueError):
+        db_manager.aggregate(101, stats=('median',))
+
+
+def test_aggregate_reads_only_the_index(db_manager):
+    """
+    Test that the aggregation queries are answered from the (sensorId, ts) key of the measurements.
+    """
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 00:00:00', 'value': 1.0},
+                                               {'date': '2024-01-01 01:00:00', 'value': 2.0}]}, 101)
+    statements = []
+    db_manager.conn.set_trace_callback(statements.append)
+    db_manager.aggregate(101, stats=AGGREGATE_STATS)
+    db_manager.conn.set_trace_callback(None)
+
+    assert len(statements) == 4
+    for statement in statements:
+        plan = db_manager.conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+        details = ' '.join(row[3] for row in plan)
+        assert 'USING PRIMARY KEY' in details
+        assert 'TEMP B-TREE' not in details
+
+
+def test_fetch_measurements_after(db_manager):
+    """
+    Test that only measurements newer than the given date are returned, in time order.
+    """
+    db_manager.insert_measurements({'values': [
+        {'date': '2024-01-01 02:00:00', 'value': 30.0},
+        {'date': '2024-01-01 00:00:00', 'value': 10.0},
+        {'date': '2024-01-01 01:00:00', 'value': 20.0},
+    ]}, 101)
+
+    rows = db_manager.fetch_measurements_after(101, datetime(2024, 1, 1, 0))
+
+    assert [(row[2], row[3]) for row in rows] == [('2024-01-01 01:00:00', 20.0), ('2024-01-01 02:00:00', 30.0)]
+    assert db_manager.fetch_measurements_after(101, '2024-01-01 02:00:00') == []
+
+
+def test_iter_measurements(db_manager):
+    """
+    Test that the measurements of a sensor are read in time order, in chunks of at most chunk_size rows,
+    with only the requested columns and within the date range.
+    """
+    db_manager.insert_measurements({'values': [
+        {'date': f'2024-01-01 {hour:02d}:00:00', 'value': None if hour == 3 else float(hour)}
+        for hour in reversed(range(10))]}, 101)
+
+    chunks = list(db_manager.iter_measurements(101, start='2024-01-01 02:00:00', end=datetime(2024, 1, 1, 9),
+                                               chunk_size=3))
+
+    assert [len(chunk['date']) for chunk in chunks] == [3, 3, 1]
+    assert set(chunks[0]) == {'date', 'value'}
+    dates = np.concatenate([chunk['date'] for chunk in chunks])
+    values = np.concatenate([chunk['value'] for chunk in chunks])
+    assert dates.dtype == np.dtype('datetime64[s]')
+    assert list(dates) == list(np.arange('2024-01-01T02', '2024-01-01T09', dtype='datetime64[h]'))
+    assert np.isnan(values[1])
+    assert list(np.delete(values, 1)) == [2.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+
+
+def test_iter_measurements_as_frames(db_manager):
+    """
+    Test that chunks can be read as DataFrames, and that unknown columns are rejected.
+    """
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 00:00:00', 'value': 1.0}]}, 101)
+
+    frames = list(db_manager.iter_measurements(101, columns=('sensorId', 'value'), as_frame=True))
+
+    assert len(frames) == 1
+    assert list(frames[0].columns) == ['sensorId', 'value']
+    assert frames[0].iloc[0].tolist() == [101, 1.0]
+    assert list(db_manager.iter_measurements(102)) == []
+    with pytest.raises(ValueError):
+        next(db_manager.iter_measurements(101, columns=('date', 'stationId')))
+
+
+def test_insert_air_quality_indices_deduplicates(db_manager):
+    """
+    Test that an index downloaded again for the same calculation date is stored once,
+    and that indices the API has not calculated are skipped.
+    """
+    index = {'id': 1, 'stCalcDate': '2024-01-01 01:20:00', 'stIndexLevel': {'id': 1, 'indexLevelName': 'Dobry'},
+             'stSourceDataDate': '2024-01-01 01:00:00'}
+
+    assert db_manager.insert_air_quality_indices([index, dict(index, stIndexLevel=None),
+                                                  {'id': 2, 'stCalcDate': None, 'stIndexLevel': None}]) == 1
+    assert db_manager.insert_air_quality_indices([index]) == 0
+
+    assert [row[1:] for row in db_manager.fetch_air_quality_index(1)] == [
+        (1, '2024-01-01 01:20:00', 1, 'Dobry', '2024-01-01 01:00:00')]
+    assert db_manager.fetch_air_quality_index(2) == []
+
+
+def test_fetch_latest_air_quality_indices(db_manager):
+    """
+    Test that the newest index of every station is returned with one index lookup per station.
+    """
+    db_manager.insert_stations([(1, 'Station A', '50.0', '19.0', 10, ''), (2, 'Station B', '51.0', '20.0', 11, ''),
+                                (3, 'Station C', '52.0', '21.0', 12, '')])
+    db_manager.insert_air_quality_indices(
+        {'id': station_id, 'stCalcDate': f'2024-01-01 {hour:02d}:20:00',
+         'stIndexLevel': {'id': hour % 6, 'indexLevelName': f'Level {hour % 6}'}, 'stSourceDataDate': None}
+        for station_id in (1, 2) for hour in (5, 23, 11))
+
+    latest = db_manager.fetch_latest_air_quality_indices()
+
+    assert [(row[1], row[2], row[4]) for row in latest] == [(1, '2024-01-01 23:20:00', 'Level 5'),
+                                                            (2, '2024-01-01 23:20:00', 'Level 5')]
+    statements = []
+    db_manager.conn.set_trace_callback(statements.append)
+    db_manager.fetch_latest_air_quality_indices()
+    db_manager.conn.set_trace_callback(None)
+    plan = ' '.join(row[3] for row in db_manager.conn.execute(f"EXPLAIN QUERY PLAN {statements[0]}"))
+    assert 'INDEX idx_air_quality_index_station_date' in plan
+    assert 'SCAN a' not in plan and 'TEMP B-TREE' not in plan
+
+
+def test_reopening_current_schema_runs_no_ddl(tmp_path, monkeypatch):
+    """
+    Test that opening a database which already has the current schema version only reads the version.
+    """
+    db_path = str(tmp_path / 'test.db')
+    DatabaseManager(db_path).close_connection()
+    statements = []
+    connect = DatabaseManager._connect
+
+    def traced_connect(self):
+        conn = connect(self)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(DatabaseManager, '_connect', traced_connect)
+    db_manager = DatabaseManager(db_path)
+
+    assert db_manager.schema_version() == SCHEMA_VERSION
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith(('CREATE', 'BEGIN'))]
+    db_manager.close_connection()
+
+
+def test_migration_stores_dates_as_epoch_seconds(tmp_path):
+    """
+    Test that opening a database with text dates converts them to seconds since the epoch,
+    while the fetch methods still return the dates as strings.
+    """
+    db_path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.execute('''CREATE TABLE air_quality_index (id INTEGER PRIMARY KEY, stationId INTEGER, stCalcDate TEXT,
+                    stIndexLevel INTEGER, indexLevelName TEXT, stSourceDataDate TEXT)''')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     [(101, '2024-01-01 01:00:00', 20.0), (101, '2024-01-01 00:00:00', 10.0)])
+    conn.execute("INSERT INTO air_quality_index VALUES (7, 1, '2024-01-01 01:20:00', 1, 'Dobry', NULL)")
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_path)
+
+    assert db_manager.schema_version() == SCHEMA_VERSION
+    assert db_manager.conn.execute("SELECT DISTINCT typeof(ts) FROM measurements").fetchall() == [('integer',)]
+    assert db_manager.fetch_measurements(101) == [(None, 101, '2024-01-01 00:00:00', 10.0),
+                                                  (None, 101, '2024-01-01 01:00:00', 20.0)]
+    assert db_manager.fetch_air_quality_index(1) == [(7, 1, '2024-01-01 01:20:00', 1, 'Dobry', None)]
+    assert db_manager.fetch_rollups(101, 'hour') == [('2024-01-01 00:00:00', 1, 10.0, 10.0, 10.0),
+                                                    ('2024-01-01 01:00:00', 1, 20.0, 20.0, 20.0)]
+    db_manager.close_connection()
+
+
+def _open_when_started(db_path, start, results):
+    """Opens a database in a child process once all processes are ready and reports the outcome."""
+    start.wait()
+    try:
+        db_manager = DatabaseManager(db_path)
+        results.put((db_manager.schema_version(), len(db_manager.fetch_measurements(101))))
+        db_manager.close_connection()
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_concurrent_processes_migrate_once(tmp_path):
+    """
+    Test that processes opening an old database at the same time apply every migration only once.
+    """
+    db_path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     [(101, f'2024-01-{day:02d} {hour:02d}:00:00', float(hour))
+                      for day in range(1, 29) for hour in range(24)] * 2)
+    conn.commit()
+    conn.close()
+
+    spawn = multiprocessing.get_context('spawn')
+    start, results = spawn.Event(), spawn.Queue()
+    processes = [spawn.Process(target=_open_when_started, args=(db_path, start, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    start.set()
+    outcomes = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert outcomes == [(SCHEMA_VERSION, 28 * 24)] * 4
+
+
+def test_migration_keeps_unreadable_dates(tmp_path):
+    """
+    Test that measurements whose text date cannot be converted are moved aside with a warning, not lost.
+    """
+    db_path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     [(101, '2024-01-01 00:00:00', 10.0), (101, 'yesterday', 20.0), (102, None, 5.0)])
+    conn.commit()
+    conn.close()
+
+    with pytest.warns(UserWarning, match='2 measurements'):
+        db_manager = DatabaseManager(db_path)
+
+    assert db_manager.fetch_measurements(101) == [(None, 101, '2024-01-01 00:00:00', 10.0)]
+    assert db_manager.conn.execute('SELECT * FROM measurements_invalid_dates').fetchall() == [
+        (101, 'yesterday', 20.0), (102, None, 5.0)]
+    db_manager.close_connection()
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_heavy_modules():
+    """
+    Test that importing the GUI loads neither pandas, numpy nor matplotlib, which are imported on first use.
+    """
+    code = ("import sys, prod_aplikacja.gui; "
+            "print(','.join(m for m in ('pandas', 'numpy', 'matplotlib') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,152 @@
+import pytest
+from unittest.mock import patch
+from prod_aplikacja import data_fetcher
+from prod_aplikacja.data_fetcher import fetch_station, fetch_sensor, fetch_measurement
+from prod_aplikacja.http_cache import ResponseCache
+
+pytestmark = pytest.mark.stub_api(stations=3, sensors_per_station=2)
+
+
+class Clock:
+    """A clock advanced manually by the tests."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """Fixture providing a manual clock."""
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    """Fixture providing an in-memory response cache set as the cache of the fetchers."""
+    cache = ResponseCache(':memory:', clock=clock)
+    data_fetcher.set_cache(cache)
+    yield cache
+    data_fetcher.set_cache(None)
+    cache.close()
+
+
+def test_fresh_response_served_without_request(stub_api, cache, clock):
+    """
+    Test that a response younger than the time to live of its endpoint is served from the cache.
+    """
+    first = fetch_station()
+    clock.now += 3600
+    second = fetch_station()
+    fetch_sensor(1)
+    fetch_sensor(1)
+
+    assert first == second
+    assert stub_api.requests == 2
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 2
+
+
+def test_stale_response_revalidated(stub_api, cache, clock):
+    """
+    Test that an expired response is revalidated with its ETag and reused after a 304 answer.
+    """
+    fetch_station()
+    clock.now += 2 * 24 * 3600
+    stations = fetch_station()
+    fetch_measurement(101)
+    measurements = fetch_measurement(101)
+
+    assert len(stations) == 3
+    assert len(measurements['values']) == 72
+    assert stub_api.not_modified == 2
+    assert cache.stats()['revalidations'] == 2
+    assert cache.stats()['hit_rate'] == pytest.approx(0.5)
+
+
+def test_revalidation_counts_as_success_for_rate_limiter(stub_api, cache, clock):
+    """
+    Test that a 304 answer lets the rate limiter recover like a downloaded response.
+    """
+    fetch_station()
+    clock.now += 2 * 24 * 3600
+    limiter = data_fetcher.RateLimiter(rate=100)
+    limiter.rate = 50
+
+    with patch.object(data_fetcher, 'rate_limiter', limiter):
+        fetch_station()
+
+    assert stub_api.not_modified == 1
+    assert limiter.rate == pytest.approx(51)
+
+
+def test_changed_response_replaced(stub_api, cache, clock):
+    """
+    Test that a response which changed on the server is downloaded again and replaces the cached one.
+    """
+    fetch_measurement(101)
+    stub_api.values_per_sensor = 73
+
+    assert len(fetch_measurement(101)['values']) == 73
+    assert stub_api.not_modified == 0
+
+
+def test_cache_persists_between_runs(stub_api, tmp_path):
+    """
+    Test that a cache file filled in one run serves the next one without network round trips.
+    """
+    path = str(tmp_path / 'cache.db')
+    data_fetcher.set_cache(ResponseCache(path))
+    fetch_station()
+    data_fetcher.get_cache().close()
+
+    data_fetcher.set_cache(ResponseCache(path))
+    try:
+        fetch_station()
+        assert stub_api.requests == 1
+        assert data_fetcher.get_cache().stats()['hits'] == 1
+    finally:
+        data_fetcher.get_cache().close()
+        data_fetcher.set_cache(None)
+
+
+def test_least_recently_used_evicted(clock):
+    """
+    Test that storing beyond max_bytes evicts the least recently used responses.
+    """
+    cache = ResponseCache(':memory:', max_bytes=250, clock=clock)
+    for n in range(3):
+        cache.store(f'url{n}', b'x' * 100)
+        clock.now += 1
+    assert cache.lookup('url0') is None
+    assert cache.evictions == 1
+
+    cache.lookup('url1')
+    clock.now += 1
+    cache.store('url3', b'x' * 100)
+
+    assert cache.lookup('url1') is not None
+    assert cache.lookup('url2') is None
+    assert cache.stats()['size'] == 200
+
+
+def test_hits_do_not_write(clock, tmp_path):
+    """
+    Test that lookups only read the file and that their access times are written in batches and on close.
+    """
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path, clock=clock)
+    cache.store('url0', b'x')
+    changes = cache.conn.total_changes
+    clock.now += 10
+    for _ in range(100):
+        assert cache.lookup('url0') is not None
+
+    assert cache.conn.total_changes == changes
+    assert cache.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    cache.close()
+
+    cache = ResponseCache(path, clock=clock)
+    assert cache.conn.execute('SELECT lastAccess FROM responses').fetchone()[0] == clock.now
+    cache.close()
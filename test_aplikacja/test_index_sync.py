@@ -0,0 +1,51 @@
+import pytest
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.index_sync import IndexSync
+
+pytestmark = pytest.mark.stub_api(stations=5, sensors_per_station=1)
+
+
+@pytest.fixture
+def db_manager(stub_api):
+    """Fixture providing an in-memory database that knows the stations of the stub."""
+    db_manager = DatabaseManager(':memory:')
+    db_manager.insert_stations((station['id'], station['stationName'], station['gegrLat'], station['gegrLon'],
+                                station['city']['id'], station['addressStreet']) for station in stub_api.stations)
+    return db_manager
+
+
+def test_sync_stores_index_of_every_station(stub_api, db_manager):
+    """
+    Test that the index of every stored station is downloaded and stored in batches.
+    """
+    progress = []
+    stats = IndexSync(db_manager, concurrency=4, batch_size=2).sync(progress=lambda done, total: progress.append(done))
+
+    assert stats == (5, 5, 0, 5)
+    assert progress == [1, 2, 3, 4, 5]
+    latest = db_manager.fetch_latest_air_quality_indices()
+    assert [row[1] for row in latest] == [1, 2, 3, 4, 5]
+    assert latest[0][2:] == ('2024-01-03 23:20:00', 1, 'Dobry', '2024-01-03 23:00:00')
+
+
+def test_sync_deduplicates_on_calculation_date(stub_api, db_manager):
+    """
+    Test that an index that has not been recalculated is not stored again, and a recalculated one is.
+    """
+    sync = IndexSync(db_manager, concurrency=4)
+    sync.sync()
+
+    assert sync.sync().inserted == 0
+    stub_api.index_date = '2024-01-04 00:20:00'
+    assert sync.sync([1, 2]).inserted == 2
+    assert len(db_manager.fetch_air_quality_index(1)) == 2
+    assert db_manager.fetch_latest_air_quality_indices()[0][2] == '2024-01-04 00:20:00'
+
+
+def test_sync_reports_failures(stub_api, db_manager):
+    """
+    Test that a station whose index cannot be fetched is counted as failed without stopping the others.
+    """
+    stats = IndexSync(db_manager, concurrency=4).sync([1, 2, 999])
+
+    assert stats == (3, 2, 1, 2)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import matplotlib.dates as md
+from prod_aplikacja.live_chart import LiveChart
+from test_aplikacja.conftest import START, hourly_dates
+
+@pytest.fixture
+def chart():
+    """Fixture providing an off-screen chart showing 100 hourly readings."""
+    chart = LiveChart()
+    chart.set_data(hourly_dates(100), np.linspace(10.0, 50.0, 100))
+    return chart
+
+
+def test_set_data_draws_whole_chart(chart):
+    """
+    Test that replacing the series redraws the figure once and shows every reading.
+    """
+    assert chart.full_draws == 1
+    assert len(chart.line.get_xdata()) == 100
+    assert chart.ax.get_xlim()[0] == md.date2num(START)
+
+
+def test_append_within_limits_blits(chart):
+    """
+    Test that a new reading inside the current limits only redraws the line.
+    """
+    chart.append(hourly_dates(1, 100), [30.0])
+
+    assert chart.full_draws == 1
+    assert chart.blits == 1
+    assert chart.line.get_ydata()[-1] == 30.0
+
+
+def test_append_outside_limits_redraws(chart):
+    """
+    Test that readings leaving the limits extend them with headroom and redraw the figure.
+    """
+    chart.append(hourly_dates(2, 200), [80.0, None])
+
+    assert chart.full_draws == 2
+    assert chart.blits == 0
+    assert chart.ax.get_xlim()[1] > md.date2num(hourly_dates(1, 201)[0])
+    assert chart.ax.get_ylim()[1] > 80.0
+    assert len(chart.line.get_xdata()) == 101
+
+
+def test_unknown_values_are_ignored(chart):
+    """
+    Test that readings without a value change nothing.
+    """
+    chart.append(hourly_dates(3, 100), [np.nan, np.nan, np.nan])
+
+    assert chart.full_draws == 1 and chart.blits == 0
+    assert len(chart.line.get_xdata()) == 100
+
+
+def test_long_series_downsampled():
+    """
+    Test that a long series is drawn with about one point per pixel of the axes by default,
+    and with its extremes kept by the 'minmax' method.
+    """
+    values = np.random.default_rng(0).normal(40, 5, 50000)
+    chart = LiveChart(size=(4, 3), dpi=100)
+    extremes = LiveChart(size=(4, 3), dpi=100, method='minmax')
+    chart.set_data(hourly_dates(50000), values)
+    extremes.set_data(hourly_dates(50000), values)
+
+    assert len(chart.line.get_xdata()) <= 400
+    assert len(extremes.line.get_xdata()) <= 4 * 400
+    assert extremes.line.get_ydata().max() == values.max()
+
+
+def test_append_to_empty_drawn_chart():
+    """
+    Test that readings appended to a drawn chart without any reading redraw the whole chart.
+    """
+    chart = LiveChart()
+    chart.set_data(hourly_dates(2), [np.nan, np.nan])
+    assert chart.full_draws == 1 and len(chart.line.get_xdata()) == 0
+
+    chart.append([np.datetime64('1970-01-01T12:00:00')], [0.5])
+
+    assert chart.full_draws == 2
+    assert chart.blits == 0
+    assert list(chart.line.get_ydata()) == [0.5]
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+import pytest
+from prod_aplikacja.data_fetcher import TransientFetchError
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.measurement_sync import IncrementalSync
+
+pytestmark = pytest.mark.stub_api(stations=2, sensors_per_station=3)
+
+# The stub serves hourly readings starting on 2024-01-01 00:00, 72 of them by default.
+LAST_READING = datetime(2024, 1, 3, 23, 0)
+
+
+@pytest.fixture
+def db_manager(stub_api):
+    """Fixture providing an in-memory database that knows the sensors of the stub."""
+    db_manager = DatabaseManager(':memory:')
+    for sensors in stub_api.sensors.values():
+        db_manager.insert_sensors(sensors)
+    return db_manager
+
+
+def make_sync(db_manager, now):
+    """Creates an IncrementalSync with a fixed current time."""
+    return IncrementalSync(db_manager, concurrency=4, batch_size=2, now=lambda: now)
+
+
+def test_first_sync_stores_everything(stub_api, db_manager):
+    """
+    Test that sensors without stored readings get their whole window downloaded.
+    """
+    stats = make_sync(db_manager, LAST_READING + timedelta(minutes=30)).sync()
+
+    assert stats.sensors == 6
+    assert stats.skipped == 0
+    assert stats.fetched == 6
+    assert stats.inserted == 6 * 72
+    assert len(db_manager.fetch_measurements(101)) == 72
+
+
+def test_current_sensors_are_skipped(stub_api, db_manager):
+    """
+    Test that no request is sent for sensors whose newest reading is younger than max_age.
+    """
+    make_sync(db_manager, LAST_READING + timedelta(minutes=30)).sync()
+    requests_before = stub_api.requests
+
+    stats = make_sync(db_manager, LAST_READING + timedelta(minutes=50)).sync()
+
+    assert stats.skipped == 6
+    assert stats.inserted == 0
+    assert stub_api.requests == requests_before
+
+
+def test_only_new_readings_are_inserted(stub_api, db_manager, mocker):
+    """
+    Test that after new readings appear only the rows newer than the watermark are written.
+    """
+    make_sync(db_manager, LAST_READING + timedelta(minutes=30)).sync()
+    stub_api.values_per_sensor = 75
+    insert_measurements = mocker.spy(db_manager, 'insert_measurements')
+
+    stats = make_sync(db_manager, LAST_READING + timedelta(hours=3, minutes=30)).sync([100, 101])
+
+    assert stats.sensors == 2
+    assert stats.fetched == 2
+    assert stats.inserted == 2 * 3
+    assert all(len(call.args[0]['values']) == 3 for call in insert_measurements.call_args_list)
+    assert len(db_manager.fetch_measurements(101)) == 75
+    assert len(db_manager.fetch_measurements(102)) == 72
+
+
+def test_failed_requests_are_counted(stub_api, db_manager):
+    """
+    Test that a failing sensor does not stop the sync of the others and that its typed error is kept.
+    """
+    stub_api.status_overrides['/pjp-api/rest/data/getData/201'] = 503
+
+    stats = make_sync(db_manager, LAST_READING).sync()
+
+    assert stats.failed == 1
+    assert stats.fetched == 5
+    assert isinstance(stats.error, TransientFetchError)
+    assert stats.error.status_code == 503
+    assert db_manager.fetch_measurements(201) == []
+
+
+def test_new_readings_skip_unknown_values():
+    """
+    Test that readings without a value are not stored, so they do not move the watermark.
+    """
+    measurements = {'values': [
+        {'date': '2024-01-01 03:00:00', 'value': None},
+        {'date': '2024-01-01 02:00:00', 'value': 12.0},
+        {'date': '2024-01-01 01:00:00', 'value': 11.0},
+    ]}
+
+    readings = IncrementalSync.new_readings(measurements, datetime(2024, 1, 1, 1, 0))
+
+    assert readings == [{'date': '2024-01-01 02:00:00', 'value': 12.0}]
@@ -0,0 +1,124 @@
+import pytest
+from prod_aplikacja import metrics
+from prod_aplikacja.collector import main
+from prod_aplikacja.data_analyzer import Analyze_Data
+from prod_aplikacja.data_fetcher import fetch_station, set_cache
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.http_cache import ResponseCache
+from test_aplikacja.stub_server import StubApi
+
+
+@pytest.fixture
+def recording():
+    """Fixture that records metrics during the test and restores the default state afterwards."""
+    enabled = metrics.is_enabled()
+    metrics.reset()
+    metrics.enable()
+    yield
+    if not enabled:
+        metrics.disable()
+    metrics.reset()
+
+
+def test_nothing_recorded_when_disabled():
+    """
+    Test that instrumented functions work unchanged and record nothing while metrics are off.
+    """
+    enabled = metrics.is_enabled()
+    metrics.disable()
+    metrics.reset()
+    try:
+        double = metrics.timed('test.double')(lambda x: 2 * x)
+        assert double(21) == 42
+        metrics.count('test.counter')
+        with metrics.timer('test.block'):
+            pass
+        assert metrics.stats()['timings'] == {} and metrics.stats()['counters'] == {}
+    finally:
+        if enabled:
+            metrics.enable()
+
+
+def test_database_and_analysis_timed(recording):
+    """
+    Test that the database queries and the analysis are timed and the rows read and written are counted.
+    """
+    db_manager = DatabaseManager(':memory:')
+    db_manager.insert_measurements({'values': [{'date': f'2024-01-01 {hour:02d}:00:00', 'value': float(hour)}
+                                               for hour in range(10)]}, 101)
+    Analyze_Data(db_manager.fetch_measurements(101)).summary()
+
+    stats = metrics.stats()
+    assert stats['timings']['db.insert_measurements']['calls'] == 1
+    assert stats['timings']['db.fetch_measurements']['calls'] == 1
+    assert stats['timings']['analysis.dataframe']['calls'] == 1
+    assert stats['timings']['analysis.summarize']['total_seconds'] > 0
+    assert stats['counters']['db.rows_written'] == 10
+    assert stats['counters']['db.rows_read'] == 10
+
+
+def test_http_requests_bytes_and_cache_hit_rate(recording):
+    """
+    Test that requests, received bytes and the outcomes of the response cache are counted.
+    """
+    cache = ResponseCache(':memory:', ttls={'stations': 3600})
+    set_cache(cache)
+    try:
+        with StubApi(stations=3) as stub, stub.patch_fetcher():
+            for _ in range(4):
+                fetch_station()
+    finally:
+        set_cache(None)
+        cache.close()
+
+    stats = metrics.stats()
+    assert stats['counters']['http.requests'] == 1
+    assert stats['counters']['http.bytes_received'] > 0
+    assert stats['timings']['http.stations']['calls'] == 1
+    assert stats['caches']['http_cache'] == {'hits': 3, 'revalidations': 0, 'misses': 1, 'hit_rate': 0.75}
+
+
+def test_prometheus_text(recording):
+    """
+    Test the Prometheus text format of timings, counters and hit rates.
+    """
+    metrics.observe('db.fetch_measurements', 0.25)
+    metrics.observe('db.fetch_measurements', 0.5)
+    metrics.count('db.rows_read', 7)
+    metrics.count('http.cache.hits', 1)
+    metrics.count('http.cache.misses', 1)
+
+    lines = metrics.prometheus_text().splitlines()
+
+    assert 'aq_operation_seconds_count{operation="db.fetch_measurements"} 2' in lines
+    assert 'aq_operation_seconds_sum{operation="db.fetch_measurements"} 0.750000000' in lines
+    assert '# TYPE aq_db_rows_read_total counter' in lines
+    assert 'aq_db_rows_read_total 7' in lines
+    assert 'aq_http_cache_hit_ratio 0.500000' in lines
+
+
+def test_profiling():
+    """
+    Test that the profiler reports the functions called while it runs.
+    """
+    metrics.start_profiling()
+    assert metrics.is_profiling()
+    sorted(range(1000), key=lambda n: -n)
+    report = metrics.stop_profiling()
+
+    assert not metrics.is_profiling()
+    assert 'sorted' in report
+    assert metrics.stop_profiling() is None
+
+
+def test_collector_writes_metrics(tmp_path, recording):
+    """
+    Test that the collector writes the metrics file after every cycle when asked to.
+    """
+    path = tmp_path / 'collector.prom'
+    with StubApi(stations=1, sensors_per_station=1) as stub, stub.patch_fetcher():
+        main(['--db', str(tmp_path / 'collector.db'), '--interval', '0', '--cycles', '1', '--metrics', str(path)])
+
+    text = path.read_text()
+    assert 'aq_operation_seconds_count{operation="collector.cycle"} 1' in text
+    assert 'aq_db_rows_written_total 72' in text
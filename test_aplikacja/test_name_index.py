@@ -0,0 +1,106 @@
+import pytest
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.name_index import NameIndex
+
+
+def sensor(sensor_id, station_id, param_name):
+    """Builds a sensor dictionary as returned by the API."""
+    return {'id': sensor_id, 'stationId': station_id,
+            'param': {'paramName': param_name, 'paramFormula': param_name, 'paramCode': param_name, 'idParam': 1}}
+
+
+@pytest.fixture
+def db_manager():
+    """
+    Fixture providing an in-memory database with stations sharing a name and sensors sharing a parameter name.
+    """
+    db_manager = DatabaseManager(':memory:')
+    db_manager.insert_stations([
+        (1, 'Kraków', 50.0, 19.9, 1, ''),
+        (2, 'Warszawa', 52.2, 21.0, 2, ''),
+        (3, 'Kraków', 50.1, 20.0, 1, ''),
+    ])
+    db_manager.insert_sensors([sensor(101, 1, 'PM10'), sensor(102, 1, 'PM10'), sensor(103, 1, 'NO2'),
+                               sensor(201, 2, 'PM10')])
+    return db_manager
+
+
+@pytest.fixture
+def names(db_manager):
+    """Fixture providing a name index over the database."""
+    return NameIndex(db_manager)
+
+
+def test_station_labels_disambiguate_duplicates(names):
+    """
+    Test that stations sharing a name get labels with their IDs, so that each label resolves to one station.
+    """
+    assert names.station_labels() == ['Kraków (1)', 'Kraków (3)', 'Warszawa']
+    assert names.station_id('Kraków (3)') == 3
+    assert names.station_id('Warszawa') == 2
+    assert names.station_id('Kraków') is None
+
+
+def test_sensor_labels_per_station(names):
+    """
+    Test that sensors are resolved within their station, whatever parameters other stations have.
+    """
+    assert names.sensor_labels(1) == ['NO2', 'PM10 (101)', 'PM10 (102)']
+    assert names.sensor_id(1, 'PM10 (102)') == 102
+    assert names.sensor_id(2, 'PM10') == 201
+    assert names.sensor_id(None, 'PM10') is None
+
+
+def test_lookups_are_cached(names, db_manager, mocker):
+    """
+    Test that repeated lookups do not query the database again.
+    """
+    names.station_id('Warszawa')
+    names.sensor_id(2, 'PM10')
+    fetch_stations = mocker.spy(db_manager, 'fetch_stations')
+    fetch_sensors = mocker.spy(db_manager, 'fetch_sensors')
+
+    for _ in range(100):
+        assert names.station_id('Warszawa') == 2
+        assert names.sensor_id(2, 'PM10') == 201
+
+    assert fetch_stations.call_count == 0
+    assert fetch_sensors.call_count == 0
+
+
+def test_insert_invalidates_index(names, db_manager):
+    """
+    Test that committed inserts drop the cached names, so new stations and sensors can be resolved.
+    """
+    assert names.station_id('Gdańsk') is None
+    assert names.sensor_id(2, 'NO2') is None
+
+    with db_manager.bulk():
+        db_manager.insert_station((4, 'Gdańsk', 54.3, 18.6, 3, ''))
+        db_manager.insert_sensors([sensor(202, 2, 'NO2'), sensor(202, 2, 'NO2')])
+
+    assert names.station_id('Gdańsk') == 4
+    assert names.sensor_id(2, 'NO2') == 202
+
+
+def test_measurement_commit_keeps_index(names, db_manager, mocker):
+    """
+    Test that committing measurements, also while the index is being built, does not drop the cached names.
+    """
+    fetch_stations = db_manager.fetch_stations
+
+    def fetch_during_sync():
+        stations = fetch_stations()
+        db_manager.insert_measurements({'values': [{'date': '2024-01-01 00:00:00', 'value': 1.0}]}, 201)
+        return stations
+
+    mocker.patch.object(db_manager, 'fetch_stations', side_effect=fetch_during_sync)
+    assert names.station_id('Warszawa') == 2
+    names.sensor_id(2, 'PM10')
+    fetch_sensors = mocker.spy(db_manager, 'fetch_sensors')
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 01:00:00', 'value': 2.0}]}, 201)
+
+    assert names.station_id('Warszawa') == 2
+    assert names.sensor_id(2, 'PM10') == 201
+    assert db_manager.fetch_stations.call_count == 1
+    assert fetch_sensors.call_count == 0
@@ -0,0 +1,156 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+import pytest
+from prod_aplikacja.data_analyzer import Analyze_Data
+from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.database_manager import DatabaseManager, SCHEMA_VERSION
+from prod_aplikacja.rollups import bucket, next_bucket, choose_resolution, to_epoch, from_epoch
+from test_aplikacja.conftest import hourly_readings
+
+
+def raw_rollup(db_manager, sensor_id, length):
+    """Computes the buckets of a sensor from the raw measurements, grouping on a date prefix."""
+    return db_manager.conn.execute('''
+    SELECT substr(datetime(ts, 'unixepoch'), 1, ?), COUNT(value), SUM(value), MIN(value), MAX(value)
+    FROM measurements WHERE sensorId=? AND value IS NOT NULL GROUP BY 1 ORDER BY 1
+    ''', (length, sensor_id)).fetchall()
+
+
+@pytest.fixture
+def db_manager():
+    """Fixture providing an in-memory database."""
+    return DatabaseManager(':memory:')
+
+
+def test_bucket_boundaries():
+    """
+    Test that dates are assigned to the buckets starting before them, also across the end of a year.
+    """
+    assert bucket('2024-12-31 23:59:59', 'hour') == '2024-12-31 23:00:00'
+    assert bucket('2024-12-31 23:59:59', 'day') == '2024-12-31 00:00:00'
+    assert bucket('2024-12-31 23:59:59', 'month') == '2024-12-01 00:00:00'
+    assert next_bucket('2024-12-31 23:00:00', 'hour') == '2025-01-01 00:00:00'
+    assert next_bucket('2024-02-28 00:00:00', 'day') == '2024-02-29 00:00:00'
+    assert next_bucket('2024-12-01 00:00:00', 'month') == '2025-01-01 00:00:00'
+
+
+def test_epoch_round_trip():
+    """
+    Test that dates are stored as seconds since the epoch and converted back to the same strings.
+    """
+    assert to_epoch('1970-01-02 00:00:00') == 86400
+    assert to_epoch(datetime(2024, 1, 1)) == to_epoch('2024-01-01') == 1704067200
+    assert to_epoch(1704067200) == 1704067200
+    assert to_epoch(None) is None
+    assert from_epoch(to_epoch('2024-02-29 23:59:59')) == '2024-02-29 23:59:59'
+
+
+def test_aware_dates_converted_to_utc():
+    """
+    Test that dates with a time zone are converted to UTC instead of dropping their offset.
+    """
+    aware = datetime(2024, 1, 1, 2, tzinfo=timezone(timedelta(hours=2)))
+
+    assert to_epoch(aware) == to_epoch('2024-01-01 00:00:00')
+    assert to_epoch('2024-01-01 02:00:00+02:00') == to_epoch(datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+
+def test_incremental_inserts_keep_rollups_exact(db_manager):
+    """
+    Test that after overlapping inserts, replaced values and unknown values every rollup equals
+    the aggregation of the raw measurements.
+    """
+    start = datetime(2024, 1, 30, 12)
+    db_manager.insert_measurements(hourly_readings(60, start=start), 101)
+    db_manager.insert_measurements(hourly_readings(30, 50, value=lambda hour: 100.0 + hour - 50, start=start), 101)
+    db_manager.insert_measurements(hourly_readings(5, 90, value=lambda hour: None, start=start), 101)
+    db_manager.insert_measurements(hourly_readings(10, value=lambda hour: -1.0, start=start), 102)
+
+    for resolution, length in (('hour', 13), ('day', 10), ('month', 7)):
+        rows = [(date[:length], count, total, low, high)
+                for date, count, total, low, high in db_manager.fetch_rollups(101, resolution)]
+        assert rows == raw_rollup(db_manager, 101, length)
+    assert [row[:2] for row in db_manager.fetch_rollups(101, 'month')] == [('2024-01-01 00:00:00', 36),
+                                                                          ('2024-02-01 00:00:00', 44)]
+    assert db_manager.fetch_rollups(102, 'day') == [('2024-01-30 00:00:00', 10, -10.0, -1.0, -1.0)]
+
+
+def test_insert_recomputes_only_touched_buckets(db_manager):
+    """
+    Test that an insert reads the raw measurements of its own hours only.
+    """
+    db_manager.insert_measurements(hourly_readings(24 * 60), 101)
+    statements = []
+    db_manager.conn.set_trace_callback(statements.append)
+    db_manager.insert_measurements(hourly_readings(2, start=datetime(2024, 3, 1, 5)), 101)
+    db_manager.conn.set_trace_callback(None)
+
+    hourly = [statement for statement in statements if 'INTO rollup_hourly' in statement]
+    assert len(hourly) == 1
+    assert f"ts >= {to_epoch('2024-03-01 05:00:00')} AND ts < {to_epoch('2024-03-01 07:00:00')}" in hourly[0]
+    assert db_manager.fetch_rollups(101, 'day', start='2024-03-01') == [('2024-03-01 00:00:00', 2, 1.0, 0.0, 1.0)]
+
+
+def test_migration_fills_rollups(tmp_path):
+    """
+    Test that opening a database created before the rollups existed computes them from its measurements.
+    """
+    db_path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE measurements (id INTEGER PRIMARY KEY, sensorId INTEGER, date TEXT, value REAL)')
+    conn.execute('CREATE UNIQUE INDEX idx_measurements_sensor_date ON measurements (sensorId, date)')
+    conn.executemany('INSERT INTO measurements (sensorId, date, value) VALUES (?, ?, ?)',
+                     [(101, row['date'], row['value']) for row in hourly_readings(48)['values']])
+    conn.execute('PRAGMA user_version = 2')
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_path)
+
+    assert db_manager.schema_version() == SCHEMA_VERSION
+    assert db_manager.fetch_rollups(101, 'day') == [('2024-01-01 00:00:00', 24, 276.0, 0.0, 23.0),
+                                                    ('2024-01-02 00:00:00', 24, 276.0, 0.0, 23.0)]
+    db_manager.close_connection()
+
+
+def test_choose_resolution():
+    """
+    Test that the finest resolution with at most max_points buckets is chosen.
+    """
+    assert choose_resolution('2024-01-01 00:00:00', '2024-01-03 23:00:00', 100) == 'hour'
+    assert choose_resolution('2024-01-01 00:00:00', '2024-12-31 23:00:00', 1000) == 'day'
+    assert choose_resolution('2020-01-01 00:00:00', '2024-12-31 23:00:00', 1000) == 'month'
+    assert choose_resolution('2000-01-01 00:00:00', '2024-12-31 23:00:00', 10) == 'month'
+
+
+def test_series_at_fitting_resolution(db_manager):
+    """
+    Test that the analyzer and the visualizer read bucket means at a resolution fitting the range.
+    """
+    db_manager.insert_measurements(hourly_readings(24 * 90), 101)
+
+    analyzer = Analyze_Data.from_database(db_manager, 101, max_points=100)
+    visualizer = Visualize_data.from_database(db_manager, 101, start=datetime(2024, 1, 1), end='2024-01-02')
+
+    assert analyzer.resolution == 'day'
+    assert analyzer.summary()['count'] == 90
+    assert analyzer.summary()['mean'] == pytest.approx(11.5)
+    assert visualizer.resolution == 'hour'
+    assert list(visualizer.data['value']) == [float(hour) for hour in range(24)]
+    assert Analyze_Data.from_database(db_manager, 999).summary()['count'] == 0
+
+
+def test_fetch_series_as_arrays(db_manager):
+    """
+    Test that the series is returned as datetime64 and float arrays equal to the rows.
+    """
+    db_manager.insert_measurements(hourly_readings(72), 101)
+
+    resolution, rows = db_manager.fetch_series(101, start='2024-01-02', max_points=10)
+    _, series = db_manager.fetch_series(101, start='2024-01-02', max_points=10, as_arrays=True)
+
+    assert resolution == 'day'
+    assert series['date'].dtype == 'datetime64[s]'
+    assert [str(date).replace('T', ' ') for date in series['date']] == [row[2] for row in rows]
+    assert list(series['value']) == [row[3] for row in rows] == [11.5, 11.5]
+    assert len(db_manager.fetch_series(999, as_arrays=True)[1]['date']) == 0
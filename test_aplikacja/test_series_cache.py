@@ -0,0 +1,133 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from prod_aplikacja import metrics
+from prod_aplikacja.data_analyzer import Analyze_Data
+from prod_aplikacja.data_visualizer import Visualize_data
+from prod_aplikacja.database_manager import DatabaseManager
+from prod_aplikacja.series_cache import SeriesCache
+from test_aplikacja.conftest import hourly_readings
+
+
+@pytest.fixture
+def db_manager():
+    """Fixture providing an in-memory database with two sensors."""
+    db_manager = DatabaseManager(':memory:')
+    db_manager.insert_measurements(hourly_readings(48, value=float), 1)
+    db_manager.insert_measurements(hourly_readings(24, value=lambda hour: 100.0 + hour), 2)
+    return db_manager
+
+
+def test_hit_append_and_reload(db_manager):
+    """
+    Test that a cached series is served from memory, that newer readings are appended to it and that
+    a write to the cached range makes it read again.
+    """
+    cache = SeriesCache(db_manager)
+    dates, values = cache.readings(1)
+    assert len(dates) == 48 and values[-1] == 47.0
+    assert cache.readings(1)[0] is not dates and np.shares_memory(cache.readings(1)[0], dates)
+
+    db_manager.insert_measurements(hourly_readings(2, 48, value=float), 1)
+    dates, values = cache.readings(1)
+    assert len(dates) == 50 and values[-1] == 49.0
+    assert str(dates[-1]) == '2024-01-03T01:00:00'
+
+    db_manager.insert_measurements({'values': [{'date': '2024-01-01 05:00:00', 'value': -1.0}]}, 1)
+    dates, values = cache.readings(1)
+    assert len(dates) == 50 and values[5] == -1.0
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['appends'], stats['misses']) == (2, 1, 2)
+    assert stats['series'] == 1 and stats['size'] >= dates.nbytes + values.nbytes
+
+
+def test_unknown_values_skipped_and_ranges_are_views(db_manager):
+    """
+    Test that readings without a value are not cached and that ranges are views of the cached arrays.
+    """
+    db_manager.insert_measurements({'values': [{'date': '2024-01-03 00:00:00', 'value': None}]}, 1)
+    cache = SeriesCache(db_manager)
+    dates, values = cache.readings(1)
+    assert len(dates) == 48 and not np.isnan(values).any()
+
+    day, day_values = cache.series(1, start='2024-01-02 00:00:00', end=datetime(2024, 1, 2, 6))
+    assert list(day_values) == [24.0, 25.0, 26.0, 27.0, 28.0, 29.0]
+    assert np.shares_memory(day, dates) and np.shares_memory(day_values, values)
+    assert not day_values.flags.writeable
+    with pytest.raises(ValueError):
+        day_values[0] = 0.0
+
+
+def test_least_recently_used_evicted(db_manager):
+    """
+    Test that the least recently used series is evicted when the cache exceeds its size, and that
+    a series larger than the whole cache is served without being kept.
+    """
+    one_day = 24 * 16
+    cache = SeriesCache(db_manager, max_bytes=one_day * 2)
+    db_manager.insert_measurements(hourly_readings(24, value=float), 3)
+    db_manager.insert_measurements(hourly_readings(24, value=lambda hour: 0.0), 4)
+    cache.readings(2)
+    cache.readings(3)
+    cache.readings(2)
+    cache.readings(4)
+    stats = cache.stats()
+    assert (stats['series'], stats['evictions'], stats['size']) == (2, 1, one_day * 2)
+    cache.readings(2)
+    cache.readings(3)
+    assert (cache.stats()['hits'], cache.stats()['misses'], cache.stats()['evictions']) == (2, 4, 2)
+
+    dates, values = cache.readings(1)
+    assert len(dates) == 48
+    db_manager.insert_measurements(hourly_readings(72, value=float), 5)
+    assert len(cache.readings(5)[0]) == 72
+    assert cache.stats()['series'] == 1 and cache.stats()['size'] == one_day * 2
+
+    cache.invalidate()
+    assert cache.stats()['series'] == 0 and cache.stats()['size'] == 0
+
+
+def test_fetch_series_matches_database(db_manager):
+    """
+    Test that the series served from the cache equal those read from the rollups, and that the analyzer and
+    the visualizer use the cached arrays without copying them.
+    """
+    cache = SeriesCache(db_manager)
+    resolution, series = cache.fetch_series(1)
+    expected_resolution, expected = db_manager.fetch_series(1, as_arrays=True)
+    assert resolution == expected_resolution == 'hour'
+    assert np.array_equal(series['date'], expected['date']) and np.array_equal(series['value'], expected['value'])
+
+    resolution, series = cache.fetch_series(1, max_points=10)
+    assert resolution == 'day' and list(series['value']) == [11.5, 35.5]
+
+    cached_dates, cached_values = cache.readings(2)
+    analyzer = Analyze_Data.from_database(db_manager, 2, cache=cache)
+    assert analyzer.resolution == 'hour' and analyzer.summary()['count'] == 24
+    assert np.shares_memory(analyzer._values, cached_values)
+    visualizer = Visualize_data.from_database(db_manager, 2, cache=cache)
+    assert np.shares_memory(visualizer.data['value'].to_numpy(), cached_values)
+
+
+def test_metrics_hit_rate(db_manager):
+    """
+    Test that the lookups are reported with the other caches by metrics.stats().
+    """
+    enabled = metrics.is_enabled()
+    metrics.reset()
+    metrics.enable()
+    try:
+        cache = SeriesCache(db_manager)
+        cache.readings(1)
+        cache.readings(1)
+        db_manager.insert_measurements(hourly_readings(1, 48, value=float), 1)
+        cache.readings(1)
+        outcome = metrics.stats()['caches']['series_cache']
+        assert (outcome['hits'], outcome['revalidations'], outcome['misses']) == (1, 1, 1)
+        assert outcome['hit_rate'] == pytest.approx(2 / 3)
+        assert metrics.stats()['timings']['series_cache.read']['calls'] == 2
+    finally:
+        if not enabled:
+            metrics.disable()
+        metrics.reset()
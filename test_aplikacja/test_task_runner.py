@@ -0,0 +1,162 @@
+import threading
+import time
+import pytest
+from prod_aplikacja.task_runner import BackgroundTaskRunner, TaskCancelled
+
+
+class FakeRoot:
+    """
+    Stands in for the Tk root window, running the callbacks scheduled with 'after' when pumped.
+    """
+    def __init__(self):
+        self.scheduled = []
+        self.reported = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+        return len(self.scheduled)
+
+    def after_cancel(self, after_id):
+        pass
+
+    def report_callback_exception(self, exc_type, exc_value, traceback):
+        self.reported.append(exc_value)
+
+    def pump(self, condition, timeout=5.0):
+        """
+        Runs the scheduled callbacks like the Tk main loop would, until the condition is met.
+        """
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "condition not met in time"
+            callbacks, self.scheduled = self.scheduled, []
+            for callback in callbacks:
+                callback()
+            time.sleep(0.001)
+
+
+@pytest.fixture
+def root():
+    """Fixture providing a fake Tk root window."""
+    return FakeRoot()
+
+
+@pytest.fixture
+def runner(root):
+    """Fixture providing a task runner polled by the fake root window."""
+    runner = BackgroundTaskRunner(root, max_workers=2)
+    yield runner
+    runner.shutdown()
+
+
+def test_success_delivered_on_main_loop(root, runner):
+    """
+    Test that the result of a task is passed to on_success by the thread polling the queue, not the worker.
+    """
+    main_thread = threading.current_thread()
+    results = []
+
+    def work(task, a, b):
+        assert threading.current_thread() is not main_thread
+        return a + b
+
+    runner.submit(work, 2, 3, on_success=lambda result: results.append((result, threading.current_thread())))
+    root.pump(lambda: results)
+
+    assert results == [(5, main_thread)]
+    assert runner.active_tasks == []
+
+
+def test_error_delivered(root, runner):
+    """
+    Test that an exception raised by a task is passed to on_error.
+    """
+    errors = []
+
+    def work(task):
+        raise ValueError("boom")
+
+    runner.submit(work, on_error=errors.append)
+    root.pump(lambda: errors)
+
+    assert isinstance(errors[0], ValueError)
+
+
+def test_failing_callback_does_not_stop_polling(root, runner):
+    """
+    Test that an exception raised by a callback is reported and that later results are still delivered.
+    """
+    results = []
+
+    def fail(result):
+        raise RuntimeError("callback failed")
+
+    runner.submit(lambda task: 1, on_success=fail)
+    root.pump(lambda: root.reported)
+    runner.submit(lambda task: 2, on_success=results.append)
+    root.pump(lambda: results)
+
+    assert isinstance(root.reported[0], RuntimeError)
+    assert results == [2]
+    assert runner.active_tasks == []
+
+
+def test_progress_and_cancel(root, runner):
+    """
+    Test that progress reports reach on_progress and that a cancelled task stops at its next report.
+    """
+    progress = []
+    cancelled = []
+    started = threading.Event()
+
+    def work(task):
+        for step in range(1000):
+            task.report(step, 1000, f"step {step}")
+            started.set()
+            time.sleep(0.001)
+        return "finished"
+
+    task = runner.submit(work, on_success=pytest.fail, on_progress=lambda task, *report: progress.append(report),
+                         on_cancel=cancelled.append)
+    started.wait(5)
+    root.pump(lambda: progress)
+    task.cancel()
+    root.pump(lambda: cancelled)
+
+    assert cancelled == [task]
+    assert progress[0] == (0, 1000, "step 0")
+    assert len(progress) < 1000
+
+
+def test_check_raises_when_cancelled(runner):
+    """
+    Test that check() raises TaskCancelled once the task has been cancelled.
+    """
+    release = threading.Event()
+    task = runner.submit(lambda task: release.wait(5))
+    task.cancel()
+    release.set()
+
+    with pytest.raises(TaskCancelled):
+        task.check()
+
+
+def test_poll_respects_time_budget(root):
+    """
+    Test that one poll stops running callbacks when its time budget is used up,
+    leaving the rest of the queue for the next poll.
+    """
+    runner = BackgroundTaskRunner(root, max_workers=1, time_budget_ms=5)
+    calls = []
+    release = threading.Event()
+    task = runner.submit(lambda task: release.wait(5),
+                         on_progress=lambda task, *report: (calls.append(report), time.sleep(0.002)))
+    for step in range(20):
+        runner._post(task, 'progress', (step, 20, ''))
+
+    runner.poll()
+    assert 0 < len(calls) < 20
+
+    root.pump(lambda: len(calls) == 20)
+    release.set()
+    runner.shutdown()